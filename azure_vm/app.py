@@ -1,81 +1,154 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
+import json
 import pickle
-import numpy as np
-import math
-import requests
 import os
+import threading
 import time
+from collections import namedtuple
 from dotenv import load_dotenv
+import metrics
+from cascade import MALICIOUS, SAFE, UNCERTAIN, Cascade, TokenBucket
+from feedback_log import FeedbackLog
+from host_reputation import ALLOW, DENY, HostReputation
+from model_registry import ModelRegistry, ShadowScorer, CURRENT, CANDIDATE
+from tree_model import TreeEnsemble
+from url_features import schema_for_model
+from verdict_cache import VerdictCache, normalize_url
+from verdict_store import SingleFlight, VerdictStore
+from vt_jobs import JobQueueFull, VirusTotalJobs
 
 load_dotenv("key.env")
 
 
-# Define the FeatureExtractor class
-class FeatureExtractor:
-    def __init__(self, url=""):
-        self.url = self._preprocess_url(url)
-        self.domain = self.url.split('/')[0]
-
-    def _preprocess_url(self, url):
-        # Remove http, https, and www.
-        url = url.replace("http://", "").replace("https://", "").replace("www.", "")
-        return url.strip('/')
-
-    def url_entropy(self):
-        url_trimmed = self.url.strip()
-        entropy_distribution = [float(url_trimmed.count(c)) / len(url_trimmed) for c in dict.fromkeys(list(url_trimmed))]
-        return -sum([e * math.log(e, 2) for e in entropy_distribution if e > 0])
-
-    def digits_num(self):
-        return len([i for i in self.url if i.isdigit()])
-
-    def length(self):
-        return len(self.url)
-
-    def params_num(self):
-        return len(self.url.split('&')) - 1
-
-    def fragments_num(self):
-        return len(self.url.split('#')) - 1
-
-    def subdomain_num(self):
-        return len(self.domain.split('.')) - 1
-
-    def has_http(self):
-        return 'http' in self.url
-
-    def has_https(self):
-        return 'https' in self.url
-
-    def is_ip(self):
-        parts = self.domain.split('.')
-        if len(parts) == 4 and all(part.isdigit() and 0 <= int(part) <= 255 for part in parts):
-            return True
-        return False
-
-    def run(self):
-        return {
-            "url_entropy": self.url_entropy(),
-            "digits_num": self.digits_num(),
-            "length": self.length(),
-            "params_num": self.params_num(),
-            "fragments_num": self.fragments_num(),
-            "subdomain_num": self.subdomain_num(),
-            "has_http": int(self.has_http()),
-            "has_https": int(self.has_https()),
-            "is_ip": int(self.is_ip()),
-        }
+# Model file to serve when no registry is configured, preferring the exported
+# tree arrays (scored with NumPy alone) over the pickled XGBClassifier
+MODEL_PATH = os.getenv("MODEL_PATH") or (
+    "xgboost_model.npz" if os.path.exists("xgboost_model.npz") else "xgboost_model.pkl"
+)
+
+# Versioned model registry directory (see model_registry.py). When set, the
+# CURRENT version is served and the CANDIDATE version, if any, is scored in shadow.
+MODEL_REGISTRY = os.getenv("MODEL_REGISTRY")
+
+# Seconds between checks for a retrained model (0 disables hot-swapping)
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", "30"))
+
+# Probability at or above which a URL is flagged, for models without
+# registry metadata
+DEFAULT_THRESHOLD = 0.4
+
+def load_model(path):
+    if path.endswith(".npz"):
+        return TreeEnsemble(path)
+    with open(path, "rb") as model_file:
+        return pickle.load(model_file)
+
+def model_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+# The served model is swapped as a whole. Its generation is bumped on every
+# swap and is part of the ML cache key, so scores from an older model are not
+# reused; its schema is the feature schema it was trained on (url_features.py).
+ServingModel = namedtuple("ServingModel", ["model", "generation", "version", "threshold", "metadata", "schema"])
+
+model_registry = ModelRegistry(MODEL_REGISTRY) if MODEL_REGISTRY else None
+active_model = None
+shadow_scorer = None
+loaded_model_signature = None
+model_lock = threading.Lock()
+
+def reload_model(force=False):
+    """
+    Swap in a new model if MODEL_PATH, or the registry's CURRENT/CANDIDATE
+    pointers, changed since the last load. Models are fully loaded before the
+    swap and requests never wait on the lock; a model that fails to load (or
+    has a different feature schema) leaves the current one serving.
+    Returns True if anything was swapped.
+    """
+    global active_model, shadow_scorer, loaded_model_signature
+    with model_lock:
+        if model_registry is None:
+            signature = model_signature(MODEL_PATH)
+        else:
+            signature = (model_registry.get_pointer(CURRENT), model_registry.get_pointer(CANDIDATE))
+        if signature == loaded_model_signature and not force:
+            return False
+
+        generation = active_model.generation + 1 if active_model else 0
+        if model_registry is None:
+            model = load_model(MODEL_PATH)
+            active_model = ServingModel(model, generation, MODEL_PATH, DEFAULT_THRESHOLD, None, schema_for_model(model))
+        else:
+            version, candidate = signature
+            if version is None:
+                raise ValueError(f"Model registry {MODEL_REGISTRY} has no {CURRENT} version")
+            if force or active_model is None or version != active_model.version:
+                model, metadata, schema = model_registry.load(version)
+                active_model = ServingModel(
+                    model, generation, version, metadata.get("threshold", DEFAULT_THRESHOLD), metadata, schema
+                )
+
+            shadow_version = shadow_scorer.version if shadow_scorer else None
+            if candidate == version:
+                candidate = None
+            if force or candidate != shadow_version:
+                shadow = None
+                if candidate is not None:
+                    model, metadata, schema = model_registry.load(candidate)
+                    shadow = ShadowScorer(model, candidate, metadata.get("threshold", DEFAULT_THRESHOLD), schema)
+                if shadow_scorer is not None:
+                    shadow_scorer.close()
+                shadow_scorer = shadow
+
+        loaded_model_signature = signature
+        return True
 
 # Load the trained XGBoost model
-with open("xgboost_model.pkl", "rb") as model_file:
-    xgb_model = pickle.load(model_file)
+reload_model(force=True)
 
 # Initialize Flask app
 app = Flask(__name__)
 
+# Prometheus metrics served on /metrics. Stage timings also feed the
+# per-request breakdown returned with ?timings=1 (or an X-Debug-Timings header).
+metrics_registry = metrics.MetricsRegistry()
+request_seconds = metrics_registry.histogram(
+    "websec_http_request_duration_seconds", "Time spent serving HTTP requests", ["endpoint", "method", "status"]
+)
+stage_seconds = metrics_registry.histogram(
+    "websec_stage_duration_seconds", "Time spent in each stage of scoring and VirusTotal lookups", ["stage"]
+)
+inference_seconds = metrics_registry.histogram(
+    "websec_model_inference_seconds", "predict_proba latency per batch", ["model_version"]
+)
+scored_urls = metrics_registry.counter(
+    "websec_scored_urls_total", "URLs scored by the model (cache misses)", ["model_version"]
+)
+vt_retries = metrics_registry.counter(
+    "websec_virustotal_retries_total", "VirusTotal report fetches retried because the analysis was not ready"
+)
+upstream_errors = metrics_registry.counter(
+    "websec_upstream_errors_total", "Failed calls to upstream services", ["provider", "kind"]
+)
+
+def upstream_error_kind(error):
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return f"status_{status}" if status is not None else type(error).__name__
+
 # VirusTotal API Key (Use environment variable for security)
 VIRUSTOTAL_API_KEY = os.getenv("VIRUSTOTAL_API_KEY")
 
+# Base URL of the VirusTotal API (override to point at a local fake server)
+VIRUSTOTAL_API_URL = os.getenv("VIRUSTOTAL_API_URL", "https://www.virustotal.com/api/v3")
+
+# Seconds to wait before the first report fetch, and between 409 retries
+VT_INITIAL_WAIT = float(os.getenv("VT_INITIAL_WAIT", "10"))
+VT_RETRY_WAIT = float(os.getenv("VT_RETRY_WAIT", "5"))
+
+# Longest a client may block on /verdict/<job_id>?wait=...
+MAX_VERDICT_WAIT = 30
+
 def evaluate_virustotal_report(report):
     stats = report.get("data", {}).get("attributes", {}).get("stats", {})
 
@@ -94,21 +167,96 @@ def evaluate_virustotal_report(report):
     # Define strict classification
     #return "Malicious" if malicious > 0 else "Safe"
 
+def virustotal_result(report_data):
+    risk_level = evaluate_virustotal_report(report_data)
+    stats = report_data.get("data", {}).get("attributes", {}).get("stats", {})
+
+    return {
+        "risk": risk_level,
+        "stats": {
+            "malicious": stats.get("malicious", 0),
+            "harmless": stats.get("harmless", 0),
+            "undetected": stats.get("undetected", 0),
+            "suspicious": stats.get("suspicious", 0),
+            "timeout": stats.get("timeout", 0)
+        }
+    }
+
+def virustotal_analysis_status(report_data):
+    return report_data.get("data", {}).get("attributes", {}).get("status")
+
+def virustotal_report_ready(response):
+    # A 200 report is only final once the analysis itself has completed;
+    # "queued" and "in-progress" ones carry all-zero stats
+    if response.status_code != 200:
+        return response.status_code != 409
+    return virustotal_analysis_status(response.json()) == "completed"
+
+def virustotal_unfinished_result(status):
+    # Not a verdict: reported as Pending and, carrying an error, only cached for VT_CACHE_ERROR_TTL
+    return {
+        "risk": "Pending",
+        "error": f"VT analysis not finished (status: {status})",
+        "stats": {
+            "malicious": 0,
+            "harmless": 0,
+            "undetected": 0,
+            "suspicious": 0,
+            "timeout": 0
+        }
+    }
+
+def virustotal_error_result(error):
+    return {
+        "risk": "Malicious",
+        "error": f"VT request error: {str(error)}",
+        "stats": {
+            "malicious": 0,
+            "harmless": 0,
+            "undetected": 0,
+            "suspicious": 0,
+            "timeout": 0
+        }
+    }
+
+# Keep-alive connections held open to VirusTotal, shared by all VirusTotal workers
+VT_POOL_SIZE = int(os.getenv("VT_POOL_SIZE", "20"))
+
+# One pooled session for every VirusTotal lookup in this process, created on
+# first use (in the worker, after any pre-fork import)
+vt_session = None
+vt_session_lock = threading.Lock()
+
+def get_vt_session():
+    global vt_session
+    if vt_session is None:
+        import requests  # Deferred: only VirusTotal lookups need it, and warm_up() loads it ahead of them
+        from requests.adapters import HTTPAdapter
+
+        with vt_session_lock:
+            if vt_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=VT_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers["x-apikey"] = VIRUSTOTAL_API_KEY or ""
+                vt_session = session
+    return vt_session
+
 # Modify your VirusTotal API function to include risk evaluation
 def check_virustotal(url):
-    headers = {
-        "x-apikey": VIRUSTOTAL_API_KEY,
-        "content-type": "application/x-www-form-urlencoded"
-    }
+    import requests
+
+    session = get_vt_session()
 
     try:
         # Step 1: Submit URL for analysis
-        response = requests.post(
-            "https://www.virustotal.com/api/v3/urls",
-            headers=headers,
-            data={"url": url},
-            timeout=5
-        )
+        with stage_seconds.time(stage="vt_submit"):
+            response = session.post(
+                f"{VIRUSTOTAL_API_URL}/urls",
+                data={"url": url},
+                timeout=5
+            )
         response.raise_for_status()
 
         analysis_id = response.json().get("data", {}).get("id")
@@ -116,48 +264,315 @@ def check_virustotal(url):
             raise ValueError("Missing analysis_id")
 
         # Wait for VirusTotal to analyze
-        time.sleep(10)  # Adjust this wait if needed
+        with stage_seconds.time(stage="vt_poll_wait"):
+            time.sleep(VT_INITIAL_WAIT)
 
         # Step 2: Retrieve analysis report
-        report_url = f"https://www.virustotal.com/api/v3/analyses/{analysis_id}"
-        report_response = requests.get(report_url, headers=headers, timeout=10)
+        report_url = f"{VIRUSTOTAL_API_URL}/analyses/{analysis_id}"
+        with stage_seconds.time(stage="vt_report"):
+            report_response = session.get(report_url, timeout=10)
 
-        # If VT is still not ready, wait a bit more
+        # If VT is still not ready (409 ConflictError, or an analysis still queued), wait a bit more
         retry = 0
-        while report_response.status_code == 409 and retry < 3:  # ConflictError handling
-            time.sleep(5)
-            report_response = requests.get(report_url, headers=headers, timeout=10)
+        while not virustotal_report_ready(report_response) and retry < 3:
+            vt_retries.inc()
+            with stage_seconds.time(stage="vt_poll_wait"):
+                time.sleep(VT_RETRY_WAIT)
+            with stage_seconds.time(stage="vt_report"):
+                report_response = session.get(report_url, timeout=10)
             retry += 1
 
         report_response.raise_for_status()
 
-        report_data = report_response.json()
-        risk_level = evaluate_virustotal_report(report_data)
-        stats = report_data.get("data", {}).get("attributes", {}).get("stats", {})
-
-        return {
-            "risk": risk_level,
-            "stats": {
-                "malicious": stats.get("malicious", 0),
-                "harmless": stats.get("harmless", 0),
-                "undetected": stats.get("undetected", 0),
-                "suspicious": stats.get("suspicious", 0),
-                "timeout": stats.get("timeout", 0)
-            }
-        }
+        report = report_response.json()
+        status = virustotal_analysis_status(report)
+        if status != "completed":
+            return virustotal_unfinished_result(status)
+        return virustotal_result(report)
 
     except requests.exceptions.RequestException as e:
-        return {
-            "risk": "Malicious",
-            "error": f"VT request error: {str(e)}",
-            "stats": {
-                "malicious": 0,
-                "harmless": 0,
-                "undetected": 0,
-                "suspicious": 0,
-                "timeout": 0
-            }
-        }
+        upstream_errors.inc(provider="virustotal", kind=upstream_error_kind(e))
+        return virustotal_error_result(e)
+
+# Cache lifetimes in seconds: Safe and Malicious verdicts, VT errors (negative caching), ML scores
+VT_CACHE_SAFE_TTL = float(os.getenv("VT_CACHE_SAFE_TTL", "21600"))
+VT_CACHE_MALICIOUS_TTL = float(os.getenv("VT_CACHE_MALICIOUS_TTL", "86400"))
+VT_CACHE_ERROR_TTL = float(os.getenv("VT_CACHE_ERROR_TTL", "60"))
+ML_CACHE_TTL = float(os.getenv("ML_CACHE_TTL", "3600"))
+
+# VirusTotal verdicts are keyed by normalized URL; ML scores by the URL the features are computed from
+vt_cache = VerdictCache(maxsize=int(os.getenv("VT_CACHE_SIZE", "10000")))
+ml_cache = VerdictCache(maxsize=int(os.getenv("ML_CACHE_SIZE", "50000")))
+
+def vt_cache_ttl(result):
+    if result.get("error"):
+        return VT_CACHE_ERROR_TTL
+    if result.get("risk") == "Malicious":
+        return VT_CACHE_MALICIOUS_TTL
+    return VT_CACHE_SAFE_TTL
+
+# Optional SQLite store shared by all worker processes (set VERDICT_STORE_PATH to enable)
+VERDICT_STORE_PATH = os.getenv("VERDICT_STORE_PATH")
+verdict_store = VerdictStore(VERDICT_STORE_PATH) if VERDICT_STORE_PATH else None
+
+# Concurrent lookups of the same URL in this process share one upstream call
+vt_flight = SingleFlight()
+
+def get_cached_virustotal(key):
+    result = vt_cache.get(key)
+    if result is None and verdict_store is not None:
+        stored = verdict_store.get("virustotal", key)
+        if stored is not None:
+            result, ttl = stored
+            vt_cache.set(key, result, ttl)
+    return result
+
+def lookup_virustotal(url, key):
+    if verdict_store is None:
+        return check_virustotal(url)
+    return verdict_store.fetch("virustotal", key, lambda: check_virustotal(url), vt_cache_ttl)
+
+def cached_check_virustotal(url):
+    key = normalize_url(url)
+    result = get_cached_virustotal(key)
+    if result is None:
+        result = vt_flight.run(key, lambda: lookup_virustotal(url, key))
+        vt_cache.set(key, result, vt_cache_ttl(result))
+    return result
+
+def record_job(job_id, url, ttl):
+    # Job ids live in the worker that queued them; the shared store lets a
+    # /verdict poll that lands on another worker find the job's URL
+    if verdict_store is not None:
+        verdict_store.set("vt_job", job_id, url, ttl)
+
+def shared_job(job_id, wait=0):
+    """
+    A job queued by another worker process, or None if the store has no record
+    of it. Completes once that worker's lookup reaches the shared store; polls
+    it for up to `wait` seconds until then.
+    """
+    if verdict_store is None:
+        return None
+    stored = verdict_store.get("vt_job", job_id)
+    if stored is None:
+        return None
+    url = stored[0]
+    key = normalize_url(url)
+    deadline = time.monotonic() + wait
+    result = get_cached_virustotal(key)
+    while result is None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(verdict_store.poll_interval, remaining))
+        result = get_cached_virustotal(key)
+    return {
+        "job_id": job_id,
+        "url": url,
+        "status": "pending" if result is None else "completed",
+        "result": result,
+        "finished_at": None,
+    }
+
+# Most VirusTotal lookups queued or running at once; past it /predict answers 503
+VT_MAX_PENDING = int(os.getenv("VT_MAX_PENDING", "1000"))
+
+# VirusTotal lookups run on a background worker pool, off the request thread
+vt_jobs = VirusTotalJobs(
+    cached_check_virustotal, max_workers=int(os.getenv("VT_WORKERS", "8")), max_pending=VT_MAX_PENDING
+)
+
+def per_minute_rate(name, default):
+    # Env rate in calls per minute -> calls per second; "inf" or "" means unlimited (None)
+    value = os.getenv(name, default).strip().lower()
+    if value in ("", "inf", "unlimited"):
+        return None
+    return float(value) / 60
+
+# Confidence bands (see cascade.py): scores below CASCADE_SAFE_BELOW (default:
+# the model's threshold) or at/above CASCADE_MALICIOUS_AT are answered by the
+# model, the band in between is escalated to VirusTotal
+CASCADE_SAFE_BELOW = os.getenv("CASCADE_SAFE_BELOW")
+CASCADE_MALICIOUS_AT = float(os.getenv("CASCADE_MALICIOUS_AT", "0.9"))
+
+# VirusTotal escalations per minute allowed from each band (0 never, "inf" unlimited)
+CASCADE_BAND_RATES = {
+    SAFE: per_minute_rate("CASCADE_SAFE_VT_PER_MINUTE", "0"),
+    UNCERTAIN: per_minute_rate("CASCADE_UNCERTAIN_VT_PER_MINUTE", "inf"),
+    MALICIOUS: per_minute_rate("CASCADE_MALICIOUS_VT_PER_MINUTE", "0"),
+}
+
+# VirusTotal API quota for this process (the public API allows 4 lookups a
+# minute and 500 a day); escalations beyond it are answered by the model
+VT_QUOTA_PER_MINUTE = per_minute_rate("VT_QUOTA_PER_MINUTE", "inf")
+VT_QUOTA_PER_DAY = os.getenv("VT_QUOTA_PER_DAY")
+
+vt_quota = []
+if VT_QUOTA_PER_MINUTE is not None:
+    vt_quota.append(TokenBucket(VT_QUOTA_PER_MINUTE))
+if VT_QUOTA_PER_DAY:
+    vt_quota.append(TokenBucket(float(VT_QUOTA_PER_DAY) / 86400, burst=float(VT_QUOTA_PER_DAY)))
+
+cascade = Cascade(
+    float(CASCADE_SAFE_BELOW) if CASCADE_SAFE_BELOW else None,
+    CASCADE_MALICIOUS_AT,
+    CASCADE_BAND_RATES,
+    vt_quota
+)
+
+cascade_decisions = metrics_registry.counter(
+    "websec_cascade_decisions_total",
+    "Predictions per confidence band and how VirusTotal was involved "
+    "(model, cached, escalated, rate_limited)",
+    ["band", "action"]
+)
+metrics_registry.callback(
+    "websec_virustotal_quota_tokens", "VirusTotal lookups left in this process's quota bucket", "gauge",
+    lambda: {(): cascade.quota_available()} if vt_quota else {}
+)
+
+def score_urls(urls, serving):
+    """
+    Return (malicious_prob, not_malicious_prob) for each URL, in order, from
+    the `serving` model. Cached scores are reused and the rest go through one
+    predict_proba call, which is also handed to the shadow model if any.
+    Features come from the serving model's feature schema.
+    """
+    schema = serving.schema
+    keys = [(serving.generation, schema.cache_key(url)) for url in urls]
+    scores = [ml_cache.get(key) for key in keys]
+    missing = [i for i, score in enumerate(scores) if score is None]
+
+    if missing:
+        missing_urls = [urls[i] for i in missing]
+        with stage_seconds.time(stage="feature_extraction"):
+            features = schema.extract(missing_urls)
+        start = time.perf_counter()
+        prediction_proba = serving.model.predict_proba(features)
+        latency = time.perf_counter() - start
+        inference_seconds.observe(latency, model_version=serving.version)
+        metrics.record_timing("model_inference", latency)
+        scored_urls.inc(len(missing), model_version=serving.version)
+        shadow = shadow_scorer
+        if shadow is not None:
+            if shadow.schema is schema:
+                shadow.submit(features, prediction_proba[:, 1], serving.threshold, latency)
+            else:
+                shadow.submit(None, prediction_proba[:, 1], serving.threshold, latency, urls=missing_urls)
+        for row, i in enumerate(missing):
+            scores[i] = (float(prediction_proba[row][1]), float(prediction_proba[row][0]))
+            ml_cache.set(keys[i], scores[i], ML_CACHE_TTL)
+
+    return scores
+
+def watch_model():
+    while True:
+        time.sleep(MODEL_RELOAD_INTERVAL)
+        try:
+            if reload_model():
+                shadow = shadow_scorer.version if shadow_scorer else None
+                print(f"Serving model {active_model.version} (generation {active_model.generation}), shadow: {shadow}")
+        except Exception as e:
+            print(f"Model reload failed, keeping the current model: {e}")
+
+# Host allow/deny indexes built with host_reputation.py, checked before the
+# model; listed hosts skip scoring and VirusTotal entirely
+HOST_ALLOWLIST_PATH = os.getenv("HOST_ALLOWLIST_PATH")
+HOST_DENYLIST_PATH = os.getenv("HOST_DENYLIST_PATH")
+
+# Seconds between checks for rebuilt allow/deny indexes (0 disables reloading)
+HOST_REPUTATION_RELOAD_INTERVAL = float(os.getenv("HOST_REPUTATION_RELOAD_INTERVAL", "30"))
+
+# (malicious_prob, not_malicious_prob) reported for listed hosts
+REPUTATION_SCORES = {DENY: (1.0, 0.0), ALLOW: (0.0, 1.0)}
+
+host_reputation = (
+    HostReputation(HOST_ALLOWLIST_PATH, HOST_DENYLIST_PATH)
+    if HOST_ALLOWLIST_PATH or HOST_DENYLIST_PATH else None
+)
+
+reputation_verdicts = metrics_registry.counter(
+    "websec_reputation_verdicts_total", "Predictions answered from the host allow/deny lists", ["list"]
+)
+
+def check_reputation(url):
+    """ALLOW or DENY if the URL's host is on a reputation list, else None."""
+    if host_reputation is None:
+        return None
+    with stage_seconds.time(stage="reputation_lookup"):
+        listed = host_reputation.lookup(url)
+    if listed is not None:
+        reputation_verdicts.inc(list=listed)
+    return listed
+
+def watch_host_reputation():
+    while True:
+        time.sleep(HOST_REPUTATION_RELOAD_INTERVAL)
+        try:
+            if host_reputation.reload():
+                print(f"Reloaded host reputation lists: {host_reputation.sizes()}")
+        except Exception as e:
+            print(f"Host reputation reload failed, keeping the current lists: {e}")
+
+# Append-only log of popup votes, read back by `training.py --incremental`
+feedback_log = FeedbackLog(os.getenv("FEEDBACK_LOG_PATH", "feedback.jsonl"))
+
+# Maximum number of URLs accepted by a single /predict/batch request
+MAX_BATCH_SIZE = 1000
+
+def build_prediction(url, malicious_prob, not_malicious_prob, threshold, jobs=None, reputation=None):
+    if reputation is not None:
+        malicious_prob, not_malicious_prob = REPUTATION_SCORES[reputation]
+    is_malicious = malicious_prob >= threshold
+    band = cascade.band(malicious_prob, threshold)
+
+    virustotal_result = "Not checked"
+    vt_stats = {
+        "malicious": 0,
+        "harmless": 0,
+        "undetected": 0,
+        "suspicious": 0,
+        "timeout": 0
+    }
+    vt_error = None  # New addition to hold VT error clearly
+    vt_job = None
+
+    # URLs in an escalating band are answered from the cache, or, within the
+    # band's rate limit and the VirusTotal quota, queued for VirusTotal (on
+    # `jobs`, default vt_jobs) and collected later from /verdict/<job_id>.
+    # Hosts on a reputation list (`reputation`) are already decided.
+    action = "model"
+    if cascade.escalates(band) and reputation is None:
+        vt_result_full = get_cached_virustotal(normalize_url(url))
+        if vt_result_full is not None:
+            action = "cached"
+            virustotal_result = vt_result_full.get("risk", "Safe")
+            vt_stats = vt_result_full.get("stats", vt_stats)
+            vt_error = vt_result_full.get("error")  # Grab error message from VT clearly if it exists
+        elif cascade.admit(band):
+            action = "escalated"
+            vt_job = (jobs or vt_jobs).submit(url)
+            record_job(vt_job, url, (jobs or vt_jobs).ttl)
+            virustotal_result = "Pending"
+        else:
+            action = "rate_limited"
+            virustotal_result = "Rate limited"
+    cascade_decisions.inc(band=band, action=action)
+
+    return {
+        "url": url,
+        "malicious_probability": round(malicious_prob, 4),
+        "not_malicious_probability": round(not_malicious_prob, 4),
+        "prediction": "Malicious" if is_malicious else "Safe",
+        "threshold": threshold,
+        "virustotal": virustotal_result,
+        "virustotal_stats": vt_stats,
+        "virustotal_error": vt_error,  # Now return the VT error message explicitly
+        "virustotal_job": vt_job,
+        "reputation": reputation,
+        "band": band
+    }
 
 # Define the predict route
 @app.route("/predict", methods=["POST"])
@@ -169,47 +584,263 @@ def predict():
         if not url:
             return jsonify({"error": "No URL provided"}), 400
 
-        extractor = FeatureExtractor(url)
-        features = extractor.run()
-        feature_values = np.array([list(features.values())]).astype(np.float32)
+        serving = active_model
+        listed = check_reputation(url)
+        if listed is not None:
+            return jsonify(build_prediction(url, 0.0, 0.0, serving.threshold, reputation=listed))
 
-        prediction_proba = xgb_model.predict_proba(feature_values)
-        malicious_prob = float(prediction_proba[0][1])
-        not_malicious_prob = float(prediction_proba[0][0])
+        malicious_prob, not_malicious_prob = score_urls([url], serving)[0]
 
-        threshold = 0.4
-        is_malicious = malicious_prob >= threshold
+        return jsonify(build_prediction(url, malicious_prob, not_malicious_prob, serving.threshold))
 
-        virustotal_result = "Not checked"
-        vt_stats = {
-            "malicious": 0,
-            "harmless": 0,
-            "undetected": 0,
-            "suspicious": 0,
-            "timeout": 0
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def batch_prediction(url, malicious_prob, not_malicious_prob, threshold, jobs=None):
+    # A full VirusTotal queue fails only the items that needed it; the jobs
+    # already queued for earlier items are still answered
+    try:
+        return build_prediction(url, malicious_prob, not_malicious_prob, threshold, jobs=jobs)
+    except JobQueueFull as e:
+        return {"url": url, "error": str(e)}
+
+# Score a whole page of URLs with (at most) a single predict_proba call
+@app.route("/predict/batch", methods=["POST"])
+def predict_batch():
+    try:
+        data = request.get_json()
+        urls = data.get("urls", [])
+
+        if not isinstance(urls, list) or not urls:
+            return jsonify({"error": "No URLs provided"}), 400
+        if len(urls) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Too many URLs (max {MAX_BATCH_SIZE})"}), 400
+
+        # Only non-empty strings are scored; the rest get an error entry in place
+        valid = [i for i, url in enumerate(urls) if isinstance(url, str) and url]
+        results = [{"url": url, "error": "No URL provided"} for url in urls]
+
+        serving = active_model
+        unlisted = []
+        for i in valid:
+            listed = check_reputation(urls[i])
+            if listed is not None:
+                results[i] = build_prediction(urls[i], 0.0, 0.0, serving.threshold, reputation=listed)
+            else:
+                unlisted.append(i)
+
+        if unlisted:
+            scores = score_urls([urls[i] for i in unlisted], serving)
+            for i, (malicious_prob, not_malicious_prob) in zip(unlisted, scores):
+                results[i] = batch_prediction(urls[i], malicious_prob, not_malicious_prob, serving.threshold)
+
+        return jsonify({"results": results})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Collect the VirusTotal verdict for a job queued by /predict
+@app.route("/verdict/<job_id>", methods=["GET"])
+def verdict(job_id):
+    try:
+        wait = min(max(request.args.get("wait", 0, type=float), 0), MAX_VERDICT_WAIT)
+        job = vt_jobs.get(job_id, wait=wait)
+        if job is None:
+            job = shared_job(job_id, wait=wait)
+
+        if job is None:
+            return jsonify({"error": "Unknown job id"}), 404
+
+        response = {
+            "job_id": job_id,
+            "url": job["url"],
+            "status": job["status"],
+            "virustotal": "Pending",
+            "virustotal_stats": None,
+            "virustotal_error": None
         }
-        vt_error = None  # New addition to hold VT error clearly
+        if job["status"] == "completed":
+            result = job["result"]
+            response["virustotal"] = result.get("risk", "Safe")
+            response["virustotal_stats"] = result.get("stats")
+            response["virustotal_error"] = result.get("error")
 
-        if is_malicious:
-            vt_result_full = check_virustotal(url)
-            virustotal_result = vt_result_full.get("risk", "Safe")
-            vt_stats = vt_result_full.get("stats", vt_stats)
-            vt_error = vt_result_full.get("error")  # Grab error message from VT clearly if it exists
+        return jsonify(response)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Record a tick (safe) / cross (malicious) vote from the popup; a null vote withdraws it
+@app.route("/feedback", methods=["POST"])
+def feedback():
+    try:
+        data = request.get_json()
+        url = data.get("url", "")
+        vote = data.get("vote")
 
+        if not url:
+            return jsonify({"error": "No URL provided"}), 400
+        if vote not in ("tick", "cross", None):
+            return jsonify({"error": "Vote must be 'tick', 'cross' or null"}), 400
+
+        record = feedback_log.append(
+            url, vote,
+            prediction=data.get("prediction"),
+            malicious_probability=data.get("malicious_probability")
+        )
+        return jsonify({"status": "recorded", "url": url, "vote": vote, "label": record["label"]})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Swap in a retrained model now instead of waiting for the watcher
+@app.route("/model/reload", methods=["POST"])
+def model_reload():
+    try:
+        swapped = reload_model(force=request.args.get("force", "0") == "1")
         return jsonify({
-            "url": url,
-            "malicious_probability": round(malicious_prob, 4),
-            "not_malicious_probability": round(not_malicious_prob, 4),
-            "prediction": "Malicious" if is_malicious else "Safe",
-            "threshold": threshold,
-            "virustotal": virustotal_result,
-            "virustotal_stats": vt_stats,
-            "virustotal_error": vt_error  # Now return the VT error message explicitly
+            "reloaded": swapped,
+            "version": active_model.version,
+            "generation": active_model.generation
         })
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Served model metadata and shadow-scoring agreement/latency stats
+@app.route("/model", methods=["GET"])
+def model_info():
+    serving, shadow = active_model, shadow_scorer
+    return jsonify({
+        "version": serving.version,
+        "generation": serving.generation,
+        "threshold": serving.threshold,
+        "feature_schema": serving.schema.version,
+        "cascade": {
+            "safe_below": cascade.safe_below if cascade.safe_below is not None else serving.threshold,
+            "malicious_at": cascade.malicious_at
+        },
+        "metadata": serving.metadata,
+        "shadow": shadow.stats() if shadow else None
+    })
+
+# Hit/miss/eviction counters for the verdict caches
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "virustotal": vt_cache.stats(),
+        "ml": ml_cache.stats()
+    })
+
+# Cache counters, the VirusTotal queue and the served model versions are read at scrape time
+def cache_stat(field):
+    return lambda: {(name,): cache.stats()[field] for name, cache in (("virustotal", vt_cache), ("ml", ml_cache))}
+
+metrics_registry.callback("websec_cache_hits_total", "Verdict cache hits", "counter", cache_stat("hits"), ["cache"])
+metrics_registry.callback("websec_cache_misses_total", "Verdict cache misses", "counter", cache_stat("misses"), ["cache"])
+metrics_registry.callback("websec_cache_evictions_total", "Verdict cache LRU evictions", "counter", cache_stat("evictions"), ["cache"])
+metrics_registry.callback("websec_cache_entries", "Entries held in each verdict cache", "gauge", cache_stat("size"), ["cache"])
+metrics_registry.callback(
+    "websec_virustotal_jobs_pending", "VirusTotal lookups queued or in progress", "gauge",
+    lambda: {(): vt_jobs.pending()}
+)
+
+metrics_registry.callback(
+    "websec_reputation_list_hosts", "Hosts in each loaded reputation list", "gauge",
+    lambda: {(name,): size for name, size in host_reputation.sizes().items()} if host_reputation else {},
+    ["list"]
+)
+
+def served_models():
+    serving, shadow = active_model, shadow_scorer
+    models = {(serving.version, "current", serving.generation): 1}
+    if shadow is not None:
+        models[(shadow.version, "candidate", serving.generation)] = 1
+    return models
+
+metrics_registry.callback(
+    "websec_model_info", "Model versions being served (current) and shadow-scored (candidate)", "gauge",
+    served_models, ["model_version", "role", "generation"]
+)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if request.args.get("timings") == "1" or request.headers.get("X-Debug-Timings"):
+        metrics.begin_timings()
+
+@app.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    request_seconds.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+
+    # Debug breakdown: stage timings for this request, added to JSON object responses
+    timings = metrics.end_timings()
+    if timings is not None and response.is_json:
+        body = response.get_json(silent=True)
+        if isinstance(body, dict):
+            timings["total"] = round(elapsed * 1000, 3)
+            body["timings_ms"] = timings
+            response.set_data(json.dumps(body))
+    return response
+
+# Prometheus scrape endpoint
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics_registry.render(), content_type=metrics.CONTENT_TYPE)
+
+# URLs scored by warm_up(): a plain domain and one exercising every feature
+WARM_UP_URLS = ["https://www.example.com/", "http://203.0.113.7:8080/a/b/login.php?id=1&next=2#top"]
+
+# Set once warm_up() has finished; /ready answers 503 until then
+warmed_up = threading.Event()
+warm_up_seconds = None
+
+def warm_up():
+    """
+    Run a first inference through feature extraction and the served (and
+    shadow) model, bypassing the ML cache, and load the modules deferred at
+    import, so the first real request pays for neither.
+    """
+    global warm_up_seconds
+    start = time.perf_counter()
+    import requests  # noqa: F401
+
+    serving, shadow = active_model, shadow_scorer
+    serving.model.predict_proba(serving.schema.extract(WARM_UP_URLS))
+    if shadow is not None:
+        shadow.model.predict_proba(shadow.schema.extract(WARM_UP_URLS))
+
+    warm_up_seconds = time.perf_counter() - start
+    warmed_up.set()
+
+def start_watchers():
+    if MODEL_RELOAD_INTERVAL > 0:
+        threading.Thread(target=watch_model, name="model-watcher", daemon=True).start()
+    if host_reputation is not None and HOST_REPUTATION_RELOAD_INTERVAL > 0:
+        threading.Thread(target=watch_host_reputation, name="reputation-watcher", daemon=True).start()
+
+# With gunicorn.conf.py the master process imports this module, runs
+# warm_up() and forks the workers; threads do not survive a fork, so the
+# workers start their watchers from its post_fork hook instead
+if os.getenv("PRELOAD_WORKERS") != "1":
+    start_watchers()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+# Readiness probe: 200 once the model is loaded and warmed up
+@app.route("/ready", methods=["GET"])
+def ready():
+    if not warmed_up.is_set():
+        return jsonify({"ready": False}), 503
+    return jsonify({
+        "ready": True,
+        "version": active_model.version,
+        "warm_up_ms": round(warm_up_seconds * 1000, 3)
+    })
+
 # Home route to indicate the app is live
 @app.route("/")
 def home():
@@ -234,4 +865,4 @@ def home():
     """
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")))
\ No newline at end of file
@@ -0,0 +1,372 @@
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+import httpx
+import app as service
+import metrics
+from verdict_cache import normalize_url
+from verdict_store import AsyncSingleFlight
+from vt_jobs import AsyncVirusTotalJobs, JobQueueFull
+
+# ASGI deployment mode for the prediction server:
+#
+#   uvicorn asgi:app --host 0.0.0.0 --port 5000
+#
+# /predict, /predict/batch and /verdict/<job_id> are served natively on the
+# event loop with the same JSON as app.py. VirusTotal lookups are coroutines
+# sharing one keep-alive connection pool, so a single process can hold
+# thousands of pending lookups, and model scoring runs on a thread pool so it
+# never blocks the loop. Every other route (/feedback, /model, /metrics, ...)
+# is passed through to the Flask app unchanged.
+#
+# The model, caches, feedback log and metrics are the ones app.py sets up.
+# With VERDICT_STORE_PATH set, lookups go through the shared store's lease
+# (VerdictStore.fetch) on a thread pool, so they are coalesced across
+# processes as in app.py.
+
+# Upper bound on open connections to VirusTotal; idle ones are kept alive for reuse
+VT_MAX_CONNECTIONS = int(os.getenv("VT_MAX_CONNECTIONS", "100"))
+VT_KEEPALIVE_EXPIRY = float(os.getenv("VT_KEEPALIVE_EXPIRY", "60"))
+
+# Threads running feature extraction and predict_proba
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(os.cpu_count() or 4)))
+
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+
+# Threads holding (or waiting on) a VerdictStore lease while the lookup itself
+# runs on the event loop; one per VirusTotal connection
+store_executor = ThreadPoolExecutor(max_workers=VT_MAX_CONNECTIONS, thread_name_prefix="verdict-store")
+
+# Created on the running loop at startup (or first use) and closed at shutdown
+vt_client = None
+
+def get_vt_client():
+    global vt_client
+    if vt_client is None:
+        vt_client = httpx.AsyncClient(
+            headers={"x-apikey": service.VIRUSTOTAL_API_KEY or ""},
+            limits=httpx.Limits(
+                max_connections=VT_MAX_CONNECTIONS,
+                max_keepalive_connections=VT_MAX_CONNECTIONS,
+                keepalive_expiry=VT_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(10, connect=5, pool=None)
+        )
+    return vt_client
+
+# Requests beyond the connection limit wait here rather than inside the
+# connection pool, which gets much slower with thousands of waiters
+vt_slots = asyncio.Semaphore(VT_MAX_CONNECTIONS)
+
+async def vt_request(method, url, **kwargs):
+    async with vt_slots:
+        return await get_vt_client().request(method, url, **kwargs)
+
+async def check_virustotal(url):
+    """
+    Async version of app.check_virustotal: submit, wait, then fetch the
+    report with up to 3 retries while VirusTotal answers 409 or the
+    analysis is not completed yet.
+    """
+    try:
+        # Step 1: Submit URL for analysis
+        with service.stage_seconds.time(stage="vt_submit"):
+            response = await vt_request("POST", f"{service.VIRUSTOTAL_API_URL}/urls", data={"url": url}, timeout=5)
+        response.raise_for_status()
+
+        analysis_id = response.json().get("data", {}).get("id")
+        if not analysis_id:
+            raise ValueError("Missing analysis_id")
+
+        with service.stage_seconds.time(stage="vt_poll_wait"):
+            await asyncio.sleep(service.VT_INITIAL_WAIT)
+
+        # Step 2: Retrieve analysis report
+        report_url = f"{service.VIRUSTOTAL_API_URL}/analyses/{analysis_id}"
+        with service.stage_seconds.time(stage="vt_report"):
+            report_response = await vt_request("GET", report_url)
+
+        retry = 0
+        while not service.virustotal_report_ready(report_response) and retry < 3:
+            service.vt_retries.inc()
+            with service.stage_seconds.time(stage="vt_poll_wait"):
+                await asyncio.sleep(service.VT_RETRY_WAIT)
+            with service.stage_seconds.time(stage="vt_report"):
+                report_response = await vt_request("GET", report_url)
+            retry += 1
+
+        report_response.raise_for_status()
+
+        report = report_response.json()
+        status = service.virustotal_analysis_status(report)
+        if status != "completed":
+            return service.virustotal_unfinished_result(status)
+        return service.virustotal_result(report)
+
+    except httpx.HTTPError as e:
+        service.upstream_errors.inc(provider="virustotal", kind=service.upstream_error_kind(e))
+        return service.virustotal_error_result(e)
+
+vt_flight = AsyncSingleFlight()
+
+async def lookup_virustotal(url, key):
+    if service.verdict_store is None:
+        result = await check_virustotal(url)
+    else:
+        # The lease holder runs check_virustotal back on the loop; other
+        # processes wait for its stored result instead of calling VirusTotal
+        loop = asyncio.get_running_loop()
+
+        def check():
+            return asyncio.run_coroutine_threadsafe(check_virustotal(url), loop).result()
+
+        result = await loop.run_in_executor(
+            store_executor, service.verdict_store.fetch, "virustotal", key, check, service.vt_cache_ttl
+        )
+    service.vt_cache.set(key, result, service.vt_cache_ttl(result))
+    return result
+
+async def cached_check_virustotal(url):
+    key = normalize_url(url)
+    result = service.get_cached_virustotal(key)
+    if result is None:
+        result = await vt_flight.run(key, lambda: lookup_virustotal(url, key))
+    return result
+
+vt_jobs = AsyncVirusTotalJobs(cached_check_virustotal, max_pending=service.VT_MAX_PENDING)
+
+service.metrics_registry.callback(
+    "websec_virustotal_async_jobs_pending", "VirusTotal lookups in progress on the ASGI event loop", "gauge",
+    lambda: {(): vt_jobs.pending()}
+)
+
+def score_with_timings(urls, serving, timed):
+    # Runs on an inference thread, where the stage timings are recorded
+    if timed:
+        metrics.begin_timings()
+    scores = service.score_urls(urls, serving)
+    return scores, metrics.end_timings()
+
+async def score(urls, serving, timed):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, score_with_timings, urls, serving, timed)
+
+async def predict(scope, receive, query, timed):
+    data = json.loads(await read_body(receive))
+    url = data.get("url", "")
+
+    if not url:
+        return 400, {"error": "No URL provided"}, None
+
+    # The host list lookup is a binary search, cheap enough for the event loop
+    serving = service.active_model
+    listed = service.check_reputation(url)
+    if listed is not None:
+        return 200, service.build_prediction(url, 0.0, 0.0, serving.threshold, reputation=listed), None
+
+    scores, timings = await score([url], serving, timed)
+    malicious_prob, not_malicious_prob = scores[0]
+
+    return 200, service.build_prediction(url, malicious_prob, not_malicious_prob, serving.threshold, jobs=vt_jobs), timings
+
+async def predict_batch(scope, receive, query, timed):
+    data = json.loads(await read_body(receive))
+    urls = data.get("urls", [])
+
+    if not isinstance(urls, list) or not urls:
+        return 400, {"error": "No URLs provided"}, None
+    if len(urls) > service.MAX_BATCH_SIZE:
+        return 400, {"error": f"Too many URLs (max {service.MAX_BATCH_SIZE})"}, None
+
+    # Only non-empty strings are scored; the rest get an error entry in place
+    valid = [i for i, url in enumerate(urls) if isinstance(url, str) and url]
+    results = [{"url": url, "error": "No URL provided"} for url in urls]
+    timings = None
+
+    serving = service.active_model
+    unlisted = []
+    for i in valid:
+        listed = service.check_reputation(urls[i])
+        if listed is not None:
+            results[i] = service.build_prediction(urls[i], 0.0, 0.0, serving.threshold, reputation=listed)
+        else:
+            unlisted.append(i)
+
+    if unlisted:
+        scores, timings = await score([urls[i] for i in unlisted], serving, timed)
+        for i, (malicious_prob, not_malicious_prob) in zip(unlisted, scores):
+            results[i] = service.batch_prediction(
+                urls[i], malicious_prob, not_malicious_prob, serving.threshold, jobs=vt_jobs
+            )
+
+    return 200, {"results": results}, timings
+
+async def verdict(scope, receive, query, timed):
+    job_id = scope["path"][len("/verdict/"):]
+    try:
+        wait = float(query.get("wait", ["0"])[0])
+    except ValueError:
+        wait = 0
+    wait = min(max(wait, 0), service.MAX_VERDICT_WAIT)
+    job = await vt_jobs.get(job_id, wait=wait)
+    if job is None and service.verdict_store is not None:
+        loop = asyncio.get_running_loop()
+        job = await loop.run_in_executor(store_executor, service.shared_job, job_id, wait)
+
+    if job is None:
+        return 404, {"error": "Unknown job id"}, None
+
+    response = {
+        "job_id": job_id,
+        "url": job["url"],
+        "status": job["status"],
+        "virustotal": "Pending",
+        "virustotal_stats": None,
+        "virustotal_error": None
+    }
+    if job["status"] == "completed":
+        result = job["result"]
+        response["virustotal"] = result.get("risk", "Safe")
+        response["virustotal_stats"] = result.get("stats")
+        response["virustotal_error"] = result.get("error")
+
+    return 200, response, None
+
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return bytes(body)
+
+async def send_response(send, status, body, content_type):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode("latin-1")),
+            (b"content-length", str(len(body)).encode("latin-1"))
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+def wsgi_environ(scope, body):
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+            environ[name] = value
+        else:
+            key = "HTTP_" + name
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def call_flask(environ):
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = headers
+
+    chunks = service.app(environ, start_response)
+    try:
+        body = b"".join(chunks)
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+    return response["status"], response["headers"], body
+
+async def pass_to_flask(scope, receive, send):
+    body = await read_body(receive)
+    loop = asyncio.get_running_loop()
+    status, headers, body = await loop.run_in_executor(None, call_flask, wsgi_environ(scope, body))
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+def route(method, path):
+    # The routes served natively, as (Flask rule, handler) or None
+    if path == "/predict" and method == "POST":
+        return "/predict", predict
+    if path == "/predict/batch" and method == "POST":
+        return "/predict/batch", predict_batch
+    if path.startswith("/verdict/") and "/" not in path[len("/verdict/"):] and method == "GET":
+        return "/verdict/<job_id>", verdict
+    return None
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            get_vt_client()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if vt_client is not None:
+                await vt_client.aclose()
+            inference_executor.shutdown(wait=False)
+            store_executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    matched = route(scope["method"], scope["path"])
+    if matched is None:
+        return await pass_to_flask(scope, receive, send)
+
+    start = time.perf_counter()
+    rule, handler = matched
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    headers = dict(scope.get("headers", []))
+    timed = query.get("timings", [""])[0] == "1" or bool(headers.get(b"x-debug-timings"))
+    try:
+        status, body, timings = await handler(scope, receive, query, timed)
+    except JobQueueFull as e:
+        status, body, timings = 503, {"error": str(e)}, None
+    except Exception as e:
+        status, body, timings = 500, {"error": str(e)}, None
+
+    elapsed = time.perf_counter() - start
+    service.request_seconds.observe(elapsed, endpoint=rule, method=scope["method"], status=status)
+    if timed:
+        timings = timings or {}
+        timings["total"] = round(elapsed * 1000, 3)
+        body["timings_ms"] = timings
+    # Serialized the way Flask's jsonify does it, so both modes return identical bytes
+    payload = (service.app.json.dumps(body, separators=(",", ":")) + "\n").encode("utf-8")
+    await send_response(send, status, payload, "application/json")
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "5000")))
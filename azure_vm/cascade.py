@@ -0,0 +1,246 @@
+import argparse
+import csv
+import json
+import math
+import pickle
+import sys
+import threading
+import time
+import numpy as np
+
+# Decision cascade for /predict: the model's malicious probability falls in
+# one of three confidence bands, and only bands that escalate pay for a
+# VirusTotal lookup.
+#
+#   safe       p < safe_below            answered by the model
+#   uncertain  safe_below <= p < malicious_at   escalated to VirusTotal
+#   malicious  p >= malicious_at         answered by the model
+#
+# Each band has its own VirusTotal rate limit (0 never escalates, None is
+# unlimited, e.g. a trickle of confident-malicious URLs as a spot check), and
+# every escalation also draws from the shared VirusTotal quota buckets.
+#
+# Replay a labelled CSV to see the VirusTotal call rate against accuracy for
+# candidate band settings before changing them:
+#
+#   python cascade.py labelled.csv --safe-below 0.1 0.2 0.4 --malicious-at 0.8 0.9 0.95
+
+SAFE = "safe"
+UNCERTAIN = "uncertain"
+MALICIOUS = "malicious"
+BANDS = (SAFE, UNCERTAIN, MALICIOUS)
+
+# Label values read as "not malicious" by the replay; anything else is malicious
+SAFE_LABELS = {"0", "benign", "safe", "not malicious"}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at `rate` tokens per second, holding at
+    most `burst` (default: one minute's worth, at least 1). A rate of None
+    never runs out; a rate of 0 never admits anything.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst if burst is not None else (max(rate * 60, 1) if rate else 0)
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        if self.rate is None:
+            return True
+        with self.lock:
+            self._refill()
+            if self.tokens < tokens:
+                return False
+            self.tokens -= tokens
+            return True
+
+    def refund(self, tokens=1):
+        if self.rate is None:
+            return
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + tokens)
+
+    def available(self):
+        if self.rate is None:
+            return math.inf
+        with self.lock:
+            self._refill()
+            return self.tokens
+
+
+class Cascade:
+    """
+    Confidence bands plus the VirusTotal rate limits that gate escalation.
+
+    `safe_below` None means the serving model's threshold, so by default
+    nothing the model calls safe is sent to VirusTotal. `band_rates` maps a
+    band to its escalations per second (0: never, None: unlimited); `quota`
+    is a list of TokenBuckets every escalation must also draw from.
+    Buckets are per process, so split a VirusTotal quota across workers.
+    """
+
+    def __init__(self, safe_below=None, malicious_at=0.9, band_rates=None, quota=()):
+        if safe_below is not None and safe_below > malicious_at:
+            raise ValueError(f"safe_below ({safe_below}) must not exceed malicious_at ({malicious_at})")
+        self.safe_below = safe_below
+        self.malicious_at = malicious_at
+        rates = {SAFE: 0, UNCERTAIN: None, MALICIOUS: 0}
+        rates.update(band_rates or {})
+        self.band_limits = {band: TokenBucket(rate) for band, rate in rates.items()}
+        self.quota = list(quota)
+
+    def band(self, malicious_prob, threshold):
+        safe_below = self.safe_below if self.safe_below is not None else min(threshold, self.malicious_at)
+        if malicious_prob >= self.malicious_at:
+            return MALICIOUS
+        if malicious_prob < safe_below:
+            return SAFE
+        return UNCERTAIN
+
+    def escalates(self, band):
+        return self.band_limits[band].rate != 0
+
+    def admit(self, band):
+        """Take one escalation from the band's limit and every quota bucket, or none at all."""
+        if not self.band_limits[band].try_acquire():
+            return False
+        taken = []
+        for bucket in self.quota:
+            if not bucket.try_acquire():
+                for refund in [self.band_limits[band]] + taken:
+                    refund.refund()
+                return False
+            taken.append(bucket)
+        return True
+
+    def quota_available(self):
+        return min((bucket.available() for bucket in self.quota), default=math.inf)
+
+
+def is_malicious_label(value):
+    return str(value).strip().lower() not in SAFE_LABELS
+
+
+def replay(probabilities, labels, threshold, safe_below, malicious_at, vt_verdicts=None):
+    """
+    Outcome of one band setting over scored, labelled URLs. Escalated URLs
+    take the VirusTotal verdict (`vt_verdicts`, or the label itself when
+    there are none, i.e. VirusTotal treated as always right).
+    """
+    probabilities = np.asarray(probabilities)
+    labels = np.asarray(labels, dtype=bool)
+    escalated = (probabilities >= safe_below) & (probabilities < malicious_at)
+    verdicts = probabilities >= threshold
+    final = np.where(escalated, labels if vt_verdicts is None else vt_verdicts, verdicts)
+    positives = max(int(labels.sum()), 1)
+    negatives = max(int((~labels).sum()), 1)
+    return {
+        "safe_below": safe_below,
+        "malicious_at": malicious_at,
+        "vt_call_rate": round(float(escalated.mean()), 4),
+        "accuracy": round(float((final == labels).mean()), 4),
+        "false_negative_rate": round(float((~final & labels).sum() / positives), 4),
+        "false_positive_rate": round(float((final & ~labels).sum() / negatives), 4),
+    }
+
+
+def read_labelled_csv(path, url_column, label_column, vt_column=None, limit=None):
+    urls, labels, vt_verdicts = [], [], []
+    with open(path, encoding="utf-8", newline="") as csv_file:
+        for row in csv.DictReader(csv_file):
+            if limit is not None and len(urls) >= limit:
+                break
+            urls.append(row[url_column])
+            labels.append(is_malicious_label(row[label_column]))
+            if vt_column:
+                vt_verdicts.append(is_malicious_label(row[vt_column]))
+    return urls, labels, (vt_verdicts if vt_column else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a labelled CSV through candidate cascade bands")
+    parser.add_argument("csv", help="CSV with a URL column and a label column (benign/0/safe = not malicious)")
+    parser.add_argument("--model", default="xgboost_model.npz", help="Model to score with (.npz or pickled .pkl)")
+    parser.add_argument("--url-column", default="url")
+    parser.add_argument("--label-column", default="type")
+    parser.add_argument("--vt-column", help="Column with recorded VirusTotal verdicts (default: take the label)")
+    parser.add_argument("--threshold", type=float, default=0.4, help="Model decision threshold")
+    parser.add_argument("--safe-below", type=float, nargs="+", default=[0.1, 0.2, 0.3, 0.4])
+    parser.add_argument("--malicious-at", type=float, nargs="+", default=[0.8, 0.9, 0.95, 0.99])
+    parser.add_argument("--max-call-rate", type=float, help="Also report the most accurate setting within this VT call rate")
+    parser.add_argument("--limit", type=int, help="Read at most this many rows")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    from tree_model import TreeEnsemble
+    from url_features import schema_for_model
+
+    if args.model.endswith(".npz"):
+        model = TreeEnsemble(args.model)
+    else:
+        with open(args.model, "rb") as model_file:
+            model = pickle.load(model_file)
+
+    schema = schema_for_model(model)
+    urls, labels, vt_verdicts = read_labelled_csv(
+        args.csv, args.url_column, args.label_column, args.vt_column, args.limit
+    )
+    if not urls:
+        sys.exit(f"{args.csv} has no rows")
+    probabilities = np.concatenate([
+        model.predict_proba(schema.extract(urls[start:start + 10000]))[:, 1]
+        for start in range(0, len(urls), 10000)
+    ])
+
+    # The threshold-only policy served before the cascade: everything flagged goes to VirusTotal
+    results = [dict(replay(probabilities, labels, args.threshold, args.threshold, math.inf, vt_verdicts),
+                    policy="threshold only")]
+    for safe_below in args.safe_below:
+        for malicious_at in args.malicious_at:
+            if safe_below <= malicious_at:
+                results.append(dict(replay(probabilities, labels, args.threshold, safe_below, malicious_at, vt_verdicts),
+                                    policy="cascade"))
+
+    print(f"{len(urls)} URLs, {sum(labels)} malicious, threshold {args.threshold}"
+          + ("" if args.vt_column else " (escalated URLs take the label as the VirusTotal verdict)"))
+    print(f"{'policy':<15} {'safe_below':>10} {'malicious_at':>12} {'vt_calls':>9} {'accuracy':>9} {'fnr':>7} {'fpr':>7}")
+    for result in results:
+        print(f"{result['policy']:<15} {result['safe_below']:>10g} {result['malicious_at']:>12g} "
+              f"{result['vt_call_rate']:>9.2%} {result['accuracy']:>9.2%} "
+              f"{result['false_negative_rate']:>7.2%} {result['false_positive_rate']:>7.2%}")
+
+    best = None
+    if args.max_call_rate is not None:
+        within = [result for result in results if result["vt_call_rate"] <= args.max_call_rate]
+        if within:
+            best = max(within, key=lambda result: (result["accuracy"], -result["vt_call_rate"]))
+            print(f"\nMost accurate within {args.max_call_rate:.2%} VT calls: "
+                  f"safe_below={best['safe_below']:g} malicious_at={best['malicious_at']:g} "
+                  f"({best['accuracy']:.2%} accuracy, {best['vt_call_rate']:.2%} VT calls)")
+        else:
+            print(f"\nNo setting stays within {args.max_call_rate:.2%} VT calls")
+
+    if args.output:
+        # JSON has no infinity; the threshold-only policy has no top band (null)
+        jsonable = lambda result: dict(result, malicious_at=None if math.isinf(result["malicious_at"]) else result["malicious_at"])
+        with open(args.output, "w") as output_file:
+            json.dump({
+                "urls": len(urls),
+                "threshold": args.threshold,
+                "best": jsonable(best) if best else None,
+                "results": [jsonable(result) for result in results]
+            }, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
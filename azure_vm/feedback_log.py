@@ -0,0 +1,44 @@
+import json
+import os
+import threading
+import time
+
+# Popup vote -> training label (0: Not malicious, 1: Malicious); None withdraws a vote
+VOTE_LABELS = {"tick": 0, "cross": 1, None: None}
+
+
+class FeedbackLog:
+    """
+    Append-only JSON-lines log of user votes from the popup.
+
+    Each vote is written as a single line with one O_APPEND write(), so
+    several worker processes can share the same log.
+    Records are never rewritten; a later vote for the same URL supersedes
+    earlier ones when the log is read back for training.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, url, vote, prediction=None, malicious_probability=None):
+        if vote not in VOTE_LABELS:
+            raise ValueError(f"Unknown vote: {vote!r}")
+        record = {
+            "time": time.time(),
+            "url": url,
+            "vote": vote,
+            "label": VOTE_LABELS[vote],
+            "prediction": prediction,
+            "malicious_probability": malicious_probability,
+        }
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        with self.lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        return record
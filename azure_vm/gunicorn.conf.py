@@ -0,0 +1,46 @@
+import gc
+import os
+
+# Pre-fork deployment of the prediction server:
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# The master imports app.py once (Flask, NumPy and the model), warms it up and
+# then forks the workers, which share those pages copy-on-write instead of
+# each importing and loading everything again. Workers are ready as soon as
+# they are forked; /ready reports it. A model hot-swapped later is loaded by
+# each worker on its own.
+
+# Keeps app.py from starting its threads in the master; see post_fork
+os.environ["PRELOAD_WORKERS"] = "1"
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+
+# A /verdict/<job_id> poll may land on a worker other than the one that queued
+# the job; with more than one worker, jobs and verdicts are shared through the
+# SQLite verdict store, at VERDICT_STORE_PATH or else next to this file
+if workers > 1:
+    os.environ.setdefault(
+        "VERDICT_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "verdicts.sqlite3")
+    )
+
+# /verdict long-polls hold a thread for up to MAX_VERDICT_WAIT seconds
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before any worker is forked
+    import app
+    app.warm_up()
+    server.log.info(f"Warmed up model {app.active_model.version} in {app.warm_up_seconds * 1000:.1f} ms")
+    # Objects loaded so far are never collected, so garbage collection in a
+    # worker does not write to (and un-share) the pages they live on
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import app
+    app.start_watchers()
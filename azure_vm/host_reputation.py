@@ -0,0 +1,175 @@
+import argparse
+import hashlib
+import os
+import threading
+from urllib.parse import urlsplit
+import numpy as np
+
+# Host allow/deny lists for /predict, checked before the model.
+#
+# Each list is a sorted array of 64-bit host hashes saved as .npy and
+# memory-mapped, so a million hosts cost 8 MB of page cache shared by every
+# worker process, and a lookup is a binary search of a few microseconds.
+# Build the arrays from plain lists (one host per line, "rank,host" CSVs such
+# as top-sites lists, hosts files or URL feeds):
+#
+#   python host_reputation.py top-1m.csv --output allow.npy
+#   python host_reputation.py urlhaus.txt phishing-hosts.txt --output deny.npy
+#
+# Hashes are exact (no false positives short of a 64-bit collision), which
+# matters for an allow list. A deny entry also covers its subdomains; an allow
+# entry only covers the host itself (and its "www." form), so subdomains of
+# shared hosting domains on top-sites lists are still scored.
+
+ALLOW = "allow"
+DENY = "deny"
+
+
+def normalize_host(host):
+    host = host.strip().lower().rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    return host
+
+
+def url_host(url):
+    url = url.strip()
+    try:
+        return normalize_host(urlsplit(url if "://" in url else "http://" + url).hostname or "")
+    except ValueError:
+        return ""
+
+
+def host_hash(host):
+    return int.from_bytes(hashlib.blake2b(host.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def parent_domains(host):
+    """The host and each parent domain with at least two labels, e.g. a.b.com, b.com."""
+    if host.replace(".", "").isdigit() or ":" in host:
+        return [host]
+    labels = host.split(".")
+    return [".".join(labels[i:]) for i in range(max(len(labels) - 1, 1))]
+
+
+def parse_host_line(line):
+    """Host from one line of a list file, or None for comments and blank lines."""
+    line = line.split("#", 1)[0].strip()
+    if not line:
+        return None
+    token = line.replace(",", " ").split()[-1]
+    host = url_host(token) if "/" in token else normalize_host(token.split(":", 1)[0])
+    return host or None
+
+
+def build_index(list_paths, output_path):
+    """
+    Hash every host in the list files into a sorted, de-duplicated uint64
+    array and save it atomically to `output_path` (.npy). Returns the count.
+    """
+    hashes = set()
+    for list_path in list_paths:
+        with open(list_path, encoding="utf-8", errors="replace") as list_file:
+            for line in list_file:
+                host = parse_host_line(line)
+                if host is not None:
+                    hashes.add(host_hash(host))
+
+    index = np.array(sorted(hashes), dtype="<u8")
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as index_file:
+        np.save(index_file, index)
+    os.replace(tmp_path, output_path)
+    return len(index)
+
+
+def _contains(index, hashes):
+    # Scalar searches: for a handful of hashes they beat building arrays per lookup
+    size = len(index)
+    for value in hashes:
+        value = np.uint64(value)
+        position = index.searchsorted(value)
+        if position < size and index[position] == value:
+            return True
+    return False
+
+
+class HostReputation:
+    """
+    Allow/deny lookups against memory-mapped host hash arrays.
+
+    reload() re-maps a list whose file changed (by mtime and size); arrays are
+    swapped as a whole, so lookups never see a half-loaded list. Files are
+    replaced atomically by build_index, so arrays still in use stay valid.
+    A list file that does not exist (yet) is logged and treated as empty
+    until a later reload() finds it.
+    """
+
+    def __init__(self, allow_path=None, deny_path=None):
+        self.paths = {ALLOW: allow_path, DENY: deny_path}
+        self.lists = {}
+        self.signatures = {}
+        self.missing = set()
+        self.lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Re-map changed list files; returns True if any list was swapped."""
+        with self.lock:
+            lists = dict(self.lists)
+            changed = False
+            for name, path in self.paths.items():
+                if not path:
+                    continue
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # Keep serving a list already loaded; log each missing file once
+                    if name not in self.missing:
+                        print(f"Host {name} list {path} not found, starting without it")
+                        self.missing.add(name)
+                    continue
+                self.missing.discard(name)
+                signature = (stat.st_mtime_ns, stat.st_size)
+                if signature == self.signatures.get(name):
+                    continue
+                index = np.load(path, mmap_mode="r")
+                if index.dtype != np.dtype("<u8") or index.ndim != 1:
+                    raise ValueError(f"{path} is not a host hash index")
+                # A plain ndarray view of the mapping indexes faster than np.memmap
+                lists[name] = np.asarray(index)
+                self.signatures[name] = signature
+                changed = True
+            self.lists = lists
+            return changed
+
+    def lookup(self, url):
+        """DENY if the host or a parent domain is denied, ALLOW if the host is allowed, else None."""
+        host = url_host(url)
+        if not host:
+            return None
+        lists = self.lists
+        deny = lists.get(DENY)
+        if deny is not None and _contains(deny, [host_hash(h) for h in parent_domains(host)]):
+            return DENY
+        allow = lists.get(ALLOW)
+        if allow is not None and _contains(allow, [host_hash(host)]):
+            return ALLOW
+        return None
+
+    def sizes(self):
+        return {name: len(index) for name, index in self.lists.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a host allow/deny index for /predict")
+    parser.add_argument("lists", nargs="+", help="Host, CSV, hosts-file or URL lists")
+    parser.add_argument("--output", required=True, help="Index file to write (.npy)")
+    args = parser.parse_args()
+
+    count = build_index(args.lists, args.output)
+    print(f"Wrote {count} hosts to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
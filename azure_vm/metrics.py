@@ -0,0 +1,207 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal Prometheus instrumentation (text exposition format 0.0.4) so the
+# web apps can serve /metrics without the prometheus_client package.
+# Metrics live in this process only; under several gunicorn workers each
+# scrape sees the worker that answered it.
+
+# Default latency buckets in seconds, from cache hits up to VirusTotal/Falcon Sandbox polls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Per-thread breakdown of stage timings for the request being served, when enabled
+_local = threading.local()
+
+
+def begin_timings():
+    """Start collecting stage timings for the current request (thread)."""
+    _local.timings = {}
+
+
+def timings_active():
+    return getattr(_local, "timings", None) is not None
+
+
+def end_timings():
+    """Stop collecting and return {stage: milliseconds}, or None if not collecting."""
+    timings = getattr(_local, "timings", None)
+    _local.timings = None
+    if timings is None:
+        return None
+    return {name: round(seconds * 1000, 3) for name, seconds in timings.items()}
+
+
+def record_timing(name, seconds):
+    timings = getattr(_local, "timings", None)
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames) or any(name not in labels for name in self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, (), value) for key, value in self.values.items()]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, with the +Inf bucket last, then sum and count
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, timing_name=None, **labels):
+        """
+        Observe the duration of the `with` block and add it to the current
+        request's timing breakdown under `timing_name` (default: the "stage"
+        label, else the metric name).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(elapsed, **labels)
+            record_timing(timing_name or labels.get("stage", self.name), elapsed)
+
+    def samples(self):
+        with self.lock:
+            states = [(key, list(state[0]), state[1], state[2]) for key, state in self.values.items()]
+        samples = []
+        for key, counts, total, count in states:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append((self.name + "_bucket", key, (("le", _format_value(bound)),), cumulative))
+            samples.append((self.name + "_sum", key, (), total))
+            samples.append((self.name + "_count", key, (), count))
+        return samples
+
+
+class CallbackMetric(_Metric):
+    """
+    A counter or gauge read from elsewhere at scrape time: `callback` returns
+    {label_values_tuple: value} (use () when there are no labels).
+    """
+
+    def __init__(self, name, documentation, metric_type, callback, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.type = metric_type
+        self.callback = callback
+
+    def samples(self):
+        return [(self.name, tuple(str(v) for v in key), (), value) for key, value in self.callback().items()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, metric_type, callback, labelnames=()):
+        return self.register(CallbackMetric(name, documentation, metric_type, callback, labelnames))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                # A failing callback must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, key, extra, value in samples:
+                lines.append(f"{name}{_format_labels(metric.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
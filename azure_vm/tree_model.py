@@ -0,0 +1,246 @@
+import json
+import math
+import os
+import sys
+import numpy as np
+
+# Version of the .npz layout written by export_tree_model()
+FORMAT_VERSION = 1
+
+
+def flatten_trees(model):
+    """
+    Flatten an XGBoost binary:logistic model (XGBClassifier or Booster) into
+    node arrays shared by every export format: global child indices (leaves
+    point to themselves), split feature, threshold (leaf value for leaves),
+    default direction, tree roots and the base margin.
+    """
+    booster = model.get_booster() if hasattr(model, "get_booster") else model
+    learner = json.loads(booster.save_raw("json"))["learner"]
+
+    objective = learner["objective"]["name"]
+    if objective != "binary:logistic":
+        raise ValueError(f"Unsupported objective: {objective}")
+
+    # base_score is "5E-1" in older dumps and "[5E-1]" in newer ones
+    base_score = float(str(learner["learner_model_param"]["base_score"]).strip("[]"))
+    trees = learner["gradient_booster"]["model"]["trees"]
+
+    left, right, feature, threshold, default_left, roots = [], [], [], [], [], []
+    for tree in trees:
+        if any(tree["split_type"]):
+            raise ValueError("Categorical splits are not supported")
+        offset = len(left)
+        roots.append(offset)
+        # Children are stored as global node indices; leaves point to themselves
+        for node, (l, r) in enumerate(zip(tree["left_children"], tree["right_children"])):
+            is_leaf = l == -1
+            left.append(offset + node if is_leaf else offset + l)
+            right.append(offset + node if is_leaf else offset + r)
+        feature.extend(tree["split_indices"])
+        # For leaves split_conditions holds the leaf value
+        threshold.extend(tree["split_conditions"])
+        default_left.extend(tree["default_left"])
+
+    return {
+        "left": np.array(left, dtype=np.int32),
+        "right": np.array(right, dtype=np.int32),
+        "feature": np.array(feature, dtype=np.int32),
+        "threshold": np.array(threshold, dtype=np.float32),
+        "default_left": np.array(default_left, dtype=bool),
+        "roots": np.array(roots, dtype=np.int32),
+        "base_margin": math.log(base_score / (1 - base_score)),
+        "feature_names": list(learner.get("feature_names") or []),
+    }
+
+
+def export_tree_model(model, path):
+    """
+    Write the model to a compact .npz of flat node arrays that TreeEnsemble
+    can score without importing xgboost. The file is replaced atomically, so
+    a server reloading it never sees a partial write.
+    """
+    trees = flatten_trees(model)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as model_file:
+        np.savez(
+            model_file,
+            format_version=np.int32(FORMAT_VERSION),
+            left=trees["left"],
+            right=trees["right"],
+            feature=trees["feature"],
+            threshold=trees["threshold"],
+            default_left=trees["default_left"],
+            roots=trees["roots"],
+            base_margin=np.float64(trees["base_margin"]),
+            feature_names=np.array(trees["feature_names"], dtype=str),
+        )
+    os.replace(tmp_path, path)
+
+
+def export_tree_model_json(model, path):
+    """
+    Write the model as a JSON tree array for the in-extension evaluator
+    (popup/url_model.js). Thresholds and leaf values are written as the
+    shortest decimal that rounds back to the same float32.
+    """
+    trees = flatten_trees(model)
+    thresholds = ",".join(
+        np.format_float_positional(value, unique=True, trim="-") for value in trees["threshold"]
+    )
+    document = json.dumps({
+        "format_version": FORMAT_VERSION,
+        "base_margin": trees["base_margin"],
+        "feature_names": trees["feature_names"],
+        "roots": trees["roots"].tolist(),
+        "left": trees["left"].tolist(),
+        "right": trees["right"].tolist(),
+        "feature": trees["feature"].tolist(),
+        "default_left": trees["default_left"].astype(int).tolist(),
+        "threshold": "__THRESHOLDS__",
+    }, separators=(",", ":"))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as model_file:
+        model_file.write(document.replace('"__THRESHOLDS__"', f"[{thresholds}]"))
+    os.replace(tmp_path, path)
+
+
+# The dense layout takes 2 ** max_depth slots per tree. Deeper ensembles
+# (e.g. lossguide / max_leaves models), or ones over the total slot budget,
+# are walked on the node arrays instead.
+MAX_DENSE_DEPTH = 16
+MAX_DENSE_SLOTS = 1 << 22
+
+
+class TreeEnsemble:
+    """
+    Pure-NumPy evaluator for models written by export_tree_model().
+
+    predict_proba() mirrors XGBClassifier.predict_proba: it returns an
+    (n, 2) array of [not_malicious, malicious] probabilities.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            if int(data["format_version"]) != FORMAT_VERSION:
+                raise ValueError(f"Unsupported tree model format: {int(data['format_version'])}")
+            self.left = data["left"]
+            self.right = data["right"]
+            self.feature = data["feature"]
+            self.threshold = data["threshold"]
+            self.default_left = data["default_left"]
+            self.roots = data["roots"]
+            self.base_margin = float(data["base_margin"])
+            self.feature_names = [str(name) for name in data["feature_names"]]
+        self.is_leaf = self.left == np.arange(len(self.left))
+        self.max_depth = self._max_depth()
+        self.dense = (self.max_depth <= MAX_DENSE_DEPTH
+                      and len(self.roots) * 2 ** self.max_depth <= MAX_DENSE_SLOTS)
+        if self.dense:
+            self._build_dense()
+
+    def _max_depth(self):
+        depth = 0
+        nodes = self.roots
+        while not self.is_leaf[nodes].all():
+            nodes = np.unique(np.concatenate([self.left[nodes], self.right[nodes]]))
+            depth += 1
+        return depth
+
+    def _build_dense(self):
+        """
+        Lay every tree out as a complete binary tree of depth max_depth, so
+        traversal is pure index arithmetic (child = 2 * i + 1 + go_right).
+        A leaf above the bottom level is copied into all of its bottom-level
+        slots, which makes the splits padded in below it irrelevant.
+        """
+        depth = self.max_depth
+        num_trees = len(self.roots)
+        num_internal = 2 ** depth - 1
+        self.dense_feature = np.zeros((num_trees, max(num_internal, 1)), dtype=np.int64)
+        self.dense_threshold = np.full((num_trees, max(num_internal, 1)), np.inf, dtype=np.float32)
+        self.dense_default_left = np.ones((num_trees, max(num_internal, 1)), dtype=bool)
+        self.dense_leaf = np.zeros((num_trees, 2 ** depth), dtype=np.float32)
+
+        for tree, root in enumerate(self.roots):
+            stack = [(int(root), 0, 0)]
+            while stack:
+                node, slot, level = stack.pop()
+                if self.is_leaf[node]:
+                    # Bottom-level slots covered by this leaf
+                    span = 2 ** (depth - level)
+                    first = (slot + 1) * span - 1 - num_internal
+                    self.dense_leaf[tree, first:first + span] = self.threshold[node]
+                    continue
+                self.dense_feature[tree, slot] = self.feature[node]
+                self.dense_threshold[tree, slot] = self.threshold[node]
+                self.dense_default_left[tree, slot] = self.default_left[node]
+                stack.append((int(self.left[node]), 2 * slot + 1, level + 1))
+                stack.append((int(self.right[node]), 2 * slot + 2, level + 1))
+
+        # Flattened so one gather serves all trees at once
+        self.tree_offsets = np.arange(num_trees, dtype=np.int64) * self.dense_feature.shape[1]
+        self.dense_feature = self.dense_feature.ravel()
+        self.dense_threshold = self.dense_threshold.ravel()
+        self.dense_default_left = self.dense_default_left.ravel()
+        self.leaf_offsets = np.arange(num_trees, dtype=np.int64) * self.dense_leaf.shape[1]
+        self.dense_leaf = self.dense_leaf.ravel()
+
+    def predict_margin(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n, num_features = X.shape
+        has_missing = np.isnan(X).any()
+        flat = X.ravel()
+        row_offsets = (np.arange(n, dtype=np.int64) * num_features)[:, None]
+        if not self.dense:
+            return self._predict_margin_sparse(flat, row_offsets, n, has_missing)
+
+        # One current slot per (row, tree); every step moves all of them down a level
+        slots = np.zeros((n, len(self.roots)), dtype=np.int64)
+        for _ in range(self.max_depth):
+            nodes = self.tree_offsets + slots
+            values = flat[row_offsets + self.dense_feature[nodes]]
+            go_left = values < self.dense_threshold[nodes]
+            if has_missing:
+                go_left = np.where(np.isnan(values), self.dense_default_left[nodes], go_left)
+            slots = 2 * slots + 2 - go_left
+
+        # Bottom-level slot -> leaf value
+        leaf_index = self.leaf_offsets + slots - (2 ** self.max_depth - 1)
+        leaves = self.dense_leaf[leaf_index]
+        return self.base_margin + leaves.sum(axis=1, dtype=np.float32)
+
+    def _predict_margin_sparse(self, flat, row_offsets, n, has_missing):
+        # One current node per (row, tree); leaves are their own children, so
+        # rows that reached one stay there for the remaining levels
+        nodes = np.tile(self.roots.astype(np.int64), (n, 1))
+        for _ in range(self.max_depth):
+            values = flat[row_offsets + self.feature[nodes]]
+            go_left = values < self.threshold[nodes]
+            if has_missing:
+                go_left = np.where(np.isnan(values), self.default_left[nodes], go_left)
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.base_margin + self.threshold[nodes].sum(axis=1, dtype=np.float32)
+
+    def predict_proba(self, X):
+        malicious = 1.0 / (1.0 + np.exp(-self.predict_margin(X)))
+        return np.column_stack([1.0 - malicious, malicious])
+
+
+# Convert an existing pickled model:
+#   python tree_model.py xgboost_model.pkl xgboost_model.npz
+#   python tree_model.py xgboost_model.pkl ../popup/url_model.json
+if __name__ == "__main__":
+    import pickle
+
+    if len(sys.argv) != 3:
+        print("Usage: python tree_model.py <model.pkl> <model.npz|model.json>")
+        sys.exit(1)
+
+    with open(sys.argv[1], "rb") as model_file:
+        model = pickle.load(model_file)
+    if sys.argv[2].endswith(".json"):
+        export_tree_model_json(model, sys.argv[2])
+    else:
+        export_tree_model(model, sys.argv[2])
+    print(f"Tree model exported to {sys.argv[2]}")
@@ -0,0 +1,236 @@
+import math
+from collections import namedtuple
+import numpy as np
+from url_tokenizer import FEATURE_NAMES_V2, extract_features_v2
+
+# Column order of the feature matrix, identical to FeatureExtractor.run()
+FEATURE_NAMES = [
+    "url_entropy",
+    "digits_num",
+    "length",
+    "params_num",
+    "fragments_num",
+    "subdomain_num",
+    "has_http",
+    "has_https",
+    "is_ip",
+]
+
+# URLs are processed in chunks to bound the flat per-chunk arrays (a few
+# int64 values per character)
+CHUNK_SIZE = 65536
+
+# Largest rows x alphabet histogram counted densely (int64 cells); chunks
+# with a wider alphabet, e.g. a few CJK URLs, are counted sparsely instead
+MAX_HISTOGRAM_CELLS = 1 << 22
+
+
+# Define the FeatureExtractor class (single-URL reference implementation)
+class FeatureExtractor:
+    def __init__(self, url=""):
+        self.url = self._preprocess_url(url)
+        self.domain = self.url.split('/')[0]
+
+    def _preprocess_url(self, url):
+        # Remove http, https, and www.
+        url = url.replace("http://", "").replace("https://", "").replace("www.", "")
+        return url.strip('/')
+
+    def url_entropy(self):
+        url_trimmed = self.url.strip()
+        entropy_distribution = [float(url_trimmed.count(c)) / len(url_trimmed) for c in dict.fromkeys(list(url_trimmed))]
+        return -sum([e * math.log(e, 2) for e in entropy_distribution if e > 0])
+
+    def digits_num(self):
+        return len([i for i in self.url if i.isdigit()])
+
+    def length(self):
+        return len(self.url)
+
+    def params_num(self):
+        return len(self.url.split('&')) - 1
+
+    def fragments_num(self):
+        return len(self.url.split('#')) - 1
+
+    def subdomain_num(self):
+        return len(self.domain.split('.')) - 1
+
+    def has_http(self):
+        return 'http' in self.url
+
+    def has_https(self):
+        return 'https' in self.url
+
+    def is_ip(self):
+        parts = self.domain.split('.')
+        # isdecimal(): int() rejects digits such as '²' that isdigit() accepts
+        if len(parts) == 4 and all(part.isdecimal() and 0 <= int(part) <= 255 for part in parts):
+            return True
+        return False
+
+    def run(self):
+        return {
+            "url_entropy": self.url_entropy(),
+            "digits_num": self.digits_num(),
+            "length": self.length(),
+            "params_num": self.params_num(),
+            "fragments_num": self.fragments_num(),
+            "subdomain_num": self.subdomain_num(),
+            "has_http": int(self.has_http()),
+            "has_https": int(self.has_https()),
+            "is_ip": int(self.is_ip()),
+        }
+
+
+def preprocess_url(url):
+    # Same normalisation as FeatureExtractor._preprocess_url
+    url = url.replace("http://", "").replace("https://", "").replace("www.", "")
+    return url.strip('/')
+
+
+def _entropy(url):
+    # Scalar fallback, used only for URLs with surrounding whitespace
+    url_trimmed = url.strip()
+    entropy_distribution = [float(url_trimmed.count(c)) / len(url_trimmed) for c in dict.fromkeys(list(url_trimmed))]
+    return -sum([e * math.log(e, 2) for e in entropy_distribution if e > 0])
+
+
+def _is_ip(domain):
+    parts = domain.split('.')
+    # isdecimal(): int() rejects digits such as '²' that isdigit() accepts
+    return len(parts) == 4 and all(part.isdecimal() and 0 <= int(part) <= 255 for part in parts)
+
+
+def _has_substring(codes, rows, n, needle):
+    # True for every row whose code points contain `needle` contiguously
+    width = len(needle)
+    if len(codes) < width:
+        return np.zeros(n, dtype=bool)
+    span = len(codes) - width + 1
+    match = rows[:span] == rows[width - 1:]
+    for offset, char in enumerate(needle):
+        match &= codes[offset:offset + span] == ord(char)
+    return np.bincount(rows[:span][match], minlength=n) > 0
+
+
+def _extract_chunk(urls, domains, out):
+    n = len(urls)
+    lengths = np.fromiter(map(len, urls), dtype=np.int64, count=n)
+    out[:, 2] = lengths
+
+    # One flat array of code points for the whole chunk, plus the row of each
+    codes = np.frombuffer("".join(urls).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    rows = np.repeat(np.arange(n), lengths)
+
+    # Per-row character counts as (row, count) pairs, one per distinct
+    # character of each URL, over the chunk's compacted alphabet
+    width = int(codes.max(initial=0)) + 1
+    present = np.bincount(codes, minlength=width) > 0
+    k = int(present.sum())
+    keys = rows * k + (np.cumsum(present) - 1)[codes]
+    if n * k <= MAX_HISTOGRAM_CELLS:
+        # A dense histogram is faster while rows x alphabet stays small
+        counts = np.bincount(keys, minlength=n * k)
+        pairs = np.flatnonzero(counts)
+        counts = counts[pairs]
+    else:
+        # Memory follows the chunk's length, however wide its alphabet
+        pairs, counts = np.unique(keys, return_counts=True)
+    pair_rows = pairs // k
+
+    # Shannon entropy: -sum(p * log2(p)) over the characters present
+    p = counts / lengths[pair_rows]
+    out[:, 0] = -np.bincount(pair_rows, weights=p * (np.log(p) / math.log(2)), minlength=n)
+    for i, url in enumerate(urls):
+        if url != url.strip():
+            out[i, 0] = _entropy(url)
+
+    # str.isdigit() of each distinct code point in the chunk
+    alphabet = np.flatnonzero(present)
+    is_digit = np.zeros(width, dtype=bool)
+    is_digit[alphabet] = [chr(c).isdigit() for c in alphabet.tolist()]
+    out[:, 1] = np.bincount(rows[is_digit[codes]], minlength=n)
+    out[:, 3] = np.bincount(rows[codes == ord('&')], minlength=n)
+    out[:, 4] = np.bincount(rows[codes == ord('#')], minlength=n)
+
+    subdomains = np.fromiter((d.count('.') for d in domains), dtype=np.int64, count=n)
+    out[:, 5] = subdomains
+
+    out[:, 6] = _has_substring(codes, rows, n, "http")
+    out[:, 7] = _has_substring(codes, rows, n, "https")
+
+    # Only dotted quads can be IPs, so the exact check runs on those rows alone
+    for i in np.flatnonzero(subdomains == 3):
+        out[i, 8] = _is_ip(domains[i])
+
+
+def extract_features(urls, preprocess=True):
+    """
+    Extract the FeatureExtractor features for many URLs at once.
+
+    Returns a float32 matrix of shape (len(urls), 9) whose columns follow
+    FEATURE_NAMES. With preprocess=True the URLs are normalised like the
+    serving FeatureExtractor; with preprocess=False they are used as-is, like
+    the FeatureExtractor in training/training.py.
+    """
+    urls = list(urls)
+    if preprocess:
+        urls = [preprocess_url(url) for url in urls]
+        domains = [url.split('/')[0] for url in urls]
+    else:
+        domains = [url.split('//')[-1].split('/')[0] for url in urls]
+
+    out = np.zeros((len(urls), len(FEATURE_NAMES)), dtype=np.float32)
+    for start in range(0, len(urls), CHUNK_SIZE):
+        stop = start + CHUNK_SIZE
+        _extract_chunk(urls[start:stop], domains[start:stop], out[start:stop])
+    return out
+
+
+def _extract_training_v1(urls):
+    return extract_features(urls, preprocess=False)
+
+
+# Versioned feature schemas, shared by training and serving. A model records
+# the schema it was trained on (registry metadata "feature_schema", and its
+# feature names), and is only ever scored with features from that schema.
+#
+#   extract           features of URLs as /predict receives them
+#   extract_training  features of URLs as they appear in the training CSV
+#   cache_key         the part of a URL its features depend on (ML cache key)
+#
+# v1 (FEATURE_NAMES) is served on preprocessed URLs but was trained on raw
+# ones, so has_http/has_https differ between the two; v2 (url_tokenizer.py)
+# extracts the same way in both.
+FeatureSchema = namedtuple("FeatureSchema", ["version", "names", "extract", "extract_training", "cache_key"])
+
+FEATURE_SCHEMAS = {
+    1: FeatureSchema(1, FEATURE_NAMES, extract_features, _extract_training_v1, preprocess_url),
+    2: FeatureSchema(2, FEATURE_NAMES_V2, extract_features_v2, extract_features_v2, str.strip),
+}
+
+# Schema of models that do not record one (trained before schemas were versioned)
+DEFAULT_FEATURE_SCHEMA = 1
+
+
+def schema_for_names(feature_names):
+    """
+    The FeatureSchema whose columns are `feature_names`; models without
+    feature names get DEFAULT_FEATURE_SCHEMA. Raises ValueError for names no
+    schema has.
+    """
+    if not feature_names:
+        return FEATURE_SCHEMAS[DEFAULT_FEATURE_SCHEMA]
+    for schema in FEATURE_SCHEMAS.values():
+        if list(feature_names) == schema.names:
+            return schema
+    raise ValueError(f"No feature schema has the features {list(feature_names)}")
+
+
+def schema_for_model(model):
+    """The FeatureSchema of a TreeEnsemble or a pickled XGBClassifier, from its feature names."""
+    names = getattr(model, "feature_names", None)
+    if names is None and hasattr(model, "get_booster"):
+        names = model.get_booster().feature_names
+    return schema_for_names(names)
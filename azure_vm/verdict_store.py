@@ -0,0 +1,204 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SingleFlight:
+    """
+    In-process request coalescing: concurrent run() calls for the same key
+    wait for the first caller's result instead of repeating the work.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def run(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines on one event loop: concurrent run() calls for
+    the same key await the first caller's task.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+
+    async def run(self, key, fn):
+        import asyncio  # Only the ASGI server gets here; the WSGI apps never import it
+
+        task = self.tasks.get(key)
+        if task is None:
+            task = self.tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self.tasks.pop(key, None))
+        # A cancelled waiter must not cancel the lookup the others are waiting on
+        return await asyncio.shield(task)
+
+
+class VerdictStore:
+    """
+    Verdicts persisted in SQLite (WAL mode) so every worker process on the
+    host shares upstream results and they survive restarts.
+
+    fetch() also deduplicates across processes: the first caller claims a
+    lease on (provider, key) and runs the lookup, while the others poll the
+    table for its result until the lease runs out.
+
+    Connections are opened lazily, one per thread and process: a store
+    created before a fork (gunicorn preload_app) hands the workers no open
+    SQLite handle, and one used before a fork is reopened in each child.
+    """
+
+    def __init__(self, path, lease=120, poll_interval=0.25):
+        self.path = path
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.local = threading.local()
+        # Connections inherited across a fork, kept open but never used
+        self.forked = []
+
+        conn = self._open()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                "provider TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, PRIMARY KEY (provider, key))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS inflight ("
+                "provider TEXT NOT NULL, key TEXT NOT NULL, owner TEXT NOT NULL, "
+                "lease_until REAL NOT NULL, PRIMARY KEY (provider, key))"
+            )
+            self._purge(conn)
+        finally:
+            conn.close()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _connect(self):
+        # sqlite3 connections must not be shared between threads, nor used across fork()
+        pid = os.getpid()
+        if getattr(self.local, "pid", None) != pid:
+            inherited = getattr(self.local, "conn", None)
+            if inherited is not None:
+                # Closing it here could drop this process's own locks on the database file
+                self.forked.append(inherited)
+            self.local.conn = self._open()
+            self.local.pid = pid
+        return self.local.conn
+
+    def get(self, provider, key):
+        """Return (value, remaining_ttl) for a live entry, else None."""
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM verdicts WHERE provider = ? AND key = ?",
+            (provider, key)
+        ).fetchone()
+        now = time.time()
+        if row is None or row[1] <= now:
+            return None
+        return json.loads(row[0]), row[1] - now
+
+    def set(self, provider, key, value, ttl):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO verdicts (provider, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (provider, key, json.dumps(value), time.time() + ttl)
+        )
+
+    def fetch(self, provider, key, lookup, ttl_for):
+        """
+        Return the stored verdict for (provider, key), or run `lookup` once
+        across all processes sharing the store and persist its result for
+        ttl_for(result) seconds. A None result is returned but not stored.
+        """
+        owner = f"{os.getpid()}-{threading.get_ident()}"
+        deadline = time.time() + self.lease
+
+        while True:
+            cached = self.get(provider, key)
+            if cached is not None:
+                return cached[0]
+            if self._claim(provider, key, owner):
+                break
+            # The lease holder died or is stuck; stop waiting and look up ourselves
+            if time.time() >= deadline:
+                break
+            time.sleep(self.poll_interval)
+
+        try:
+            value = lookup()
+            if value is not None:
+                self.set(provider, key, value, ttl_for(value))
+            return value
+        finally:
+            self._release(provider, key, owner)
+
+    def purge(self):
+        self._purge(self._connect())
+
+    def _purge(self, conn):
+        now = time.time()
+        conn.execute("DELETE FROM verdicts WHERE expires_at <= ?", (now,))
+        conn.execute("DELETE FROM inflight WHERE lease_until <= ?", (now,))
+
+    def _claim(self, provider, key, owner):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT lease_until FROM inflight WHERE provider = ? AND key = ?",
+                (provider, key)
+            ).fetchone()
+            if row is not None and row[0] > now:
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO inflight (provider, key, owner, lease_until) VALUES (?, ?, ?, ?)",
+                (provider, key, owner, now + self.lease)
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _release(self, provider, key, owner):
+        self._connect().execute(
+            "DELETE FROM inflight WHERE provider = ? AND key = ? AND owner = ?",
+            (provider, key, owner)
+        )
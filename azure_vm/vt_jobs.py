@@ -0,0 +1,167 @@
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobQueueFull(Exception):
+    """Raised by submit() when `max_pending` lookups are already waiting or running."""
+
+
+class VirusTotalJobs:
+    """
+    Background queue for VirusTotal lookups.
+
+    submit() hands a URL to a worker pool and returns a job id straight away;
+    the worker runs `check` (the slow submit + poll) and stores its result.
+    At most `max_pending` jobs are queued or running; beyond that submit()
+    raises JobQueueFull. Finished jobs are kept for `ttl` seconds so clients
+    can collect them, and pruned on every submit() and get().
+    """
+
+    def __init__(self, check, max_workers=8, ttl=600, max_pending=1000, clock=time.monotonic):
+        self.check = check
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self.clock = clock
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vt-worker")
+        self.jobs = {}
+        # Finished job ids, oldest first
+        self.finished = deque()
+        self.pending_count = 0
+        self.condition = threading.Condition()
+
+    def submit(self, url):
+        job_id = uuid.uuid4().hex
+        with self.condition:
+            self._prune()
+            if self.pending_count >= self.max_pending:
+                raise JobQueueFull(f"VirusTotal queue is full ({self.max_pending} lookups pending)")
+            self.jobs[job_id] = {
+                "job_id": job_id,
+                "url": url,
+                "status": "pending",
+                "result": None,
+                "finished_at": None,
+            }
+            self.pending_count += 1
+        self.executor.submit(self._run, job_id, url)
+        return job_id
+
+    def get(self, job_id, wait=0):
+        # Long-poll: block up to `wait` seconds for a pending job to finish
+        deadline = time.monotonic() + wait
+        with self.condition:
+            self._prune()
+            job = self.jobs.get(job_id)
+            while job is not None and job["status"] == "pending":
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+                job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def pending(self):
+        with self.condition:
+            return self.pending_count
+
+    def _run(self, job_id, url):
+        try:
+            result = self.check(url)
+        except Exception as e:
+            result = {"risk": "Malicious", "error": f"VT job error: {str(e)}", "stats": {}}
+        with self.condition:
+            job = self.jobs[job_id]
+            job["status"] = "completed"
+            job["result"] = result
+            job["finished_at"] = self.clock()
+            self.pending_count -= 1
+            self.finished.append(job_id)
+            self.condition.notify_all()
+
+    def _prune(self):
+        # Jobs finish in order, so the expired ones are at the front
+        cutoff = self.clock() - self.ttl
+        while self.finished and self.jobs[self.finished[0]]["finished_at"] < cutoff:
+            del self.jobs[self.finished.popleft()]
+
+
+class AsyncVirusTotalJobs:
+    """
+    asyncio counterpart of VirusTotalJobs for the ASGI server (asgi.py).
+
+    Each lookup is a task on the event loop instead of a worker thread, so a
+    pending lookup costs a coroutine rather than a blocked thread. `check` is
+    a coroutine function; submit() and get() must be called on the loop.
+    Pending jobs are capped and finished ones pruned as in VirusTotalJobs.
+    """
+
+    def __init__(self, check, ttl=600, max_pending=1000, clock=time.monotonic):
+        self.check = check
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self.clock = clock
+        self.jobs = {}
+        self.done = {}
+        self.finished = deque()
+        self.tasks = set()
+        # Read by the metrics scrape from another thread, so kept as a plain counter
+        self.pending_count = 0
+
+    def submit(self, url):
+        import asyncio  # Only the ASGI server gets here; the WSGI app never imports it
+
+        job_id = uuid.uuid4().hex
+        self._prune()
+        if self.pending_count >= self.max_pending:
+            raise JobQueueFull(f"VirusTotal queue is full ({self.max_pending} lookups pending)")
+        self.jobs[job_id] = {
+            "job_id": job_id,
+            "url": url,
+            "status": "pending",
+            "result": None,
+            "finished_at": None,
+        }
+        self.done[job_id] = asyncio.Event()
+        self.pending_count += 1
+        task = asyncio.get_running_loop().create_task(self._run(job_id, url))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return job_id
+
+    async def get(self, job_id, wait=0):
+        import asyncio
+
+        # Long-poll: wait up to `wait` seconds for a pending job to finish
+        self._prune()
+        done = self.done.get(job_id)
+        if done is not None and wait > 0:
+            try:
+                await asyncio.wait_for(done.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        job = self.jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def pending(self):
+        return self.pending_count
+
+    async def _run(self, job_id, url):
+        try:
+            result = await self.check(url)
+        except Exception as e:
+            result = {"risk": "Malicious", "error": f"VT job error: {str(e)}", "stats": {}}
+        job = self.jobs[job_id]
+        job["status"] = "completed"
+        job["result"] = result
+        job["finished_at"] = self.clock()
+        self.pending_count -= 1
+        self.finished.append(job_id)
+        self.done.pop(job_id).set()
+
+    def _prune(self):
+        cutoff = self.clock() - self.ttl
+        while self.finished and self.jobs[self.finished[0]]["finished_at"] < cutoff:
+            del self.jobs[self.finished.popleft()]
@@ -32,4 +32,249 @@ chrome.webNavigation.onCommitted.addListener((details) => {
       });
     }
   });
-  
\ No newline at end of file
+  
+// --------------------------------------------------------------------------
+// Verdict cache shared by every popup and tab.
+// Predictions are kept in chrome.storage.local keyed by URL, with a TTL per
+// verdict and LRU eviction once MAX_CACHE_ENTRIES is exceeded. Only cache
+// misses are sent to /predict/batch, and concurrent requests for the same URL
+// share one fetch.
+const API_URL_BATCH = "http://52.175.16.74:5000/predict/batch";
+
+// Most URLs the server accepts in one /predict/batch request (MAX_BATCH_SIZE)
+const MAX_BATCH_URLS = 1000;
+
+const CACHE_STORAGE_KEY = "verdictCache";
+// New entries are written to chrome.storage.session within JOURNAL_DELAY_MS,
+// and only folded into the chrome.storage.local copy in batches, so a service
+// worker suspended before a batch is written keeps them
+const JOURNAL_STORAGE_KEY = "verdictJournal";
+const JOURNAL_DELAY_MS = 50;
+const MAX_CACHE_ENTRIES = 2000;
+const CACHE_TTL_MS = {
+  Safe: 6 * 60 * 60 * 1000,
+  Malicious: 24 * 60 * 60 * 1000,
+  Pending: 60 * 1000,  // VirusTotal still running; the job id is only worth reusing briefly
+  Retry: 30 * 1000     // VirusTotal skipped (rate limited) or failed; ask again soon
+};
+
+// Map order is least recently used first: hits and sets re-insert their key
+let verdictCache = null;        // cache key -> { value, expiresAt }
+let verdictJournal = {};        // entries set since the last batch write
+let cacheLoading = null;
+let persistTimer = null;
+let journalTimer = null;
+const inflightPredictions = new Map();
+
+// Hosts the server has answered for without a deny-list hit. The popup only
+// answers a link from its local model once the link's host is in here, so a
+// denied host is never shown as Safe. Entries expire so deny-list updates apply.
+const HOST_CLEARANCE_TTL_MS = 10 * 60 * 1000;
+const MAX_CLEARED_HOSTS = 5000;
+const clearedHosts = new Map();  // hostname -> expiresAt
+
+function urlHostname(url) {
+  try {
+    return new URL(url).hostname.toLowerCase();
+  } catch (error) {
+    return null;
+  }
+}
+
+function recordClearance(url, prediction) {
+  const host = urlHostname(url);
+  if (!host) return;
+  if (prediction.reputation === "deny") {
+    clearedHosts.delete(host);
+    return;
+  }
+  // Re-insert so Map order stays oldest-first for eviction
+  clearedHosts.delete(host);
+  clearedHosts.set(host, Date.now() + HOST_CLEARANCE_TTL_MS);
+  if (clearedHosts.size > MAX_CLEARED_HOSTS) {
+    clearedHosts.delete(clearedHosts.keys().next().value);
+  }
+}
+
+function isHostCleared(url) {
+  const host = urlHostname(url);
+  const expiresAt = host && clearedHosts.get(host);
+  if (!expiresAt) return false;
+  if (expiresAt > Date.now()) return true;
+  clearedHosts.delete(host);
+  return false;
+}
+
+// Every part of the URL is a model input (fragments_num counts "#"), so the
+// key is the whole URL; it matches the server's ML cache key for schema v2
+function cacheKey(url) {
+  return url.trim();
+}
+
+function loadCache() {
+  if (verdictCache) return Promise.resolve(verdictCache);
+  if (!cacheLoading) {
+    cacheLoading = Promise.all([
+      chrome.storage.local.get(CACHE_STORAGE_KEY),
+      chrome.storage.session.get(JOURNAL_STORAGE_KEY)
+    ]).then(([stored, session]) => {
+      // Stored as a plain object, whose key order is the Map's
+      verdictCache = new Map(Object.entries(stored[CACHE_STORAGE_KEY] || {}));
+      // Entries the last service worker set but did not get to write in a batch
+      verdictJournal = session[JOURNAL_STORAGE_KEY] || {};
+      for (const [key, entry] of Object.entries(verdictJournal)) {
+        verdictCache.delete(key);
+        verdictCache.set(key, entry);
+      }
+      if (Object.keys(verdictJournal).length) persistCache();
+      return verdictCache;
+    });
+  }
+  return cacheLoading;
+}
+
+// Writes to chrome.storage.local are batched so a page scan does not rewrite
+// the whole cache once per link; the journal is cleared once a batch is stored.
+// (Only recency updates made since the last batch can be lost on suspension.)
+function persistCache() {
+  if (persistTimer) return;
+  persistTimer = setTimeout(() => {
+    persistTimer = null;
+    verdictJournal = {};
+    chrome.storage.local.set({ [CACHE_STORAGE_KEY]: Object.fromEntries(verdictCache) })
+      .then(() => chrome.storage.session.set({ [JOURNAL_STORAGE_KEY]: verdictJournal }));
+  }, 500);
+}
+
+// The journal is written once per burst of sets rather than on every set
+function persistJournal() {
+  if (journalTimer) return;
+  journalTimer = setTimeout(() => {
+    journalTimer = null;
+    chrome.storage.session.set({ [JOURNAL_STORAGE_KEY]: verdictJournal });
+  }, JOURNAL_DELAY_MS);
+}
+
+function cacheTtl(prediction) {
+  if (prediction.virustotal === "Pending") return CACHE_TTL_MS.Pending;
+  if (prediction.virustotal === "Rate limited" || prediction.virustotal_error) return CACHE_TTL_MS.Retry;
+  const verdict = prediction.virustotal === "Safe" || prediction.virustotal === "Malicious"
+    ? prediction.virustotal
+    : prediction.prediction;
+  return CACHE_TTL_MS[verdict] || CACHE_TTL_MS.Pending;
+}
+
+function cacheSet(key, value) {
+  const entry = { value, expiresAt: Date.now() + cacheTtl(value) };
+  verdictCache.delete(key);
+  verdictCache.set(key, entry);
+  verdictJournal[key] = entry;
+  persistJournal();
+
+  // Evict least recently used entries once the cache is over its bound
+  while (verdictCache.size > MAX_CACHE_ENTRIES) {
+    verdictCache.delete(verdictCache.keys().next().value);
+  }
+  persistCache();
+}
+
+// Send the URLs of `misses` (cache key -> URL) to /predict/batch, one request
+// per MAX_BATCH_URLS, and register one in-flight promise per key. Items the
+// server answers with an error reject their own promise and are not cached.
+function requestPredictions(misses) {
+  const entries = [...misses];
+  for (let start = 0; start < entries.length; start += MAX_BATCH_URLS) {
+    const chunk = entries.slice(start, start + MAX_BATCH_URLS);
+    const request = fetch(API_URL_BATCH, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ urls: chunk.map(([, url]) => url) }),
+    })
+      .then(response => {
+        if (!response.ok) throw new Error(`API Error: ${response.statusText}`);
+        return response.json();
+      })
+      .then(data => data.results);
+
+    chunk.forEach(([key, url], i) => {
+      const prediction = request
+        .then(results => {
+          const prediction = results[i];
+          if (prediction.error) throw new Error(prediction.error);
+          recordClearance(url, prediction);
+          cacheSet(key, prediction);
+          return prediction;
+        })
+        .finally(() => inflightPredictions.delete(key));
+      inflightPredictions.set(key, prediction);
+    });
+  }
+}
+
+// Predictions for `urls`, in order; a URL that could not be scored gets
+// { url, error } in its place
+async function getPredictions(urls) {
+  const cache = await loadCache();
+  const now = Date.now();
+  const keys = urls.map(cacheKey);
+  const results = new Array(urls.length);
+  const misses = new Map();
+
+  keys.forEach((key, i) => {
+    const entry = cache.get(key);
+    if (entry && entry.expiresAt > now) {
+      // Re-insert as the most recently used
+      cache.delete(key);
+      cache.set(key, entry);
+      results[i] = { ...entry.value, url: urls[i] };
+      return;
+    }
+    if (entry) cache.delete(key);
+    if (!inflightPredictions.has(key)) misses.set(key, urls[i]);
+  });
+  if (misses.size < urls.length) persistCache();
+
+  requestPredictions(misses);
+  const pending = keys.map((key, i) => results[i] ? null : inflightPredictions.get(key));
+  await Promise.all(pending.map(async (request, i) => {
+    if (!request) return;
+    try {
+      results[i] = { ...(await request), url: urls[i] };
+    } catch (error) {
+      results[i] = { url: urls[i], error: error.message };
+    }
+  }));
+  return results;
+}
+
+// A popup reports the VirusTotal verdict of a job it polled to completion
+async function storeVerdict(url, verdict) {
+  const cache = await loadCache();
+  const key = cacheKey(url);
+  const entry = cache.get(key);
+  if (!entry) return;
+  cacheSet(key, {
+    ...entry.value,
+    virustotal: verdict.virustotal,
+    virustotal_stats: verdict.virustotal_stats,
+    virustotal_error: verdict.virustotal_error,
+    virustotal_job: null
+  });
+}
+
+chrome.runtime.onMessage.addListener((message, sender, sendResponse) => {
+  if (message.type === "predictBatch") {
+    getPredictions(message.urls)
+      .then(predictions => sendResponse({ predictions }))
+      .catch(error => sendResponse({ error: error.message }));
+    return true;  // keep the channel open for the async response
+  }
+  if (message.type === "hostCleared") {
+    sendResponse({ cleared: isHostCleared(message.url) });
+    return;
+  }
+  if (message.type === "storeVerdict") {
+    storeVerdict(message.url, message.verdict).then(() => sendResponse({}));
+    return true;
+  }
+});
@@ -0,0 +1,104 @@
+import argparse
+import itertools
+import os
+import pickle
+import sys
+import warnings
+from corpus import make_urls
+from results import REPO_ROOT, compare, measure, write_results
+
+# Micro-benchmarks of the /predict scoring path: feature extraction (the
+# reference FeatureExtractor, the vectorized schema 1 extract_features and
+# the single-pass schema 2 tokenizer) and predict_proba at batch sizes from
+# 1 to 10k, for the NumPy tree evaluator and the pickled XGBClassifier.
+#
+#   python bench_models.py --output models.json
+#   python bench_models.py --output models-new.json --compare models.json
+#
+# Timings use results.measure rather than pytest-benchmark, so these results
+# are JSON files in the same format (and with the same --compare) as those of
+# load_generator.py and bench_startup.py. tests/test_benchmarks.py runs every
+# benchmark here once, at small sizes, as part of the test suite.
+
+sys.path.insert(0, os.path.join(REPO_ROOT, "azure_vm"))
+from tree_model import TreeEnsemble  # noqa: E402
+from url_features import FeatureExtractor, extract_features  # noqa: E402
+from url_tokenizer import extract_features_v2, url_features_v2  # noqa: E402
+
+DEFAULT_SIZES = [1, 10, 100, 1000, 10000]
+
+
+def bench_feature_extraction(urls, sizes, min_time):
+    results = {}
+    url_cycle = itertools.cycle(urls)
+    results["feature_extractor_run/per_url"] = measure(lambda: FeatureExtractor(next(url_cycle)).run(), min_time=min_time)
+    results["url_features_v2/per_url"] = measure(lambda: url_features_v2(next(url_cycle)), min_time=min_time)
+    for size in sizes:
+        batch = urls[:size]
+        results[f"feature_extractor_run/batch_{size}"] = measure(
+            lambda: [FeatureExtractor(url).run() for url in batch], min_time=min_time
+        )
+        results[f"extract_features/batch_{size}"] = measure(lambda: extract_features(batch), min_time=min_time)
+        results[f"extract_features_v2/batch_{size}"] = measure(lambda: extract_features_v2(batch), min_time=min_time)
+    return results
+
+
+def bench_predict_proba(name, model, features, sizes, min_time):
+    results = {}
+    for size in sizes:
+        batch = features[:size]
+        results[f"predict_proba/{name}/batch_{size}"] = measure(lambda: model.predict_proba(batch), min_time=min_time)
+    return results
+
+
+def load_models(npz_path, pkl_path):
+    models = {}
+    if npz_path and os.path.exists(npz_path):
+        models["tree_ensemble"] = TreeEnsemble(npz_path)
+    if pkl_path and os.path.exists(pkl_path):
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                with open(pkl_path, "rb") as model_file:
+                    models["xgboost"] = pickle.load(model_file)
+        except ImportError:
+            print("xgboost is not installed; skipping the pickled model")
+    return models
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark feature extraction and model scoring")
+    parser.add_argument("--model-npz", default=os.path.join(REPO_ROOT, "training", "xgboost_model.npz"))
+    parser.add_argument("--model-pkl", default=os.path.join(REPO_ROOT, "training", "xgboost_model.pkl"))
+    parser.add_argument("--corpus", help="CSV with a 'url' column (default: synthetic URLs)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Batch sizes")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Seconds spent timing each benchmark")
+    parser.add_argument("--output", default="bench_models.json", help="JSON results file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Slowdown flagged as a regression")
+    args = parser.parse_args()
+
+    urls = make_urls(max(args.sizes), corpus_path=args.corpus)
+    features = extract_features(urls)
+
+    results = bench_feature_extraction(urls, args.sizes, args.min_time)
+    for name, model in load_models(args.model_npz, args.model_pkl).items():
+        results.update(bench_predict_proba(name, model, features, args.sizes, args.min_time))
+
+    for name, result in results.items():
+        size = int(name.rsplit("_", 1)[1]) if "/batch_" in name else 1
+        result["per_url_us"] = round(result["p50_ms"] * 1000 / size, 3)
+        print(f"{name:<45} p50 {result['p50_ms']:>10.4f} ms  p99 {result['p99_ms']:>10.4f} ms  "
+              f"{result['per_url_us']:>9.3f} us/url")
+
+    document = write_results(args.output, "models", results, config={
+        "sizes": args.sizes,
+        "corpus": args.corpus or "synthetic",
+        "min_time": args.min_time,
+    })
+    if args.compare and compare(args.compare, document, tolerance=args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
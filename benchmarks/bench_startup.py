@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import requests
+from results import REPO_ROOT, compare, summarize, write_results
+
+# Cold-start benchmark of the prediction server (azure_vm):
+#
+# - import: `import app` in a fresh interpreter (model load included), and
+#   warm_up() after it, plus the slowest modules from -X importtime;
+# - per server mode, the time from spawning the process to /ready answering
+#   200, then the latency of the first and second /predict.
+#
+# Modes: "flask" (python app.py) and "gunicorn" (gunicorn -c gunicorn.conf.py,
+# the model preloaded in the master and forked into the workers).
+#
+#   python bench_startup.py --output startup.json
+#   python bench_startup.py --model ../training/xgboost_model.pkl --output startup-pkl.json
+#   python bench_startup.py --output startup-new.json --compare startup.json
+
+APP_DIR = os.path.join(REPO_ROOT, "azure_vm")
+
+IMPORT_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.warm_up()
+print(json.dumps({"import": imported - start, "warm_up": time.perf_counter() - imported}))
+"""
+
+FIRST_URL = "http://login-verify.example-bank.xyz/account/update.php?session=1"
+SECOND_URL = "https://www.example.org/docs/index.html"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def app_env(model):
+    # No watcher threads or VirusTotal traffic while timing
+    return {**os.environ, "MODEL_PATH": model, "MODEL_RELOAD_INTERVAL": "0",
+            "VIRUSTOTAL_API_URL": "http://127.0.0.1:9"}
+
+
+def bench_import(model, runs):
+    imports, warm_ups = [], []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT], cwd=APP_DIR, check=True, capture_output=True, text=True,
+            env={**app_env(model), "PRELOAD_WORKERS": "1"}
+        ).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        imports.append(timings["import"])
+        warm_ups.append(timings["warm_up"])
+    return {"import_app": summarize(imports), "warm_up": summarize(warm_ups)}
+
+
+def slowest_imports(model, count=10):
+    """Top-level modules by cumulative import time (microseconds), from -X importtime."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"], cwd=APP_DIR, check=True,
+        capture_output=True, text=True, env={**app_env(model), "PRELOAD_WORKERS": "1"}
+    ).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit() and name.startswith("   ") and not name.startswith("    "):
+            modules.append((int(cumulative), name.strip()))
+    return {name: microseconds for microseconds, name in sorted(modules, reverse=True)[:count]}
+
+
+def server_command(mode, port):
+    if mode == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}", "app:app"]
+    return [sys.executable, "app.py"]
+
+
+def bench_server(mode, model, runs, timeout):
+    to_ready, first, second = [], [], []
+    for _ in range(runs):
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        log = tempfile.TemporaryFile(mode="w+")
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            server_command(mode, port), cwd=APP_DIR, env={**app_env(model), "PORT": str(port)},
+            stdout=log, stderr=subprocess.STDOUT
+        )
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                if process.poll() is not None:
+                    log.seek(0)
+                    raise RuntimeError(f"{mode} server exited with code {process.returncode}:\n{log.read()[-2000:]}")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{mode} server was not ready within {timeout}s")
+                try:
+                    if requests.get(base_url + "/ready", timeout=1).status_code == 200:
+                        break
+                except requests.exceptions.RequestException:
+                    pass
+                time.sleep(0.01)
+            to_ready.append(time.perf_counter() - start)
+
+            for url, samples in ((FIRST_URL, first), (SECOND_URL, second)):
+                request_start = time.perf_counter()
+                requests.post(base_url + "/predict", json={"url": url}, timeout=10).raise_for_status()
+                samples.append(time.perf_counter() - request_start)
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+    return {
+        f"{mode}/time_to_ready": summarize(to_ready),
+        f"{mode}/first_predict": summarize(first),
+        f"{mode}/second_predict": summarize(second),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prediction server cold-start benchmark")
+    parser.add_argument("--model", default=os.path.join(REPO_ROOT, "training", "xgboost_model.npz"),
+                        help="MODEL_PATH for the app (.npz, or .pkl to include the xgboost import)")
+    parser.add_argument("--modes", nargs="+", default=["flask", "gunicorn"], choices=["flask", "gunicorn"])
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts per measurement")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for /ready")
+    parser.add_argument("--output", default="bench_startup.json", help="JSON results file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Slowdown flagged as a regression")
+    args = parser.parse_args()
+
+    results = bench_import(args.model, args.runs)
+    for mode in args.modes:
+        results.update(bench_server(mode, args.model, args.runs, args.timeout))
+
+    imports = slowest_imports(args.model)
+    print("Slowest imports (cumulative ms):")
+    for name, microseconds in imports.items():
+        print(f"  {name:<30} {microseconds / 1000:>8.1f}")
+    for name, summary in results.items():
+        print(f"{name:<30} p50 {summary['p50_ms']:>10.2f} ms  max {summary['max_ms']:>10.2f} ms")
+
+    document = write_results(args.output, "startup", results, config={
+        "model": args.model,
+        "runs": args.runs,
+        "slowest_imports_us": imports,
+    })
+    if args.compare and compare(args.compare, document, tolerance=args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import random
+import string
+
+# Hand-picked URLs from the test pages, mixed into every synthetic corpus
+SAMPLE_URLS = [
+    "https://www.google.com/finance?cid=6512",
+    "http://www.stock888.cn/",
+    "https://xsite.singaporetech.edu.sg",
+    "https://i1.wp.com/",
+    "https://123moviesz.site/",
+    "http://77.247.88.118:44946/bin.sh",
+    "http://122.114.193.75/demon.x64.exe.dll",
+    "https://raw.githubusercontent.com/crypto101/crypto101.github.io/master/Crypto101.pdf",
+]
+
+TLDS = ["com", "net", "org", "cn", "ru", "site", "io", "edu.sg", "xyz"]
+
+
+def make_urls(n, seed=42, corpus_path=None):
+    """
+    Return `n` benchmark URLs: the first `n` rows of a CSV with a 'url'
+    column if `corpus_path` is given, otherwise a deterministic synthetic mix
+    of domain, IP, query-string and fragment URLs of realistic lengths.
+    """
+    if corpus_path:
+        import pandas as pd
+        urls = pd.read_csv(corpus_path, usecols=["url"], nrows=n)["url"].astype(str).tolist()
+        return (urls * (n // max(len(urls), 1) + 1))[:n]
+
+    rng = random.Random(seed)
+    word = lambda k: "".join(rng.choices(string.ascii_lowercase + string.digits, k=k))
+    urls = []
+    while len(urls) < n:
+        if len(urls) < len(SAMPLE_URLS):
+            urls.append(SAMPLE_URLS[len(urls)])
+            continue
+        scheme = rng.choice(["http://", "https://", ""])
+        if rng.random() < 0.1:
+            host = ".".join(str(rng.randrange(256)) for _ in range(4))
+        else:
+            host = ".".join([rng.choice(["www", word(3), word(6)])] + [word(rng.randint(3, 12))] * rng.randint(1, 2)) + "." + rng.choice(TLDS)
+        path = "/".join(word(rng.randint(2, 10)) for _ in range(rng.randint(0, 4)))
+        query = "&".join(f"{word(3)}={word(rng.randint(1, 8))}" for _ in range(rng.randint(0, 3)))
+        url = f"{scheme}{host}/{path}"
+        if query:
+            url += "?" + query
+        if rng.random() < 0.05:
+            url += "#" + word(5)
+        urls.append(url)
+    return urls
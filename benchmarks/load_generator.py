@@ -0,0 +1,209 @@
+import argparse
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+import requests
+from corpus import make_urls
+from results import REPO_ROOT, compare, summarize, write_results
+from stub_servers import start_stub_servers, stop_stub_servers
+
+# End-to-end load test: concurrent clients POST to /predict, /predict/batch
+# or /checkDownloadable for a fixed time per concurrency level and report
+# requests per second and p50/p99 latency.
+#
+# Against a server that is already running:
+#   python load_generator.py --target predict --url http://127.0.0.1:5000
+#
+# Or start the stub upstreams and the matching app locally first:
+#   python load_generator.py --target predict --start-stack --concurrency 1 8 32
+#   python load_generator.py --target downloadable --start-stack --falcon-latency 0.5
+#   python load_generator.py --target predict --start-stack --asgi   (azure_vm/asgi.py under uvicorn)
+
+# Upper bound on distinct URLs generated per concurrency level
+MAX_URLS = 200000
+
+APPS = {
+    "predict": ("azure_vm", "app.py"),
+    "batch": ("azure_vm", "app.py"),
+    "downloadable": ("ryaner_vm", "webapp.py"),
+}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(target, env, timeout=60, asgi=False):
+    """
+    Run the app serving `target` (its ASGI entry point if `asgi`) in a
+    subprocess with `env` added and wait until it answers.
+    Returns (process, base_url).
+    """
+    directory, script = APPS[target]
+    if asgi:
+        if directory != "azure_vm":
+            raise ValueError(f"No ASGI server for --target {target}")
+        script = "asgi.py"
+    port = _free_port()
+    log = tempfile.TemporaryFile(mode="w+")
+    process = subprocess.Popen(
+        [sys.executable, script],
+        cwd=os.path.join(REPO_ROOT, directory),
+        env={**os.environ, **env, "PORT": str(port), "MODEL_RELOAD_INTERVAL": "0"},
+        stdout=log,
+        stderr=subprocess.STDOUT
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            log.seek(0)
+            output = log.read()[-2000:]
+            raise RuntimeError(f"{script} exited with code {process.returncode}:\n{output}")
+        try:
+            requests.get(base_url + "/", timeout=1)
+            return process, base_url
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{script} did not start within {timeout}s")
+
+
+def make_payloads(target, count, cached, batch_size, files_url):
+    # Distinct URLs per request exercise the cache-miss path; --cached reuses 100
+    urls = make_urls(100 if cached else min(count * batch_size, MAX_URLS))
+    if target == "downloadable":
+        # Files and pages the probe decides by extension, and pages it has to HEAD
+        names = [f"sample{i}{('.exe', '.html', '')[i % 3]}" for i in range(len(urls))]
+        return itertools.cycle({"url": f"{files_url}/{name}"} for name in names)
+    if target == "batch":
+        return itertools.cycle({"urls": urls[i:i + batch_size]} for i in range(0, len(urls), batch_size))
+    return itertools.cycle({"url": url} for url in urls)
+
+
+def run_level(endpoint, payloads, concurrency, duration, warmup, timeout):
+    """
+    Drive `endpoint` with `concurrency` keep-alive clients for `warmup` +
+    `duration` seconds; only requests finished after the warm-up count.
+    """
+    lock = threading.Lock()
+    latencies, statuses = [], Counter()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    def client():
+        session = requests.Session()
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            with lock:
+                payload = next(payloads)
+            try:
+                response = session.post(endpoint, json=payload, timeout=timeout)
+                status = response.status_code
+            except requests.exceptions.RequestException as e:
+                status = type(e).__name__
+            finished = time.perf_counter()
+            if finished >= measure_from:
+                with lock:
+                    latencies.append(finished - now)
+                    statuses[str(status)] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result = summarize(latencies) if latencies else {"calls": 0}
+    ok = statuses.get("200", 0)
+    result.update({
+        "concurrency": concurrency,
+        "duration_s": duration,
+        "rps": round(len(latencies) / duration, 2),
+        "ok_rps": round(ok / duration, 2),
+        "errors": sum(statuses.values()) - ok,
+        "status_counts": dict(statuses),
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the prediction and download-check endpoints")
+    parser.add_argument("--target", choices=sorted(APPS), default="predict")
+    parser.add_argument("--url", help="Base URL of a running server (default: --start-stack, or localhost)")
+    parser.add_argument("--start-stack", action="store_true", help="Start the stub upstreams and the app locally")
+    parser.add_argument("--asgi", action="store_true", help="With --start-stack, run azure_vm/asgi.py instead of app.py")
+    parser.add_argument("--model", default=os.path.join(REPO_ROOT, "training", "xgboost_model.npz"),
+                        help="MODEL_PATH for the app started by --start-stack")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=10, help="Measured seconds per concurrency level")
+    parser.add_argument("--warmup", type=float, default=2, help="Unmeasured seconds before each level")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--batch-size", type=int, default=50, help="URLs per /predict/batch request")
+    parser.add_argument("--cached", action="store_true", help="Cycle through 100 URLs so the caches answer")
+    parser.add_argument("--vt-latency", type=float, default=0.2)
+    parser.add_argument("--falcon-latency", type=float, default=0.5)
+    parser.add_argument("--falcon-analysis-time", type=float, default=0.0,
+                        help="Seconds before a Falcon Sandbox summary has a verdict")
+    parser.add_argument("--files-latency", type=float, default=0.05)
+    parser.add_argument("--output", default="bench_load.json", help="JSON results file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Slowdown flagged as a regression")
+    args = parser.parse_args()
+
+    stubs = start_stub_servers(
+        vt_latency=args.vt_latency, falcon_latency=args.falcon_latency, files_latency=args.files_latency,
+        falcon_analysis_time=args.falcon_analysis_time
+    )
+    process = None
+    try:
+        if args.start_stack:
+            process, base_url = start_app(args.target, {**stubs["env"], "MODEL_PATH": args.model}, asgi=args.asgi)
+        else:
+            base_url = args.url or ("http://127.0.0.1:5210" if args.target == "downloadable" else "http://127.0.0.1:5000")
+        path = {"predict": "/predict", "batch": "/predict/batch", "downloadable": "/checkDownloadable"}[args.target]
+        endpoint = base_url + path
+
+        results = {}
+        for concurrency in args.concurrency:
+            requests_needed = int((args.duration + args.warmup) * concurrency * 200)
+            payloads = make_payloads(args.target, requests_needed, args.cached,
+                                     args.batch_size if args.target == "batch" else 1, stubs["files_url"])
+            result = run_level(endpoint, payloads, concurrency, args.duration, args.warmup, args.timeout)
+            results[f"{args.target}/c{concurrency}"] = result
+            print(f"{args.target} c={concurrency:<4} {result['rps']:>9.1f} req/s  "
+                  f"p50 {result.get('p50_ms', 0):>9.2f} ms  p99 {result.get('p99_ms', 0):>9.2f} ms  "
+                  f"errors {result['errors']}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        stop_stub_servers(stubs)
+
+    document = write_results(args.output, "load", results, config={
+        "target": args.target,
+        "endpoint": path,
+        "started_stack": args.start_stack,
+        "asgi": args.asgi,
+        "cached": args.cached,
+        "batch_size": args.batch_size if args.target == "batch" else None,
+        "latency_s": {"virustotal": args.vt_latency, "falcon": args.falcon_latency, "files": args.files_latency},
+        "falcon_analysis_time_s": args.falcon_analysis_time,
+    })
+    if args.compare and compare(args.compare, document, tolerance=args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import time
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(HERE)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def summarize(samples):
+    """
+    Latency summary (milliseconds) of per-call durations given in seconds.
+    """
+    ms = np.asarray(samples, dtype=float) * 1000
+    return {
+        "calls": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 4),
+        "min_ms": round(float(ms.min()), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p90_ms": round(float(np.percentile(ms, 90)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "max_ms": round(float(ms.max()), 4),
+    }
+
+
+def measure(fn, min_time=1.0, min_calls=5, max_calls=100000, warmup=1):
+    """
+    Call fn() repeatedly, after `warmup` untimed calls, until both `min_time`
+    seconds and `min_calls` calls have passed; return summarize() of the
+    per-call durations.
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < max_calls and (len(samples) < min_calls or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def write_results(path, suite, results, config=None):
+    document = {
+        "suite": suite,
+        "environment": environment(),
+        "config": config or {},
+        "results": results,
+    }
+    with open(path, "w") as out:
+        json.dump(document, out, indent=2)
+    print(f"Results written to {path}")
+    return document
+
+
+def compare(baseline_path, current, metric="p50_ms", tolerance=0.10):
+    """
+    Print each benchmark's `metric` against a previous results file and
+    return the names that got slower by more than `tolerance` (a fraction).
+    """
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+    regressions = []
+    print(f"\nComparison with {baseline_path} ({metric}):")
+    for name, result in current["results"].items():
+        before = baseline.get(name, {}).get(metric)
+        after = result.get(metric)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else 0.0
+        flag = "  REGRESSION" if change > tolerance else ""
+        print(f"  {name:<45} {before:>10.4f} -> {after:>10.4f} ({change:+.1%}){flag}")
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
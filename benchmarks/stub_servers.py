@@ -0,0 +1,254 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-ins for the upstream services on the /predict and
+# /checkDownloadable paths, each with a configurable delay per request:
+#
+#   virustotal  POST /api/v3/urls, GET /api/v3/analyses/<id>
+#   falcon      POST /api/v2/submit/url-to-file, GET /api/v2/overview/<sha256>/summary
+#   files       HEAD/GET /files/<name>   (what is_downloadable() probes)
+#
+# Verdicts are derived from a hash of the URL, so they are stable across runs.
+# Falcon Sandbox summaries come back without a verdict until the analysis
+# time has passed since submission, like a detonation still running, or with
+# a fixed HTTP error status, like an API outage.
+#
+#   python stub_servers.py --vt-latency 0.2 --falcon-latency 0.5 --files-latency 0.05
+#   python stub_servers.py --falcon-analysis-time 5
+#   python stub_servers.py --falcon-error-status 503
+
+DOWNLOAD_TYPES = {
+    ".exe": "application/x-msdownload",
+    ".dll": "application/x-msdownload",
+    ".zip": "application/zip",
+    ".pdf": "application/pdf",
+    ".sh": "application/x-sh",
+    ".bin": "application/octet-stream",
+}
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def _is_bad(value):
+    # Roughly one URL in five is reported as malicious
+    return int(_digest(value)[:2], 16) < 52
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, Nagle's algorithm
+    # adds a delayed-ACK stall to every response on a keep-alive connection
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_form(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(body or "{}")
+        return {key: values[0] for key, values in parse_qs(body).items()}
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class VirusTotalStub(_StubHandler):
+    def do_POST(self):
+        self._delay()
+        if urlparse(self.path).path != "/api/v3/urls":
+            return self._send_json(404, {"error": "not found"})
+        url = self._read_form().get("url", "")
+        # The analysis id carries the URL so reports need no server-side state
+        analysis_id = "u-" + url.encode("utf-8").hex()
+        self._send_json(200, {"data": {"type": "analysis", "id": analysis_id}})
+
+    def do_GET(self):
+        self._delay()
+        path = urlparse(self.path).path
+        if not path.startswith("/api/v3/analyses/u-"):
+            return self._send_json(404, {"error": "not found"})
+        url = bytes.fromhex(path.rsplit("/u-", 1)[1]).decode("utf-8", "replace")
+        malicious = 4 if _is_bad(url) else 0
+        self._send_json(200, {"data": {"attributes": {
+            "status": "completed",
+            "stats": {
+                "malicious": malicious,
+                "suspicious": 0,
+                "harmless": 70 - malicious,
+                "undetected": 20,
+                "timeout": 0,
+            },
+        }}})
+
+
+class FalconSandboxStub(_StubHandler):
+    analysis_time = 0.0
+    # Answers every summary request with this HTTP status when set
+    error_status = 0
+    # sha256 -> submission time, per server (see _serve)
+    submitted = {}
+
+    def do_POST(self):
+        self._delay()
+        if urlparse(self.path).path != "/api/v2/submit/url-to-file":
+            return self._send_json(404, {"message": "not found"})
+        form = self._read_form()
+        url = form.get("url", "")
+        sha256 = _digest(url)
+        self.submitted.setdefault(sha256, time.monotonic())
+        self._send_json(201, {
+            "job_id": _digest("job" + url)[:24],
+            "environment_id": int(form.get("environment_id", 160)),
+            "sha256": sha256,
+        })
+
+    def do_GET(self):
+        self._delay()
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if len(parts) != 5 or parts[:3] != ["api", "v2", "overview"] or parts[4] != "summary":
+            return self._send_json(404, {"message": "not found"})
+        sha256 = parts[3]
+        if self.error_status:
+            return self._send_json(self.error_status, {"message": "stub error"})
+        submitted_at = self.submitted.get(sha256)
+        if submitted_at is not None and time.monotonic() - submitted_at < self.analysis_time:
+            return self._send_json(200, {"sha256": sha256, "threat_score": None, "verdict": None})
+        bad = _is_bad(sha256)
+        self._send_json(200, {
+            "sha256": sha256,
+            "threat_score": 85 if bad else 5,
+            "verdict": "malicious" if bad else "no specific threat",
+        })
+
+
+class FileHostStub(_StubHandler):
+    def _headers_for(self):
+        name = urlparse(self.path).path.rsplit("/", 1)[-1]
+        extension = os.path.splitext(name)[1].lower()
+        content_type = DOWNLOAD_TYPES.get(extension, "text/html; charset=utf-8")
+        body = b"MZ" + b"\0" * 1022 if extension in DOWNLOAD_TYPES else b"<html><body>page</body></html>"
+        return content_type, body
+
+    def do_HEAD(self):
+        self._delay()
+        content_type, body = self._headers_for()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+    def do_GET(self):
+        self._delay()
+        content_type, body = self._headers_for()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for a burst of new connections from a pooled async client
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response (e.g. an app being stopped) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def _serve(handler, host, port, latency, **attributes):
+    handler_class = type(handler.__name__, (handler,), {"latency": latency, **attributes})
+    server = _StubServer((host, port), handler_class)
+    threading.Thread(target=server.serve_forever, name=handler.__name__, daemon=True).start()
+    return server
+
+
+def start_stub_servers(host="127.0.0.1", vt_port=0, falcon_port=0, files_port=0,
+                       vt_latency=0.0, falcon_latency=0.0, files_latency=0.0, falcon_analysis_time=0.0,
+                       falcon_error_status=0):
+    """
+    Start the three stubs on background threads (port 0 picks a free port)
+    and return {"servers": [...], "env": {...}} where env holds the variables
+    that point the two web apps at them.
+    """
+    vt = _serve(VirusTotalStub, host, vt_port, vt_latency)
+    falcon = _serve(FalconSandboxStub, host, falcon_port, falcon_latency,
+                    analysis_time=falcon_analysis_time, error_status=falcon_error_status, submitted={})
+    files = _serve(FileHostStub, host, files_port, files_latency)
+    base = lambda server: f"http://{host}:{server.server_address[1]}"
+    return {
+        "servers": [vt, falcon, files],
+        "files_url": f"{base(files)}/files",
+        "env": {
+            "VIRUSTOTAL_API_URL": f"{base(vt)}/api/v3",
+            "FALCON_SANDBOX_API_URL": f"{base(falcon)}/api/v2",
+            "VT_INITIAL_WAIT": "0",
+            "VT_RETRY_WAIT": "0",
+            "FS_INITIAL_WAIT": "0",
+            "FS_POLL_INTERVAL": "0.1",
+        },
+    }
+
+
+def stop_stub_servers(stubs):
+    for server in stubs["servers"]:
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local VirusTotal, Falcon Sandbox and file-host stubs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--vt-port", type=int, default=8101)
+    parser.add_argument("--falcon-port", type=int, default=8102)
+    parser.add_argument("--files-port", type=int, default=8103)
+    parser.add_argument("--vt-latency", type=float, default=0.2, help="Seconds added to each VirusTotal request")
+    parser.add_argument("--falcon-latency", type=float, default=0.5, help="Seconds added to each Falcon Sandbox request")
+    parser.add_argument("--files-latency", type=float, default=0.05, help="Seconds added to each file-host request")
+    parser.add_argument("--falcon-analysis-time", type=float, default=0.0,
+                        help="Seconds after submission before a Falcon Sandbox summary has a verdict")
+    parser.add_argument("--falcon-error-status", type=int, default=0,
+                        help="HTTP status every Falcon Sandbox summary request fails with (0: none)")
+    args = parser.parse_args()
+
+    stubs = start_stub_servers(
+        args.host, args.vt_port, args.falcon_port, args.files_port,
+        args.vt_latency, args.falcon_latency, args.files_latency, args.falcon_analysis_time,
+        args.falcon_error_status
+    )
+    print("Stub servers running. Point the apps at them with:")
+    for name, value in stubs["env"].items():
+        print(f"  export {name}={value}")
+    print(f"Downloadable test URLs: {stubs['files_url']}/<name>.exe (pages: <name>.html)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stop_stub_servers(stubs)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,26 @@ document.addEventListener("DOMContentLoaded", () => {
   const urlListContainer = document.getElementById("links-container");
   const currentUrlElement = document.getElementById("current-url");
 
-  // API endpoints
-  const API_URL = "http://52.175.16.74:5000/predict";
+  // API endpoints (/predict/batch itself is called by background.js)
   const API_URL_SECONDARY = "http://20.2.169.240:5210/checkDownloadable";
+  const API_URL_VERDICT = "http://52.175.16.74:5000/verdict";
+  const API_URL_FEEDBACK = "http://52.175.16.74:5000/feedback";
+
+  // Maximum number of links scored at the same time during a page scan
+  const SCAN_CONCURRENCY = 6;
+
+  // Links the in-extension model scores below this are answered locally as Safe.
+  // It sits a little under the server's 0.4 threshold so borderline links (and any
+  // drift between the bundled model and the server's) still go to the server.
+  // Only hosts the server has already checked against its deny list qualify.
+  const LOCAL_SAFE_BELOW = 0.35;
+  const localModel = UrlModel.load(chrome.runtime.getURL("popup/url_model.json")).catch(error => {
+    console.error("Local model unavailable, scoring on the server only", error);
+    return null;
+  });
 
-  // In-memory object to store user's vote for each URL
+  // In-memory object to store user's vote for each URL (each vote is also
+  // sent to /feedback, where it is logged for incremental retraining)
   // Example: userVotes[url] = 'tick' or 'cross'
   let userVotes = {};
 
@@ -39,18 +54,110 @@ document.addEventListener("DOMContentLoaded", () => {
   }
 
   // --------------------------------------------------------------------------
-  // 3. Fetch prediction from API
-  async function fetchPrediction(url) {
+  // 2b. Request coalescing: concurrent calls for the same key share one promise
+  function coalesce(inflight, key, request) {
+    if (!inflight.has(key)) {
+      const promise = request().finally(() => inflight.delete(key));
+      inflight.set(key, promise);
+    }
+    return inflight.get(key);
+  }
+
+  const inflightDownloadChecks = new Map();
+
+  // --------------------------------------------------------------------------
+  // 2c. Run worker(item) over all items with at most `limit` running at once
+  async function runWithConcurrency(items, limit, worker) {
+    let next = 0;
+    async function runner() {
+      while (next < items.length) {
+        const item = items[next++];
+        await worker(item);
+      }
+    }
+    const runners = [];
+    for (let i = 0; i < Math.min(limit, items.length); i++) runners.push(runner());
+    await Promise.all(runners);
+  }
+
+  // --------------------------------------------------------------------------
+  // 3. Fetch predictions for a page of URLs: a map of URL -> prediction (null
+  // for a URL that could not be scored).
+  // Links on hosts the server has cleared are scored locally first. The rest go
+  // to the background service worker in one message; it answers from its shared
+  // verdict cache and sends only the misses to /predict/batch
+  async function fetchPredictions(urls) {
+    const predictions = new Map();
+    const local = await Promise.all(urls.map(async url => (await isHostCleared(url)) ? scoreLocally(url) : null));
+    const remote = [];
+    urls.forEach((url, i) => {
+      if (local[i]) predictions.set(url, local[i]);
+      else remote.push(url);
+    });
+    if (!remote.length) return predictions;
+
     try {
-      const response = await fetch(API_URL, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ url }),
+      const response = await chrome.runtime.sendMessage({ type: "predictBatch", urls: remote });
+      if (!response || response.error) throw new Error(response ? response.error : "No response");
+      response.predictions.forEach((prediction, i) => {
+        if (prediction.error) console.error("Error fetching prediction for", remote[i], prediction.error);
+        predictions.set(remote[i], prediction.error ? null : prediction);
       });
-      if (!response.ok) throw new Error(`API Error: ${response.statusText}`);
-      return await response.json();
     } catch (error) {
-      console.error("Error fetching prediction for", url, error);
+      console.error("Error fetching predictions", error);
+    }
+    return predictions;
+  }
+
+  // The local model knows nothing of the server's deny list, so it may only
+  // answer for hosts the server has seen and not denied
+  async function isHostCleared(url) {
+    try {
+      const response = await chrome.runtime.sendMessage({ type: "hostCleared", url });
+      return Boolean(response && response.cleared);
+    } catch (error) {
+      return false;
+    }
+  }
+
+  // Confidently safe links get a /predict-shaped result without a network request
+  async function scoreLocally(url) {
+    const model = await localModel;
+    if (!model) return null;
+    try {
+      const maliciousProb = UrlModel.predictProba(url, model);
+      if (maliciousProb >= LOCAL_SAFE_BELOW) return null;
+      return {
+        url,
+        malicious_probability: Math.round(maliciousProb * 10000) / 10000,
+        not_malicious_probability: Math.round((1 - maliciousProb) * 10000) / 10000,
+        prediction: "Safe",
+        threshold: LOCAL_SAFE_BELOW,
+        virustotal: "Not checked",
+        virustotal_stats: null,
+        virustotal_error: null,
+        virustotal_job: null,
+        source: "local"
+      };
+    } catch (error) {
+      console.error("Error scoring locally", url, error);
+      return null;
+    }
+  }
+
+  // --------------------------------------------------------------------------
+  // 3b. Wait for the VirusTotal verdict of a job queued by /predict.
+  // Long-polls /verdict/<job_id> until the job completes; returns null on failure.
+  async function fetchVerdict(jobId) {
+    try {
+      while (true) {
+        const response = await fetch(`${API_URL_VERDICT}/${jobId}?wait=25`);
+        if (!response.ok) throw new Error(`Verdict API Error: ${response.statusText}`);
+        const result = await response.json();
+        if (result.status === "completed") return result;
+      }
+    } catch (error) {
+      console.error("Error fetching verdict for job", jobId, error);
       return null;
     }
   }
@@ -91,6 +198,17 @@ document.addEventListener("DOMContentLoaded", () => {
     ctx.fill();
   }
 
+  // --------------------------------------------------------------------------
+  // 5a. Redraw the summary at most once per animation frame while results stream in
+  let summaryFrame = null;
+  function scheduleSummaryUpdate(urlData) {
+    if (summaryFrame !== null) return;
+    summaryFrame = requestAnimationFrame(() => {
+      summaryFrame = null;
+      updateSummary(urlData);
+    });
+  }
+
   // --------------------------------------------------------------------------
   // 5. Update the summary section and draw the doughnut chart
   function updateSummary(urlData) {
@@ -115,40 +233,71 @@ document.addEventListener("DOMContentLoaded", () => {
   }
 
   // --------------------------------------------------------------------------
-  // 6. Check if a URL is downloadable and add a purple "Downloadable" pill.
-  // Returns true if downloadable, false otherwise.
-  async function checkAndAddDownloadablePill(pillsContainer, url) {
-    try {
-      const response = await fetch(API_URL_SECONDARY, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ url }),
-      });
-      if (!response.ok) {
-        throw new Error(`Download Check API Error: ${response.statusText}`);
+  // 6. Check if a URL is downloadable (fetchDownloadable) and add a purple
+  // "Downloadable" pill for it (addDownloadablePill returns true if downloadable).
+  function fetchDownloadable(url) {
+    return coalesce(inflightDownloadChecks, url, async () => {
+      try {
+        const response = await fetch(API_URL_SECONDARY, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ url }),
+        });
+        if (!response.ok) {
+          throw new Error(`Download Check API Error: ${response.statusText}`);
+        }
+        return await response.json();
+      } catch (error) {
+        console.error("Error in fetchDownloadable for", url, error);
+        return null;
       }
-      const result = await response.json();
-      if (result && result.isDownloadable) {
-        const downloadPill = document.createElement("span");
-        downloadPill.textContent = "Downloadable";
-        downloadPill.style.backgroundColor = "purple";
-        downloadPill.style.color = "white";
-        downloadPill.style.padding = "2px 6px";
-        downloadPill.style.borderRadius = "10px";
-        downloadPill.style.marginLeft = "10px";
-        pillsContainer.appendChild(downloadPill);
-        return true;
+    });
+  }
+
+  function addDownloadablePill(pillsContainer, result) {
+    if (result && result.isDownloadable) {
+      const downloadPill = document.createElement("span");
+      downloadPill.textContent = "Downloadable";
+      downloadPill.style.backgroundColor = "purple";
+      downloadPill.style.color = "white";
+      downloadPill.style.padding = "2px 6px";
+      downloadPill.style.borderRadius = "10px";
+      downloadPill.style.marginLeft = "10px";
+      pillsContainer.appendChild(downloadPill);
+      return true;
+    }
+    return false;
+  }
+
+  // Read a server-sent event stream, calling onEvent(event, data) for each
+  // event as it arrives (data is parsed as JSON).
+  async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let event = "message";
+        let data = "";
+        for (const line of block.split("\n")) {
+          if (line.startsWith("event:")) event = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        }
+        onEvent(event, data ? JSON.parse(data) : null);
       }
-      return false;
-    } catch (error) {
-      console.error("Error in checkAndAddDownloadablePill for", url, error);
-      return false;
     }
   }
 
   // --------------------------------------------------------------------------
   // 7. Further analyze the link in a sandbox when the sandbox button is clicked.
   // Row 4 will display a spinner, then show the analysis result (real API call).
+  // The result is streamed, so the VirusTotal verdict shows while the sandbox runs.
   async function furtherAnalyzeSandbox(url, resultContainer) {
     // Display the container (Row 4) and clear any previous content
     resultContainer.style.display = "flex";
@@ -181,9 +330,9 @@ document.addEventListener("DOMContentLoaded", () => {
       console.log("Sending request to sandbox analysis:", url);
   
       // Send request to the Secondary API for deeper (sandbox) analysis
-      const response = await fetch(API_URL_SECONDARY, {
+      const response = await fetch(`${API_URL_SECONDARY}?stream=1`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: { "Content-Type": "application/json", "Accept": "text/event-stream" },
         body: JSON.stringify({ url }),
       });
   
@@ -191,7 +340,19 @@ document.addEventListener("DOMContentLoaded", () => {
         throw new Error(`Sandbox Analysis API Error: ${response.statusText}`);
       }
   
-      const result = await response.json();
+      let result = null;
+      await readEventStream(response, (event, data) => {
+        if (event === "virustotal" && data && data.status === "completed") {
+          loadingText.textContent = `VirusTotal: ${data.malicious} engine(s) flagged this file. Analyzing in sandbox...`;
+        } else if (event === "result") {
+          result = data;
+        } else if (event === "error") {
+          throw new Error(data.error);
+        }
+      });
+      if (!result || !result.vtResult) {
+        throw new Error("Sandbox analysis returned no result");
+      }
       console.log(`Sandbox Analysis Result for ${url}:`, result);
   
       // Clear the loading message
@@ -372,6 +533,16 @@ document.addEventListener("DOMContentLoaded", () => {
       userVotes[url] = choice;
     }
     applyVoteStyles(url, tickButton, crossButton);
+    sendFeedback(url, userVotes[url]);
+  }
+
+  // Log the vote on the server; a null vote withdraws an earlier one
+  function sendFeedback(url, vote) {
+    fetch(API_URL_FEEDBACK, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ url, vote })
+    }).catch(error => console.error("Feedback error:", error));
   }
 
   // --------------------------------------------------------------------------
@@ -400,7 +571,12 @@ document.addEventListener("DOMContentLoaded", () => {
 
   // --------------------------------------------------------------------------
   // 13. Update UI with link cards and collect summary data
+  // Incremented on every scan so a superseded scan stops rendering into the page
+  let scanGeneration = 0;
+
   async function updateUI(urls) {
+    // Repeated hrefs are scored once and shown as a single card
+    urls = [...new Set(urls)];
     if (linkCountElement) linkCountElement.textContent = urls.length || 0;
 
     if (!urls.length) {
@@ -410,16 +586,30 @@ document.addEventListener("DOMContentLoaded", () => {
     }
 
     // Clear previous content and prepare an array for summary data
+    const generation = ++scanGeneration;
     urlListContainer.innerHTML = "";
     let summaryData = [];
 
+    // Create every card up front (in page order) so results can fill them in as they arrive
+    const cards = new Map();
     for (const url of urls) {
-      // Create the URL card with our 4-row layout
-      const { card, spinnerRow1, pillsContainer, buttonsContainer, sandboxResultContainer } = createURLCard(url);
-      urlListContainer.appendChild(card);
+      const cardParts = createURLCard(url);
+      urlListContainer.appendChild(cardParts.card);
+      cards.set(url, cardParts);
+    }
+
+    // The whole page is scored in one batch while the download checks go out
+    const predictions = fetchPredictions(urls);
+
+    await runWithConcurrency(urls, SCAN_CONCURRENCY, async (url) => {
+      if (generation !== scanGeneration) return;
+      const { spinnerRow1, pillsContainer, buttonsContainer, sandboxResultContainer } = cards.get(url);
+
+      // Prediction and download check are independent, so both requests go out together
+      const downloadPromise = fetchDownloadable(url);
+      const prediction = (await predictions).get(url) || null;
+      if (generation !== scanGeneration) return;
 
-      // Fetch the prediction for the URL
-      const prediction = await fetchPrediction(url);
       let status = "Error";
       if (prediction) {
         status = prediction.prediction;
@@ -430,7 +620,9 @@ document.addEventListener("DOMContentLoaded", () => {
           status = prediction.virustotal;
         }
       }
-      summaryData.push({ url, status });
+      const summaryItem = { url, status };
+      summaryData.push(summaryItem);
+      scheduleSummaryUpdate(summaryData);
 
       // Remove the spinner from Row 1 once prediction is loaded
       spinnerRow1.style.display = "none";
@@ -450,18 +642,29 @@ document.addEventListener("DOMContentLoaded", () => {
       }
       pillsContainer.appendChild(statusPill);
 
-      // Check if the link is downloadable and add a purple "Downloadable" pill to Row 2.
-      // Also, capture the downloadable status.
-      let downloadable = await checkAndAddDownloadablePill(pillsContainer, url);
+      // Flagged URLs are checked by VirusTotal in the background; swap in its verdict when ready
+      if (prediction && prediction.virustotal_job) {
+        fetchVerdict(prediction.virustotal_job).then(verdict => {
+          if (generation !== scanGeneration) return;
+          if (!verdict || (verdict.virustotal !== "Safe" && verdict.virustotal !== "Malicious")) return;
+          chrome.runtime.sendMessage({ type: "storeVerdict", url, verdict });
+          summaryItem.status = verdict.virustotal;
+          statusPill.textContent = verdict.virustotal;
+          statusPill.classList.remove("bg-safe", "bg-malicious");
+          statusPill.classList.add(verdict.virustotal === "Safe" ? "bg-safe" : "bg-malicious");
+          scheduleSummaryUpdate(summaryData);
+        });
+      }
+
+      // Add a purple "Downloadable" pill to Row 2 and capture the downloadable status.
+      const downloadable = addDownloadablePill(pillsContainer, await downloadPromise);
+      if (generation !== scanGeneration) return;
 
       // Attach action buttons to Row 3.
       // If downloadable is true, show Tick, Cross, and Sandbox button.
       // If not, only show Tick and Cross.
       attachActionButtons(buttonsContainer, sandboxResultContainer, url, downloadable);
-    }
-
-    // After processing all URLs, update the summary tab (including the chart)
-    updateSummary(summaryData);
+    });
   }
 
   // --------------------------------------------------------------------------
@@ -0,0 +1,133 @@
+// In-extension URL scoring.
+// Reimplements the server's FeatureExtractor (azure_vm/url_features.py) and
+// evaluates the tree model exported by training/tree_model.py
+// (export_tree_model_json -> popup/url_model.json), so most links can be
+// scored without a round-trip to the prediction server.
+const UrlModel = (() => {
+  // Python's str.isdigit(): decimal digits plus the Numeric_Type=Digit characters
+  const DIGIT = /^(?:\p{Nd}|[\u{B2}-\u{B3}\u{B9}\u{1369}-\u{1371}\u{19DA}\u{2070}\u{2074}-\u{2079}\u{2080}-\u{2089}\u{2460}-\u{2468}\u{2474}-\u{247C}\u{2488}-\u{2490}\u{24EA}\u{24F5}-\u{24FD}\u{24FF}\u{2776}-\u{277E}\u{2780}-\u{2788}\u{278A}-\u{2792}\u{10A40}-\u{10A43}\u{10E60}-\u{10E68}\u{11052}-\u{1105A}\u{1F100}-\u{1F10A}])$/u;
+  // Python's str.isdecimal() for one character
+  const DECIMAL = /^\p{Nd}$/u;
+  // Python's str.strip() whitespace
+  const SPACE = "[\\t-\\r\\x1c-\\x20\\x85\\xa0\\u1680\\u2000-\\u200a\\u2028\\u2029\\u202f\\u205f\\u3000]";
+  const WHITESPACE = new RegExp(`^${SPACE}+|${SPACE}+$`, "g");
+
+  let model = null;
+
+  function isDigit(char) {
+    return DIGIT.test(char);
+  }
+
+  // Same normalisation as FeatureExtractor._preprocess_url
+  function preprocessUrl(url) {
+    url = url.split("http://").join("").split("https://").join("").split("www.").join("");
+    return url.replace(/^\/+|\/+$/g, "");
+  }
+
+  function countOf(chars, target) {
+    let count = 0;
+    for (const char of chars) if (char === target) count++;
+    return count;
+  }
+
+  function urlEntropy(url) {
+    // Counted per code point, in order of first appearance, like the Python version
+    const chars = Array.from(url.replace(WHITESPACE, ""));
+    const counts = new Map();
+    for (const char of chars) counts.set(char, (counts.get(char) || 0) + 1);
+    let sum = 0;
+    for (const count of counts.values()) {
+      const e = count / chars.length;
+      sum += e * (Math.log(e) / Math.log(2));
+    }
+    return -sum;
+  }
+
+  // Value of a decimal digit (\p{Nd}) of any script. Digits come in runs of ten
+  // from zero, and adjacent runs (e.g. the mathematical digits) are contiguous,
+  // so the value is the offset from the start of the run modulo 10.
+  function decimalValue(char) {
+    const code = char.codePointAt(0);
+    let start = code;
+    while (DECIMAL.test(String.fromCodePoint(start - 1))) start--;
+    return (code - start) % 10;
+  }
+
+  // Python's part.isdecimal() and int(part) <= 255: int() reads decimal digits
+  // of any script, so "\u0661\u0662\u0667.0.0.1" is an IP address too
+  function isIp(domain) {
+    const parts = domain.split(".");
+    return parts.length === 4 && parts.every(part => {
+      const chars = Array.from(part);
+      if (!chars.length || !chars.every(char => DECIMAL.test(char))) return false;
+      return chars.reduce((value, char) => value * 10 + decimalValue(char), 0) <= 255;
+    });
+  }
+
+  // Feature vector in FEATURE_NAMES order, rounded to float32 like the server
+  function extractFeatures(rawUrl) {
+    const url = preprocessUrl(rawUrl);
+    const chars = Array.from(url);
+    const domain = url.split("/")[0];
+    const features = [
+      urlEntropy(url),
+      chars.filter(isDigit).length,
+      chars.length,
+      countOf(chars, "&"),
+      countOf(chars, "#"),
+      countOf(domain, "."),
+      url.includes("http") ? 1 : 0,
+      url.includes("https") ? 1 : 0,
+      isIp(domain) ? 1 : 0
+    ];
+    return features.map(Math.fround);
+  }
+
+  function fromJSON(data) {
+    if (data.format_version !== 1) {
+      throw new Error(`Unsupported tree model format: ${data.format_version}`);
+    }
+    return {
+      ...data,
+      // Thresholds and leaf values are float32 values written as short decimals
+      threshold: Float32Array.from(data.threshold),
+      left: Int32Array.from(data.left),
+      right: Int32Array.from(data.right),
+      feature: Int32Array.from(data.feature),
+      default_left: Uint8Array.from(data.default_left)
+    };
+  }
+
+  async function load(url) {
+    if (!model) {
+      const response = await fetch(url);
+      if (!response.ok) throw new Error(`Model load error: ${response.statusText}`);
+      model = fromJSON(await response.json());
+    }
+    return model;
+  }
+
+  function predictMargin(tree, features) {
+    let margin = tree.base_margin;
+    for (const root of tree.roots) {
+      let node = root;
+      while (tree.left[node] !== node) {
+        const value = features[tree.feature[node]];
+        const goLeft = Number.isNaN(value) ? tree.default_left[node] === 1 : value < tree.threshold[node];
+        node = goLeft ? tree.left[node] : tree.right[node];
+      }
+      margin += tree.threshold[node];
+    }
+    return margin;
+  }
+
+  // Probability that the URL is malicious
+  function predictProba(url, tree = model) {
+    if (!tree) throw new Error("Model not loaded");
+    return 1 / (1 + Math.exp(-predictMargin(tree, extractFeatures(url))));
+  }
+
+  return { load, fromJSON, extractFeatures, predictProba };
+})();
+
+if (typeof module !== "undefined") module.exports = UrlModel;
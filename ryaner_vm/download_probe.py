@@ -0,0 +1,209 @@
+import time
+from urllib.parse import unquote, urljoin, urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from verdict_cache import VerdictCache
+
+# Categorize risks based on checking on file extension
+RISK_CATEGORIES = {
+    'high_risk': {
+        'executable': ['.exe', '.msi', '.dll', '.bat', '.cmd', '.sh'],
+        'script': ['.ps1', '.vbs', '.js', '.jsp', '.jse', '.php'],
+        'system': ['.sys', '.drv', '.bin']
+    },
+    'medium_risk': {
+        'archive': ['.zip', '.rar', '.7z', '.tar.gz', '.iso'],
+        'office': ['.doc', '.docm', '.xls', '.xlsm', '.ppt', '.pptm']
+    },
+    'low_risk': {
+        'document': ['.pdf', '.docx', '.xlsx', '.pptx', '.txt'],
+        'media': ['.mp3', '.mp4', '.jpg', '.png']
+    }
+}
+
+# Extension (including multi-part ones such as ".tar.gz") -> (risk level, category)
+EXTENSION_INDEX = {
+    extension: (risk_level, category)
+    for risk_level, categories in RISK_CATEGORIES.items()
+    for category, extensions in categories.items()
+    for extension in extensions
+}
+MAX_EXTENSION_PARTS = max(extension.count(".") for extension in EXTENSION_INDEX)
+
+# Static pages are never downloads; server-side pages can be either, so their
+# response headers decide even where the table lists the extension
+STATIC_PAGE_EXTENSIONS = {".html", ".htm", ".xhtml"}
+DYNAMIC_PAGE_EXTENSIONS = {".php", ".jsp", ".asp", ".aspx", ".cgi"}
+
+# Content types served to be rendered rather than saved
+PAGE_CONTENT_TYPES = ("text/", "application/xhtml+xml", "application/json")
+
+# Leading bytes of common executable and archive formats, for responses
+# without a usable Content-Type
+MAGIC_NUMBERS = {
+    b"MZ": "exe",
+    b"\x7fELF": "elf",
+    b"PK\x03\x04": "zip",
+    b"Rar!": "rar",
+    b"7z\xbc\xaf\x27\x1c": "7z",
+    b"%PDF": "pdf",
+}
+SNIFF_BYTES = max(len(magic) for magic in MAGIC_NUMBERS)
+
+# Most redirects a probe follows
+MAX_REDIRECTS = 10
+
+
+def path_extension(path):
+    """
+    Return the longest extension of the last path segment that is in
+    EXTENSION_INDEX or a page extension (e.g. ".tar.gz", ".exe"), else None.
+    """
+    name = path.rsplit("/", 1)[-1]
+    parts = name.split(".")
+    for count in range(min(MAX_EXTENSION_PARTS, len(parts) - 1), 0, -1):
+        extension = "." + ".".join(parts[-count:])
+        if extension in EXTENSION_INDEX or extension in STATIC_PAGE_EXTENSIONS or extension in DYNAMIC_PAGE_EXTENSIONS:
+            return extension
+    return None
+
+
+class DownloadProbe:
+    """
+    Tiered check of whether a URL serves a file download:
+
+    1. the path's extension, looked up in EXTENSION_INDEX (no I/O);
+    2. a cached answer for the same host and path;
+    3. a HEAD request over a pooled session, falling back to a ranged GET of
+       at most `max_bytes` when HEAD is refused, within `timeout` seconds in
+       total, redirects included.
+
+    A URL the probe cannot settle (unreachable, over budget, no usable
+    headers) comes back with "isDownloadable": True and "method": "undecided",
+    so the upstream scanners still look at it.
+    """
+
+    def __init__(self, timeout=3.0, max_bytes=4096, cache_size=10000, cache_ttl=3600, pool_size=20):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.cache_ttl = cache_ttl
+        self.cache = VerdictCache(maxsize=cache_size)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def probe(self, url):
+        parsed = urlparse(url)
+        path = unquote(parsed.path.lower())
+        extension = path_extension(path)
+
+        # Tier 1: the extension alone
+        if extension in STATIC_PAGE_EXTENSIONS:
+            return {
+                "isDownloadable": False,
+                "message": "No download indicators detected",
+                "method": "extension"
+            }
+        if extension in EXTENSION_INDEX and extension not in DYNAMIC_PAGE_EXTENSIONS:
+            return self._download(extension, "extension")
+
+        # Tier 2: an earlier probe of the same host and path
+        key = (parsed.netloc.lower(), parsed.path)
+        result = self.cache.get(key)
+        if result is not None:
+            return dict(result, cached=True)
+
+        # Tier 3: the response headers
+        try:
+            downloadable, file_type = self._probe_headers(url)
+        except (requests.exceptions.RequestException, TimeoutError) as e:
+            return {
+                "isDownloadable": True,
+                "riskLevel": "unknown",
+                "method": "undecided",
+                "message": f"Download probe failed: {e}"
+            }
+
+        if downloadable is None:
+            result = {"isDownloadable": True, "riskLevel": "unknown", "method": "undecided",
+                      "message": "No Content-Type to decide on"}
+        elif downloadable and extension in EXTENSION_INDEX:
+            result = self._download(extension, "header")
+        elif downloadable:
+            result = {"isDownloadable": True, "riskLevel": "unknown", "method": "header", "fileType": file_type}
+        else:
+            result = {"isDownloadable": False, "message": "No download indicators detected", "method": "header"}
+        self.cache.set(key, result, self.cache_ttl)
+        return result
+
+    def _download(self, extension, method):
+        risk_level, category = EXTENSION_INDEX[extension]
+        return {
+            "isDownloadable": True,
+            "riskLevel": risk_level,
+            "category": category,
+            "fileType": extension.lstrip("."),
+            "method": method
+        }
+
+    def _probe_headers(self, url):
+        """
+        Return (downloadable, file_type) from a HEAD request, or from the
+        headers and first bytes of a ranged GET if the server refuses HEAD.
+        downloadable is None when the response gives nothing to go on.
+        """
+        deadline = time.monotonic() + self.timeout
+        response = self._fetch("HEAD", url, deadline)
+        first_bytes = b""
+        if response.status_code in (405, 501):
+            headers = {"Range": f"bytes=0-{self.max_bytes - 1}"}
+            with self._fetch("GET", url, deadline, headers=headers, stream=True) as response:
+                for chunk in response.iter_content(chunk_size=min(self.max_bytes, 1024)):
+                    first_bytes += chunk
+                    if len(first_bytes) >= self.max_bytes:
+                        break
+                    self._remaining(deadline)
+        return self._classify(response.headers, first_bytes[:SNIFF_BYTES])
+
+    def _fetch(self, method, url, deadline, **kwargs):
+        """
+        session.request() that follows redirects itself, giving each hop only
+        the time left before `deadline` (a requests timeout is per socket
+        operation, so it would otherwise restart on every hop).
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self.session.request(
+                method, url, allow_redirects=False, timeout=self._remaining(deadline), **kwargs
+            )
+            target = self.session.get_redirect_target(response)
+            if target is None:
+                return response
+            response.close()
+            url = urljoin(response.url, target)
+        raise requests.exceptions.TooManyRedirects(f"Exceeded {MAX_REDIRECTS} redirects", response=response)
+
+    def _remaining(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"No answer within {self.timeout:g}s")
+        return remaining
+
+    def _classify(self, headers, first_bytes):
+        disposition = headers.get("Content-Disposition", "").lower()
+        content_type = headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+
+        if "attachment" in disposition or "filename" in disposition:
+            return True, content_type or None
+        for magic, file_type in MAGIC_NUMBERS.items():
+            if first_bytes.startswith(magic):
+                return True, file_type
+        if not content_type:
+            return None, None
+        if content_type.startswith(PAGE_CONTENT_TYPES) or "html" in content_type:
+            return False, content_type
+        return True, content_type
+
+    def stats(self):
+        return self.cache.stats()
+
@@ -0,0 +1,109 @@
+import time
+from contextlib import nullcontext
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class FalconSandboxError(Exception):
+    """A Falcon Sandbox API call failed or returned something unusable."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class FalconSandboxClient:
+    """
+    Client for the Falcon Sandbox (Hybrid Analysis) API v2, replacing the
+    VxAPI command-line wrapper: requests go straight to `api_url` over one
+    pooled keep-alive session shared by all request threads.
+
+    analyze() submits a URL for download-and-detonate analysis, then polls the
+    overview summary with exponential backoff until a verdict or threat score
+    appears or `max_wait` runs out.
+    """
+
+    def __init__(self, api_url, api_key=None, environment_id=160, pool_size=20, timeout=15):
+        self.api_url = api_url.rstrip("/")
+        self.environment_id = environment_id
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # The API rejects requests without this user agent
+        self.session.headers.update({"User-Agent": "Falcon Sandbox", "accept": "application/json"})
+        if api_key:
+            self.session.headers["api-key"] = api_key
+
+    def _request(self, method, path, **kwargs):
+        try:
+            response = self.session.request(method, f"{self.api_url}{path}", timeout=self.timeout, **kwargs)
+        except requests.exceptions.RequestException as e:
+            raise FalconSandboxError(f"Falcon Sandbox request error: {e}") from e
+        if response.status_code >= 400:
+            raise FalconSandboxError(
+                f"Falcon Sandbox {method} {path} failed with HTTP {response.status_code}", response.status_code
+            )
+        try:
+            return response.json()
+        except ValueError:
+            raise FalconSandboxError(f"Falcon Sandbox {method} {path} returned invalid JSON", response.status_code)
+
+    def submit_url_to_file(self, url):
+        """Submit a URL whose download is detonated; returns the submission (job_id, sha256, ...)."""
+        return self._request(
+            "POST", "/submit/url-to-file", data={"url": url, "environment_id": self.environment_id}
+        )
+
+    def overview_summary(self, sha256):
+        return self._request("GET", f"/overview/{sha256}/summary")
+
+    def analyze(self, url, initial_wait=2, poll_interval=2, max_poll_interval=15, max_wait=30, timer=None):
+        """
+        Submit `url` and wait for its summary. Returns {"status": "completed",
+        "threat_score", "verdict", "sha256"} or, if the analysis has not
+        finished within `max_wait` seconds, {"status": "pending", "sha256"}.
+        Raises FalconSandboxError on API failures.
+
+        `timer(stage)`, if given, returns a context manager wrapped around each
+        step ("fs_submit", "fs_poll_wait", "fs_summary"), e.g. for metrics.
+        """
+        timer = timer or (lambda stage: nullcontext())
+        with timer("fs_submit"):
+            submission = self.submit_url_to_file(url)
+        sha256 = submission.get("sha256")
+        if not sha256:
+            raise FalconSandboxError("No sha256 found in submission response")
+
+        deadline = time.monotonic() + max_wait
+        delay = initial_wait
+        interval = poll_interval
+        while True:
+            with timer("fs_poll_wait"):
+                time.sleep(max(min(delay, deadline - time.monotonic()), 0))
+            try:
+                with timer("fs_summary"):
+                    summary = self.overview_summary(sha256)
+            except FalconSandboxError as e:
+                # The summary is not there until the analysis has started
+                if e.status_code != 404:
+                    raise
+                summary = {}
+
+            threat_score = summary.get("threat_score")
+            verdict = summary.get("verdict")
+            if threat_score is not None or verdict:  # Analysis complete
+                return {
+                    "status": "completed",
+                    "threat_score": threat_score,
+                    "verdict": verdict,
+                    "sha256": sha256
+                }
+            if time.monotonic() >= deadline:
+                return {"status": "pending", "sha256": sha256}
+            delay = interval
+            interval = min(interval * 2, max_poll_interval)
+
+    def close(self):
+        self.session.close()
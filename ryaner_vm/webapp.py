@@ -1,31 +1,133 @@
 # 1/3/2025 01:03 --> Renamed app.py to webapp.py
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 #from flask_cors import CORS
 import pickle
 import numpy as np
 import math
 import requests
+from requests.adapters import HTTPAdapter
 import json
-from urllib.parse import urlparse, unquote
 import mimetypes
 import os
-import subprocess
 import time
-import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
-from pyhelpers.ops import is_downloadable
+from download_probe import DownloadProbe
+from falcon_sandbox import FalconSandboxClient, FalconSandboxError
+import metrics
+from verdict_cache import VerdictCache, normalize_url
+from verdict_store import SingleFlight, VerdictStore
 
 # Load VirusTotal API Key & Falcon Sandbox API Key
 load_dotenv("key.env")
 VIRUSTOTAL_API_KEY = os.getenv("VIRUSTOTAL_API_KEY")
 
+FALCON_SANDBOX_API_KEY = os.getenv("FALCON_SANDBOX_API_KEY")
+
+# Base URLs of the VirusTotal and Falcon Sandbox APIs; override to point at
+# local stubs (see benchmarks/stub_servers.py)
+VIRUSTOTAL_API_URL = os.getenv("VIRUSTOTAL_API_URL", "https://www.virustotal.com/api/v3")
+FALCON_SANDBOX_API_URL = os.getenv("FALCON_SANDBOX_API_URL", "https://www.hybrid-analysis.com/api/v2")
+
+# Falcon Sandbox analysis environment the downloads are detonated in
+FS_ENVIRONMENT_ID = int(os.getenv("FS_ENVIRONMENT_ID", "160"))
+
+# Seconds before the first summary poll, the backoff between polls (doubling
+# up to the maximum), and the longest a request waits for a finished analysis
+FS_INITIAL_WAIT = float(os.getenv("FS_INITIAL_WAIT", "2"))
+FS_POLL_INTERVAL = float(os.getenv("FS_POLL_INTERVAL", "2"))
+FS_MAX_POLL_INTERVAL = float(os.getenv("FS_MAX_POLL_INTERVAL", "15"))
+FS_MAX_WAIT = float(os.getenv("FS_MAX_WAIT", "30"))
+
+# One pooled keep-alive session to the sandbox, shared by all request threads
+falcon_sandbox = FalconSandboxClient(
+    FALCON_SANDBOX_API_URL,
+    FALCON_SANDBOX_API_KEY,
+    environment_id=FS_ENVIRONMENT_ID,
+    pool_size=int(os.getenv("FS_POOL_SIZE", "20"))
+)
+
+# Seconds between polls of a VirusTotal analysis that is still queued (doubling
+# up to the maximum), and the longest a lookup waits for it to complete;
+# keep VT_MAX_WAIT under VT_TIMEOUT
+VT_POLL_INTERVAL = float(os.getenv("VT_POLL_INTERVAL", "2"))
+VT_MAX_POLL_INTERVAL = float(os.getenv("VT_MAX_POLL_INTERVAL", "8"))
+VT_MAX_WAIT = float(os.getenv("VT_MAX_WAIT", "15"))
+
+# One pooled keep-alive session to VirusTotal, shared by all request threads
+vt_session = requests.Session()
+vt_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=int(os.getenv("VT_POOL_SIZE", "20")))
+vt_session.mount("https://", vt_adapter)
+vt_session.mount("http://", vt_adapter)
+vt_session.headers["x-apikey"] = VIRUSTOTAL_API_KEY or ""
+
+# VirusTotal verdict cache keyed by normalized URL; lifetimes in seconds per verdict type
+VT_CACHE_SAFE_TTL = float(os.getenv("VT_CACHE_SAFE_TTL", "21600"))
+VT_CACHE_MALICIOUS_TTL = float(os.getenv("VT_CACHE_MALICIOUS_TTL", "86400"))
+VT_CACHE_ERROR_TTL = float(os.getenv("VT_CACHE_ERROR_TTL", "60"))
+vt_cache = VerdictCache(maxsize=int(os.getenv("VT_CACHE_SIZE", "10000")))
+
+# Falcon Sandbox report cache keyed by normalized URL (errors use VT_CACHE_ERROR_TTL)
+FS_CACHE_TTL = float(os.getenv("FS_CACHE_TTL", "86400"))
+fs_cache = VerdictCache(maxsize=int(os.getenv("FS_CACHE_SIZE", "10000")))
+
+# Optional SQLite store shared by all worker processes (set VERDICT_STORE_PATH to enable)
+VERDICT_STORE_PATH = os.getenv("VERDICT_STORE_PATH")
+verdict_store = VerdictStore(VERDICT_STORE_PATH) if VERDICT_STORE_PATH else None
+
+# Downloadability is decided from the URL's extension where possible, else
+# from a HEAD (or ranged GET) limited to DOWNLOAD_PROBE_TIMEOUT seconds and
+# DOWNLOAD_PROBE_MAX_BYTES bytes; header answers are cached per host and path
+download_probe = DownloadProbe(
+    timeout=float(os.getenv("DOWNLOAD_PROBE_TIMEOUT", "3")),
+    max_bytes=int(os.getenv("DOWNLOAD_PROBE_MAX_BYTES", "4096")),
+    cache_size=int(os.getenv("DOWNLOAD_PROBE_CACHE_SIZE", "10000")),
+    cache_ttl=float(os.getenv("DOWNLOAD_PROBE_CACHE_TTL", "3600")),
+    pool_size=int(os.getenv("DOWNLOAD_PROBE_POOL_SIZE", "20"))
+)
+
+# Concurrent lookups of the same URL in this process share one upstream call
+vt_flight = SingleFlight()
+fs_flight = SingleFlight()
+
+# VirusTotal and Falcon Sandbox are queried in parallel on this pool. Each
+# provider has its own timeout and the whole check a combined deadline; a
+# provider that misses them is reported as timed out. A lookup still queued
+# for a pool thread is cancelled; one already running finishes in the
+# background and fills the cache for the next request.
+PROVIDER_WORKERS = int(os.getenv("PROVIDER_WORKERS", "32"))
+VT_TIMEOUT = float(os.getenv("VT_TIMEOUT", "20"))
+FS_TIMEOUT = float(os.getenv("FS_TIMEOUT", "40"))
+CHECK_DEADLINE = float(os.getenv("CHECK_DEADLINE", "45"))
+provider_pool = ThreadPoolExecutor(max_workers=PROVIDER_WORKERS, thread_name_prefix="provider")
+
 # Initialize Flask App
 app = Flask (__name__)
 
 # Enable CORS on all routes
 #CORS(app)
 
+# Prometheus metrics served on /metrics. Stage timings also feed the
+# per-request breakdown returned with ?timings=1 (or an X-Debug-Timings header).
+metrics_registry = metrics.MetricsRegistry()
+request_seconds = metrics_registry.histogram(
+    "websec_http_request_duration_seconds", "Time spent serving HTTP requests", ["endpoint", "method", "status"]
+)
+stage_seconds = metrics_registry.histogram(
+    "websec_stage_duration_seconds", "Time spent in each stage of the download check", ["stage"]
+)
+upstream_errors = metrics_registry.counter(
+    "websec_upstream_errors_total", "Failed calls to upstream services", ["provider", "kind"]
+)
+download_probes = metrics_registry.counter(
+    "websec_download_probes_total", "Download checks by deciding tier (extension, header, undecided)",
+    ["method", "downloadable"]
+)
+upstream_inflight = metrics_registry.gauge(
+    "websec_upstream_inflight", "Upstream lookups waiting on VirusTotal or Falcon Sandbox", ["provider"]
+)
+
 # Home/Root directory contents to indicate that the app is live
 @app.route("/")
 def home ():
@@ -59,99 +161,82 @@ def check_downloadable():
         if not url:
             return jsonify({"error": "No URL provided"}), 400
 
+        # Server-sent events: each provider's result as soon as it arrives, then the full result
+        if request.args.get("stream") == "1" or "text/event-stream" in request.headers.get("Accept", ""):
+            return Response(
+                stream_with_context(stream_download_check(url, metrics.timings_active())),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+
         # Step 1: Check for downloadable indicators
         download_info = analyze_download_indicators(url)
 
-        # Step 2: If downloadable, verify with VirusTotal & falcon sandbox
+        # Step 2: If downloadable, verify with VirusTotal & falcon sandbox (in parallel)
         if download_info["isDownloadable"]:
-            vt_result = check_virustotal_download(url)
-            fs_result = check_falconsandbox_download(url)
-            download_info["vtResult"] = vt_result
-            download_info["fsResult"] = fs_result # include Falcon sandbox results
-
-            # Update Risk level based on combined results
-            if fs_result and fs_result.get("status") == "completed":
-                threat_score = fs_result.get("threat_score")
-                verdict = fs_result.get("verdict")
-
-                # Update download_info with Falcon Sandbox results
-                download_info["fsScore"] = threat_score
-                download_info["fsVerdict"] = verdict
-
-                # Determine final risk level based on all results
-                if (verdict == "malicious" or
-                    vt_result.get("malicious", 0) > 0):
-                    download_info["riskLevel"] = "high_risk"
-                elif (verdict == "no specific threat" or
-                      vt_result.get("suspicious", 0) > 0):
-                    download_info["riskLevel"] = "medium_risk"
+            results = dict(check_providers(url, metrics.timings_active()))
+            apply_provider_results(download_info, results)
 
         return jsonify(download_info)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-def analyze_download_indicators(url):
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_download_check(url, timed):
+    """
+    Yield the download check as server-sent events: "indicators" first, then
+    "virustotal" and "falcon_sandbox" in whichever order they finish, and
+    finally "result" with the same JSON /checkDownloadable returns.
+    """
     try:
-        parsed_url = urlparse(url)
-        path = unquote(parsed_url.path.lower())
-
-        # # Categorize risks based on checking on file extension
-        # risk_categories = {
-        #     'high_risk': {
-        #         'executable': ['.exe', '.msi', '.dll', '.bat', '.cmd', '.sh'],
-        #         'script': ['.ps1', '.vbs', '.js', '.jsp', '.jse', '.php'],
-        #         'system': ['.sys', '.drv', '.bin']
-        #     },
-        #     'medium_risk': {
-        #         'archive': ['.zip', '.rar', '.7z', '.tar.gz', '.iso'],
-        #         'office': ['.doc', '.docm', '.xls', '.xlsm', '.ppt', '.pptm']
-        #     },
-        #     'low_risk': {
-        #         'document': ['.pdf', '.docx', '.xlsx', '.pptx', '.txt'],
-        #         'media': ['.mp3', '.mp4', '.jpg', '.png']
-        #     }
-        # }
-
-        # Check for file extensions
-#        for risk_level, categories in risk_categories.items():
-#            for category, extensions in categories.items():
-#                if any(path.endswith(ext) for ext in extensions):
-#                    return {
-#                        "isDownloadable": True,
-#                        "riskLevel": risk_level,
-#                        "category": category,
-#                        "fileType": path.split('.')[-1],
-#                        "method": "extension"
-#                    }
-
-        # check if URL is downloadable based on HTTP Headers (i.e. Content type)
-        if(is_downloadable(url)):
-            return{
-                "isDownloadable": True
-            }
+        download_info = analyze_download_indicators(url)
+        yield server_sent_event("indicators", download_info)
 
-        # Check headers for download indicators
-        # try:
-        #     head_response = requests.head(url, allow_redirects=True, timeout=5)
-        #     content_type = head_response.headers.get('Content-Type', '')
-        #     content_disp = head_response.headers.get('Content-Disposition', '')
+        if download_info["isDownloadable"]:
+            results = {}
+            for provider, result in check_providers(url, timed):
+                results[provider] = result
+                yield server_sent_event(provider, result)
+            apply_provider_results(download_info, results)
 
-        #     if 'attachment' in content_disp or 'filename' in content_disp:
-        #         return {
-        #             "isDownloadable": True,
-        #             "riskLevel": "unknown",
-        #             "method": "header",
-        #             "fileType": content_type
-        #         }
+        yield server_sent_event("result", download_info)
 
-        # except requests.exceptions.RequestException:
-        #     pass
+    except Exception as e:
+        yield server_sent_event("error", {"error": str(e)})
+
+def apply_provider_results(download_info, results):
+    vt_result = results["virustotal"]
+    fs_result = results["falcon_sandbox"]
+    download_info["vtResult"] = vt_result
+    download_info["fsResult"] = fs_result # include Falcon sandbox results
+    download_info["partial"] = any(result.get("status") == "timeout" for result in results.values())
+
+    # Update Risk level based on combined results
+    if fs_result and fs_result.get("status") == "completed":
+        threat_score = fs_result.get("threat_score")
+        verdict = fs_result.get("verdict")
+
+        # Update download_info with Falcon Sandbox results
+        download_info["fsScore"] = threat_score
+        download_info["fsVerdict"] = verdict
+
+        # Determine final risk level based on all results
+        if (verdict == "malicious" or
+            vt_result.get("malicious", 0) > 0):
+            download_info["riskLevel"] = "high_risk"
+        elif (verdict == "no specific threat" or
+              vt_result.get("suspicious", 0) > 0):
+            download_info["riskLevel"] = "medium_risk"
 
-        return {
-            "isDownloadable": False,
-            "message": "No download indicators detected"
-        }
+def analyze_download_indicators(url):
+    try:
+        with stage_seconds.time(stage="download_probe"):
+            download_info = download_probe.probe(url)
+        download_probes.inc(method=download_info["method"], downloadable=download_info["isDownloadable"])
+        return download_info
 
     except Exception as e:
         return {
@@ -159,78 +244,21 @@ def analyze_download_indicators(url):
             "message": str(e)
         }
 
-def extract_json_from_output(output):
-    """Extract JSON content from the mixed output string"""
-    json_match = re.search(r'JSON:\s*\n\s*(\{.*?\})', output, re.DOTALL)
-    if json_match:
-        json_str = json_match.group(1)
-        try:
-            return json.loads(json_str)
-        except json.JSONDecodeError:
-            return None
-    return None
-
 def check_falconsandbox_download(url):
     try:
-        # call falcon sandbox Wrapper & and submit URL (that leads to file download) for analysis
-        submit_process = subprocess.Popen(
-            f'python3 /home/ryaner2214/VxAPI/vxapi.py submit_url_to_file -v "{url}" 160',
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
+        # Submit the URL (that leads to a file download) and poll for the analysis summary
+        return falcon_sandbox.analyze(
+            url,
+            initial_wait=FS_INITIAL_WAIT,
+            poll_interval=FS_POLL_INTERVAL,
+            max_poll_interval=FS_MAX_POLL_INTERVAL,
+            max_wait=FS_MAX_WAIT,
+            timer=lambda stage: stage_seconds.time(stage=stage)
         )
 
-        submit_output, submit_error = submit_process.communicate()
-
-        if submit_process.returncode != 0:
-            print(f"Submission Error: {submit_error}")
-            return
-
-        # Parse JSON submission response to get sha256 value
-        try:
-            #submit_data = json.loads(submit_output)
-            submit_data = extract_json_from_output(submit_output)
-            sha256 = submit_data.get("sha256")
-            if not sha256:
-                raise Exception("No sha256 found in submission response")
-        except json.JSONDecodeError:
-            raise Exception("Failed to parse submission response")
-
-         # Step 2: Wait briefly for analysis to begin (adjust time as needed)
-        time.sleep(10)  # Wait 10 seconds for initial analysis
-
-        # Step 3: Get analysis report results using sha256
-        overview_process = subprocess.Popen(
-                f'python3 /home/ryaner2214/VxAPI/vxapi.py overview_get_summary -v {sha256}',
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-
-        overview_output, overview_error = overview_process.communicate()
-
-        if overview_process.returncode == 0:
-            try:
-                result_data = extract_json_from_output(overview_output)
-                if result_data:
-                     # Extract relevant fields
-                    threat_score = result_data.get("threat_score")
-                    verdict = result_data.get("verdict")
-
-                if threat_score is not None or verdict:  # Analysis complete
-                    print("\nAnalysis completed successfully!")
-                    return {
-                        "status": "completed",
-                        "threat_score": threat_score,
-                        "verdict": verdict,
-                        "sha256": sha256
-                    }
-            except json.JSONDecodeError:
-                pass
-
-    except Exception as e:
+    except FalconSandboxError as e:
+        kind = f"status_{e.status_code}" if e.status_code is not None else type(e.__cause__ or e).__name__
+        upstream_errors.inc(provider="falcon_sandbox", kind=kind)
         return {
             # return error message for why falcon sandbox failed
             "status": "error",
@@ -239,37 +267,54 @@ def check_falconsandbox_download(url):
 
 def check_virustotal_download(url):
     try:
-        headers = {
-            "x-apikey": VIRUSTOTAL_API_KEY
-        }
-
         # Submit URL for scanning
-        scan_response = requests.post(
-            "https://www.virustotal.com/api/v3/urls",
-            headers=headers,
-            data={"url": url}
-        )
+        with stage_seconds.time(stage="vt_submit"):
+            scan_response = vt_session.post(
+                f"{VIRUSTOTAL_API_URL}/urls",
+                data={"url": url},
+                timeout=10
+            )
 
         if scan_response.status_code != 200:
+            upstream_errors.inc(provider="virustotal", kind=f"status_{scan_response.status_code}")
             return {
                 "status": "error",
                 "message": "VirusTotal scan submission failed"
             }
 
         analysis_id = scan_response.json().get("data", {}).get("id")
-        report_url = f"https://www.virustotal.com/api/v3/analyses/{analysis_id}"
-
-        # Get analysis results
-        report_response = requests.get(report_url, headers=headers)
-
-        if report_response.status_code != 200:
-            return {
-                "status": "error",
-                "message": "Failed to get scan results"
-            }
-
-        results = report_response.json()
-        stats = results.get("data", {}).get("attributes", {}).get("stats", {})
+        report_url = f"{VIRUSTOTAL_API_URL}/analyses/{analysis_id}"
+
+        # Poll the analysis until it completes: a queued or in-progress one
+        # reports all-zero stats, which must not pass for a clean file
+        deadline = time.monotonic() + VT_MAX_WAIT
+        interval = VT_POLL_INTERVAL
+        while True:
+            with stage_seconds.time(stage="vt_report"):
+                report_response = vt_session.get(report_url, timeout=10)
+
+            if report_response.status_code != 200:
+                upstream_errors.inc(provider="virustotal", kind=f"status_{report_response.status_code}")
+                return {
+                    "status": "error",
+                    "message": "Failed to get scan results"
+                }
+
+            attributes = report_response.json().get("data", {}).get("attributes", {})
+            if attributes.get("status") == "completed":
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # Not a verdict; vt_cache_ttl keeps it for VT_CACHE_ERROR_TTL only
+                return {
+                    "status": "pending",
+                    "message": f"VirusTotal analysis not finished (status: {attributes.get('status')})"
+                }
+            with stage_seconds.time(stage="vt_poll_wait"):
+                time.sleep(min(interval, remaining))
+            interval = min(interval * 2, VT_MAX_POLL_INTERVAL)
+
+        stats = attributes.get("stats", {})
 
         return {
             "status": "completed",
@@ -280,10 +325,161 @@ def check_virustotal_download(url):
         }
 
     except Exception as e:
+        upstream_errors.inc(provider="virustotal", kind=type(e).__name__)
         return {
             "status": "error",
             "message": str(e)
         }
 
+def vt_cache_ttl(result):
+    if result.get("status") != "completed":
+        return VT_CACHE_ERROR_TTL
+    if result.get("malicious", 0) > 0 or result.get("suspicious", 0) > 0:
+        return VT_CACHE_MALICIOUS_TTL
+    return VT_CACHE_SAFE_TTL
+
+def lookup_virustotal_download(url, key):
+    upstream_inflight.inc(provider="virustotal")
+    try:
+        if verdict_store is None:
+            return check_virustotal_download(url)
+        return verdict_store.fetch("virustotal", key, lambda: check_virustotal_download(url), vt_cache_ttl)
+    finally:
+        upstream_inflight.dec(provider="virustotal")
+
+def cached_check_virustotal_download(url):
+    key = normalize_url(url)
+    result = vt_cache.get(key)
+    if result is None:
+        result = vt_flight.run(key, lambda: lookup_virustotal_download(url, key))
+        vt_cache.set(key, result, vt_cache_ttl(result))
+    return result
+
+def fs_cache_ttl(result):
+    if result.get("status") != "completed":
+        return VT_CACHE_ERROR_TTL
+    return FS_CACHE_TTL
+
+def lookup_falconsandbox_download(url, key):
+    upstream_inflight.inc(provider="falcon_sandbox")
+    try:
+        if verdict_store is None:
+            return check_falconsandbox_download(url)
+        return verdict_store.fetch("falcon", key, lambda: check_falconsandbox_download(url), fs_cache_ttl)
+    finally:
+        upstream_inflight.dec(provider="falcon_sandbox")
+
+def cached_check_falconsandbox_download(url):
+    key = normalize_url(url)
+    result = fs_cache.get(key)
+    if result is None:
+        result = fs_flight.run(key, lambda: lookup_falconsandbox_download(url, key))
+        fs_cache.set(key, result, fs_cache_ttl(result))
+    return result
+
+# Hit/miss/eviction counters for the VirusTotal and Falcon Sandbox caches and the download probe cache
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "virustotal": vt_cache.stats(),
+        "falcon_sandbox": fs_cache.stats(),
+        "download_probe": download_probe.stats()
+    })
+
+# (provider, lookup, timeout in seconds) for the parallel checks in check_providers
+PROVIDERS = [
+    ("virustotal", cached_check_virustotal_download, VT_TIMEOUT),
+    ("falcon_sandbox", cached_check_falconsandbox_download, FS_TIMEOUT),
+]
+
+def run_provider(provider, lookup, url, timed):
+    # Runs on the provider pool; its stage timings are handed back to the request thread
+    if timed:
+        metrics.begin_timings()
+    try:
+        with stage_seconds.time(stage=provider):
+            result = lookup(url)
+    except Exception as e:
+        result = {"status": "error", "message": str(e)}
+    return result, metrics.end_timings()
+
+def check_providers(url, timed=False):
+    """
+    Query every provider in PROVIDERS concurrently and yield (provider,
+    result) as each one finishes. A provider still running at its timeout,
+    or at the CHECK_DEADLINE for the whole check, yields
+    {"status": "timeout", ...} instead; if its lookup has not started yet
+    it is cancelled, so timed-out checks do not pile up on the pool.
+    """
+    start = time.monotonic()
+    futures = {}
+    for provider, lookup, timeout in PROVIDERS:
+        future = provider_pool.submit(run_provider, provider, lookup, url, timed)
+        futures[future] = (provider, min(timeout, CHECK_DEADLINE))
+
+    pending = set(futures)
+    try:
+        while pending:
+            next_deadline = min(start + futures[future][1] for future in pending)
+            done, _ = wait(pending, timeout=max(next_deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                result, timings = future.result()
+                for stage, milliseconds in (timings or {}).items():
+                    metrics.record_timing(stage, milliseconds / 1000)
+                yield futures[future][0], result
+
+            elapsed = time.monotonic() - start
+            for future in [future for future in pending if elapsed >= futures[future][1]]:
+                pending.discard(future)
+                future.cancel()
+                provider, limit = futures[future]
+                upstream_errors.inc(provider=provider, kind="timeout")
+                yield provider, {"status": "timeout", "message": f"No {provider} result within {limit:g}s"}
+    finally:
+        # A streaming client that disconnected closes the generator early
+        for future in pending:
+            future.cancel()
+
+# Cache counters are read at scrape time
+def cache_stat(field):
+    return lambda: {
+        ("virustotal",): vt_cache.stats()[field],
+        ("falcon_sandbox",): fs_cache.stats()[field],
+        ("download_probe",): download_probe.stats()[field]
+    }
+
+metrics_registry.callback("websec_cache_hits_total", "Verdict cache hits", "counter", cache_stat("hits"), ["cache"])
+metrics_registry.callback("websec_cache_misses_total", "Verdict cache misses", "counter", cache_stat("misses"), ["cache"])
+metrics_registry.callback("websec_cache_evictions_total", "Verdict cache LRU evictions", "counter", cache_stat("evictions"), ["cache"])
+metrics_registry.callback("websec_cache_entries", "Entries held in each cache", "gauge", cache_stat("size"), ["cache"])
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if request.args.get("timings") == "1" or request.headers.get("X-Debug-Timings"):
+        metrics.begin_timings()
+
+@app.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    request_seconds.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+
+    # Debug breakdown: stage timings for this request, added to JSON object responses
+    timings = metrics.end_timings()
+    if timings is not None and response.is_json:
+        body = response.get_json(silent=True)
+        if isinstance(body, dict):
+            timings["total"] = round(elapsed * 1000, 3)
+            body["timings_ms"] = timings
+            response.set_data(json.dumps(body))
+    return response
+
+# Prometheus scrape endpoint
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics_registry.render(), content_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
-        app.run(host = "0.0.0.0", port=5210)
\ No newline at end of file
+        app.run(host = "0.0.0.0", port=int(os.getenv("PORT", "5210")))
\ No newline at end of file
@@ -0,0 +1,88 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The server and training modules are plain scripts in azure_vm/, ryaner_vm/
+# and training/, imported by file name; the modules they share are identical
+# copies. benchmarks/ provides the upstream stub servers.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "azure_vm"))
+sys.path.insert(1, os.path.join(REPO_ROOT, "ryaner_vm"))
+sys.path.insert(2, os.path.join(REPO_ROOT, "training"))
+sys.path.insert(3, os.path.join(REPO_ROOT, "benchmarks"))
+
+# Importing app loads a model and reads its settings from the environment:
+# serve the committed model, with no watcher threads or warm-up
+os.environ.setdefault("MODEL_PATH", os.path.join(REPO_ROOT, "training", "xgboost_model.npz"))
+os.environ.setdefault("MODEL_RELOAD_INTERVAL", "0")
+os.environ.setdefault("PRELOAD_WORKERS", "1")
+
+
+class FakeVirusTotal:
+    """
+    Local stand-in for the VirusTotal v3 API on an ephemeral port:
+    POST /urls answers `submit_status`, GET /analyses/<id> answers 409 for
+    the first `conflicts` fetches, then a "queued" analysis with all-zero
+    stats for the next `queued` ones, and then the completed report with
+    `stats`, after `release` is set.
+    """
+
+    def __init__(self):
+        self.submit_status = 200
+        self.conflicts = 0
+        self.queued = 0
+        self.stats = {"malicious": 3, "harmless": 60, "undetected": 10, "suspicious": 0, "timeout": 0}
+        self.release = threading.Event()
+        self.release.set()
+        self.requests = []
+        # Client ports the requests came from, one per TCP connection
+        self.connections = set()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so a pooled client can reuse its connection
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                fake.requests.append(("POST", self.path))
+                fake.connections.add(self.client_address[1])
+                if fake.submit_status != 200:
+                    return self.reply(fake.submit_status, {"error": {"code": "QuotaExceededError"}})
+                self.reply(200, {"data": {"id": "analysis-1"}})
+
+            def do_GET(self):
+                fake.requests.append(("GET", self.path))
+                fake.connections.add(self.client_address[1])
+                fake.release.wait(10)
+                if fake.conflicts:
+                    fake.conflicts -= 1
+                    return self.reply(409, {"error": {"code": "ConflictError"}})
+                if fake.queued:
+                    fake.queued -= 1
+                    zeros = {name: 0 for name in fake.stats}
+                    return self.reply(200, {"data": {"attributes": {"status": "queued", "stats": zeros}}})
+                self.reply(200, {"data": {"attributes": {"status": "completed", "stats": fake.stats}}})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/api/v3"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.release.set()
+        self.server.shutdown()
+        self.server.server_close()
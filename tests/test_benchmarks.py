@@ -0,0 +1,39 @@
+import json
+import sys
+import bench_models
+from results import compare, measure, write_results
+
+
+def test_model_benchmarks_run(tmp_path, monkeypatch):
+    # Every benchmark once, at small sizes, with the committed model
+    output = tmp_path / "models.json"
+    monkeypatch.setattr(sys, "argv", [
+        "bench_models.py", "--sizes", "1", "10", "--min-time", "0", "--model-pkl", "", "--output", str(output)
+    ])
+    bench_models.main()
+
+    document = json.loads(output.read_text())
+    assert document["suite"] == "models"
+    results = document["results"]
+    for name in ("feature_extractor_run/per_url", "url_features_v2/per_url",
+                 "extract_features/batch_10", "extract_features_v2/batch_10",
+                 "predict_proba/tree_ensemble/batch_1", "predict_proba/tree_ensemble/batch_10"):
+        assert results[name]["calls"] >= 5
+        assert results[name]["per_url_us"] > 0
+
+
+def test_compare_flags_regressions(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    write_results(str(baseline), "models", {"fast": {"p50_ms": 1.0}, "slow": {"p50_ms": 1.0}, "gone": {"p50_ms": 1.0}})
+    current = {"results": {"fast": {"p50_ms": 1.05}, "slow": {"p50_ms": 1.5}, "new": {"p50_ms": 9.0}}}
+
+    assert compare(str(baseline), current, tolerance=0.10) == ["slow"]
+    assert compare(str(baseline), current, tolerance=0.60) == []
+
+
+def test_measure_honours_min_calls():
+    calls = []
+    summary = measure(lambda: calls.append(1), min_time=0, min_calls=7, warmup=2)
+    assert summary["calls"] == 7
+    assert len(calls) == 9
+    assert summary["min_ms"] <= summary["p50_ms"] <= summary["max_ms"]
@@ -0,0 +1,115 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import webapp
+from conftest import FakeVirusTotal
+
+
+@pytest.fixture
+def single_thread_pool(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(webapp, "provider_pool", pool)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def test_timed_out_lookups_are_cancelled(monkeypatch, single_thread_pool):
+    release = threading.Event()
+    queued_calls = []
+
+    def slow(url):
+        release.wait(5)
+        return {"status": "completed"}
+
+    def queued(url):
+        queued_calls.append(url)
+        return {"status": "completed"}
+
+    # The slow lookup holds the only pool thread, so the second one is still queued at its timeout
+    monkeypatch.setattr(webapp, "PROVIDERS", [("slow", slow, 0.05), ("queued", queued, 0.05)])
+    try:
+        results = dict(webapp.check_providers("http://example.com/file.exe"))
+    finally:
+        release.set()
+    single_thread_pool.shutdown(wait=True)
+
+    assert results["slow"]["status"] == "timeout"
+    assert results["queued"]["status"] == "timeout"
+    assert queued_calls == []
+
+
+def test_closing_the_stream_cancels_queued_lookups(monkeypatch, single_thread_pool):
+    release = threading.Event()
+    queued_calls = []
+
+    def fast(url):
+        return {"status": "completed"}
+
+    def slow(url):
+        release.wait(5)
+        return {"status": "completed"}
+
+    monkeypatch.setattr(webapp, "PROVIDERS", [
+        ("fast", fast, 5), ("slow", slow, 5), ("queued", lambda url: queued_calls.append(url), 5),
+    ])
+    checks = webapp.check_providers("http://example.com/file.exe")
+    assert next(checks) == ("fast", {"status": "completed"})
+    checks.close()
+    release.set()
+    single_thread_pool.shutdown(wait=True)
+
+    assert queued_calls == []
+
+
+def test_falcon_sandbox_results_are_cached(monkeypatch):
+    calls = []
+
+    def check(url):
+        calls.append(url)
+        return {"status": "completed", "verdict": "no specific threat"}
+
+    monkeypatch.setattr(webapp, "check_falconsandbox_download", check)
+    monkeypatch.setattr(webapp, "verdict_store", None)
+    webapp.fs_cache.clear()
+
+    url = "http://example.com/setup.exe"
+    first = webapp.cached_check_falconsandbox_download(url)
+    assert webapp.cached_check_falconsandbox_download("HTTP://EXAMPLE.COM/setup.exe") == first
+    assert calls == [url]
+
+
+@pytest.fixture
+def fake_vt(monkeypatch):
+    fake = FakeVirusTotal()
+    monkeypatch.setattr(webapp, "VIRUSTOTAL_API_URL", fake.url)
+    monkeypatch.setattr(webapp, "VT_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(webapp, "verdict_store", None)
+    webapp.vt_cache.clear()
+    yield fake
+    fake.close()
+
+
+def test_queued_download_analysis_is_polled(fake_vt):
+    fake_vt.queued = 2
+    result = webapp.check_virustotal_download("http://example.com/setup.exe")
+    assert result["status"] == "completed"
+    assert result["malicious"] == 3
+    assert [method for method, _ in fake_vt.requests] == ["POST", "GET", "GET", "GET"]
+
+
+def test_unfinished_download_analysis_is_not_cached_as_clean(fake_vt, monkeypatch):
+    fake_vt.queued = 1000
+    monkeypatch.setattr(webapp, "VT_MAX_WAIT", 0.05)
+
+    url = "http://example.com/setup.exe"
+    result = webapp.cached_check_virustotal_download(url)
+    assert result["status"] == "pending"
+    assert "malicious" not in result
+    assert webapp.vt_cache_ttl(result) == webapp.VT_CACHE_ERROR_TTL
+
+    # Once VirusTotal finishes, the next lookup after the short TTL gets the verdict
+    webapp.vt_cache.clear()
+    fake_vt.queued = 0
+    assert webapp.cached_check_virustotal_download(url)["status"] == "completed"
@@ -0,0 +1,90 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from download_probe import DownloadProbe
+
+
+class RedirectingFileHost(BaseHTTPRequestHandler):
+    """
+    /hop/<n> redirects to /hop/<n-1> after `delay` seconds; /hop/0 serves a
+    file, answering HEAD with 405 when `refuse_head` is set.
+    """
+
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    refuse_head = False
+
+    def log_message(self, format, *args):
+        pass
+
+    def _answer(self, body):
+        time.sleep(self.delay)
+        hops = int(self.path.rsplit("/", 1)[1])
+        if hops:
+            self.send_response(302)
+            self.send_header("Location", f"/hop/{hops - 1}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.command == "HEAD" and self.refuse_head:
+            self.send_response(405)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", "1024")
+            self.end_headers()
+            if body:
+                self.wfile.write(b"MZ" + b"\0" * 1022)
+
+    def do_HEAD(self):
+        self._answer(body=False)
+
+    def do_GET(self):
+        self._answer(body=True)
+
+
+@pytest.fixture
+def file_host():
+    servers = []
+
+    def start(**attributes):
+        handler = type("Handler", (RedirectingFileHost,), attributes)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/hop"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("refuse_head", [False, True])
+def test_redirects_are_followed(file_host, refuse_head):
+    base = file_host(refuse_head=refuse_head)
+    result = DownloadProbe(timeout=5).probe(f"{base}/3")
+    assert result["isDownloadable"] is True
+    assert result["method"] == "header"
+
+
+def test_timeout_covers_the_whole_redirect_chain(file_host):
+    # Every hop answers well within the timeout, the chain as a whole does not
+    base = file_host(delay=0.2)
+    probe = DownloadProbe(timeout=0.5)
+
+    started = time.monotonic()
+    result = probe.probe(f"{base}/6")
+    assert time.monotonic() - started < 1.0
+    assert result["method"] == "undecided"
+    assert "0.5s" in result["message"] or "timed out" in result["message"].lower()
+
+
+def test_redirect_loops_are_cut_off(file_host):
+    base = file_host()
+    result = DownloadProbe(timeout=5).probe(f"{base}/50")
+    assert result["method"] == "undecided"
+    assert "redirects" in result["message"]
@@ -0,0 +1,94 @@
+import time
+from types import SimpleNamespace
+import pytest
+import falcon_sandbox
+from falcon_sandbox import FalconSandboxClient, FalconSandboxError
+from stub_servers import start_stub_servers, stop_stub_servers
+
+POLL = {"initial_wait": 0.05, "poll_interval": 0.05, "max_poll_interval": 0.2}
+
+
+@pytest.fixture
+def falcon(monkeypatch):
+    # Records the waits between summary polls (they still happen)
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        time.sleep(seconds)
+
+    monkeypatch.setattr(falcon_sandbox, "time", SimpleNamespace(monotonic=time.monotonic, sleep=sleep))
+    started = []
+
+    def start(**options):
+        stubs = start_stub_servers(**options)
+        started.append(stubs)
+        client = FalconSandboxClient(stubs["env"]["FALCON_SANDBOX_API_URL"], api_key="test", timeout=5)
+        return client, sleeps
+
+    yield start
+    for stubs in started:
+        stop_stub_servers(stubs)
+
+
+class Stage:
+    # Timer context manager that logs the stages analyze() goes through
+    def __init__(self, log, stage):
+        self.log = log
+        self.stage = stage
+
+    def __enter__(self):
+        self.log.append(self.stage)
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_submit_poll_report(falcon):
+    client, sleeps = falcon(falcon_analysis_time=0.3)
+    log = []
+
+    result = client.analyze("http://files.example/setup.exe", max_wait=10, timer=lambda stage: Stage(log, stage), **POLL)
+    assert result["status"] == "completed"
+    assert result["threat_score"] in (5, 85)
+    assert result["verdict"] in ("malicious", "no specific threat")
+    assert result["sha256"]
+
+    # One submission, then a wait before every summary poll, doubling up to the cap
+    assert log[0] == "fs_submit"
+    assert log[1:] == ["fs_poll_wait", "fs_summary"] * (len(log) // 2)
+    assert len(sleeps) >= 3
+    assert sleeps == pytest.approx([0.05, 0.05, 0.1, 0.2, 0.2, 0.2, 0.2][:len(sleeps)])
+    assert sum(sleeps) >= 0.3
+
+
+def test_unfinished_analysis_times_out_as_pending(falcon):
+    client, sleeps = falcon(falcon_analysis_time=60)
+
+    started = time.monotonic()
+    result = client.analyze("http://files.example/slow.exe", max_wait=0.4, **POLL)
+    elapsed = time.monotonic() - started
+    assert result["status"] == "pending"
+    assert result["sha256"]
+    # The last wait is cut short at the deadline rather than overshooting it
+    assert sum(sleeps) == pytest.approx(0.4, abs=0.05)
+    assert elapsed < 1
+
+
+def test_error_status_raises(falcon):
+    client, sleeps = falcon(falcon_error_status=500)
+
+    with pytest.raises(FalconSandboxError) as error:
+        client.analyze("http://files.example/broken.exe", max_wait=10, **POLL)
+    assert error.value.status_code == 500
+    # Not retried
+    assert sleeps == [0.05]
+
+
+def test_missing_summary_is_polled_until_the_deadline(falcon):
+    # A 404 means the analysis has not started yet, not a failure
+    client, sleeps = falcon(falcon_error_status=404)
+
+    result = client.analyze("http://files.example/queued.exe", max_wait=0.3, **POLL)
+    assert result["status"] == "pending"
+    assert len(sleeps) > 1
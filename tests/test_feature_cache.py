@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_cache import build_feature_cache, load_feature_cache, load_or_build_feature_cache, schema_cache_dir
+from url_features import FEATURE_SCHEMAS
+
+URLS = [
+    "https://www.google.com/finance?cid=6512",
+    "http://77.247.88.118:44946/bin.sh",
+    "http://192.168.0.1/admin#login",
+    "https://example.com/a?b=1&c=2&d=3#x#y",
+    "paypal-verify.account-update.xyz/login",
+    "https://例子.测试/路径?查询=值",
+    "ftp://files.example.org/setup.exe",
+]
+TYPES = ["benign", "malware", "phishing", "benign", "phishing", "benign", "malware"]
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "urls.csv"
+    pd.DataFrame({"url": URLS, "type": TYPES}).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("feature_schema", sorted(FEATURE_SCHEMAS))
+@pytest.mark.parametrize("workers", [1, 2])
+def test_cache_matches_direct_extraction(csv_path, tmp_path, feature_schema, workers):
+    cache_dir = str(tmp_path / "cache")
+    meta = build_feature_cache(csv_path, cache_dir, chunksize=3, workers=workers, feature_schema=feature_schema)
+    assert meta["rows"] == len(URLS)
+
+    schema_dir = schema_cache_dir(cache_dir, feature_schema)
+    assert sorted(os.listdir(schema_dir)) == ["features.npy", "labels.npy", "meta.json"]
+
+    features, labels = load_feature_cache(csv_path, cache_dir, feature_schema=feature_schema)
+    expected = FEATURE_SCHEMAS[feature_schema].extract_training(pd.Series(URLS))
+    assert features.shape == expected.shape
+    np.testing.assert_array_equal(np.asarray(features), expected)
+    assert labels.tolist() == TYPES
+
+
+def test_schemas_keep_separate_caches(csv_path, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    load_or_build_feature_cache(csv_path, cache_dir, feature_schema=1)
+    load_or_build_feature_cache(csv_path, cache_dir, feature_schema=2)
+    # Building schema 2 left the schema 1 cache valid
+    assert load_feature_cache(csv_path, cache_dir, feature_schema=1) is not None
+    assert load_feature_cache(csv_path, cache_dir, feature_schema=2) is not None
+
+
+def test_empty_csv(tmp_path):
+    path = tmp_path / "empty.csv"
+    path.write_text("url,type\n")
+    cache_dir = str(tmp_path / "cache")
+    build_feature_cache(str(path), cache_dir, feature_schema=1)
+    features, labels = load_feature_cache(str(path), cache_dir, feature_schema=1)
+    assert features.shape == (0, len(FEATURE_SCHEMAS[1].names))
+    assert len(labels) == 0
@@ -0,0 +1,47 @@
+from host_reputation import ALLOW, DENY, HostReputation, build_index
+
+
+def write_list(path, hosts):
+    path.write_text("\n".join(hosts) + "\n")
+    return path
+
+
+def test_lookup(tmp_path):
+    allow = tmp_path / "allow.npy"
+    deny = tmp_path / "deny.npy"
+    build_index([write_list(tmp_path / "allow.txt", ["1,example.com"])], str(allow))
+    build_index([write_list(tmp_path / "deny.txt", ["evil.test", "http://phish.example.org/login"])], str(deny))
+
+    reputation = HostReputation(str(allow), str(deny))
+    assert reputation.lookup("https://www.example.com/") == ALLOW
+    # Allow entries do not cover subdomains; deny entries do
+    assert reputation.lookup("https://sub.example.com/") is None
+    assert reputation.lookup("http://a.b.evil.test/x") == DENY
+    assert reputation.lookup("phish.example.org") == DENY
+    assert reputation.sizes() == {ALLOW: 1, DENY: 2}
+
+
+def test_missing_list_starts_empty_and_loads_later(tmp_path, capsys):
+    deny = tmp_path / "deny.npy"
+    reputation = HostReputation(None, str(deny))
+    assert reputation.lookup("http://evil.test/") is None
+    assert reputation.sizes() == {}
+    assert "not found" in capsys.readouterr().out
+
+    # Logged once, not on every reload
+    assert not reputation.reload()
+    assert capsys.readouterr().out == ""
+
+    build_index([write_list(tmp_path / "deny.txt", ["evil.test"])], str(deny))
+    assert reputation.reload()
+    assert reputation.lookup("http://evil.test/") == DENY
+
+
+def test_removed_list_keeps_serving(tmp_path):
+    deny = tmp_path / "deny.npy"
+    build_index([write_list(tmp_path / "deny.txt", ["evil.test"])], str(deny))
+    reputation = HostReputation(None, str(deny))
+    deny.unlink()
+
+    assert not reputation.reload()
+    assert reputation.lookup("http://evil.test/") == DENY
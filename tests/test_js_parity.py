@@ -0,0 +1,29 @@
+import os
+import shutil
+
+import pytest
+
+import js_parity
+from conftest import REPO_ROOT
+from url_features import FEATURE_NAMES
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+
+MODEL_PATH = os.path.join(REPO_ROOT, "training", "xgboost_model.npz")
+MODEL_JSON = os.path.join(REPO_ROOT, "popup", "url_model.json")
+
+
+def test_js_features_and_scores_match_python():
+    urls = js_parity.build_corpus(limit=5000)
+    mismatches, drift, _, _ = js_parity.compare(urls, MODEL_PATH, MODEL_JSON)
+    assert [urls[i] for i in mismatches] == []
+    assert drift.max() <= 1e-5
+
+
+def test_unicode_digit_ip_addresses():
+    # int() reads decimal digits of any script, but not superscripts
+    urls = ["http://١٢٧.٠.٠.١/", "http://𝟏𝟗𝟐.𝟏𝟔𝟖.𝟎.𝟏/", "http://૨૫૬.1.1.1/", "http://1.2.3.²/"]
+    _, _, py_features, js_features = js_parity.compare(urls, MODEL_PATH, MODEL_JSON)
+    is_ip = FEATURE_NAMES.index("is_ip")
+    assert py_features[:, is_ip].tolist() == [1, 1, 0, 0]
+    assert js_features[:, is_ip].tolist() == [1, 1, 0, 0]
@@ -0,0 +1,71 @@
+import threading
+import uuid
+import pytest
+import app
+from cascade import Cascade
+from vt_jobs import VirusTotalJobs
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+def unique_url():
+    return f"http://{uuid.uuid4().hex}.example/login"
+
+
+def test_batch_size_limit(client):
+    assert client.post("/predict/batch", json={"urls": []}).status_code == 400
+    assert client.post("/predict/batch", json={"urls": "http://a.example/"}).status_code == 400
+
+    response = client.post("/predict/batch", json={"urls": ["http://a.example/"] * (app.MAX_BATCH_SIZE + 1)})
+    assert response.status_code == 400
+    assert f"max {app.MAX_BATCH_SIZE}" in response.get_json()["error"]
+
+    response = client.post("/predict/batch", json={"urls": ["http://a.example/"] * app.MAX_BATCH_SIZE})
+    assert response.status_code == 200
+    assert len(response.get_json()["results"]) == app.MAX_BATCH_SIZE
+
+
+def test_mixed_valid_and_invalid_urls(client, monkeypatch):
+    # Every score is confidently safe, so nothing is sent to VirusTotal
+    monkeypatch.setattr(app, "cascade", Cascade(safe_below=1.01, malicious_at=1.01))
+    urls = ["http://a.example/", "", 42, None, "https://b.example/x?a=1&b=2"]
+
+    response = client.post("/predict/batch", json={"urls": urls})
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert [result["url"] for result in results] == urls
+    for i in (1, 2, 3):
+        assert results[i]["error"] == "No URL provided"
+    for i in (0, 4):
+        assert "error" not in results[i]
+        single = client.post("/predict", json={"url": urls[i]}).get_json()
+        assert results[i]["malicious_probability"] == single["malicious_probability"]
+
+
+def test_full_queue_fails_only_the_items_that_needed_it(client, monkeypatch):
+    release = threading.Event()
+    jobs = VirusTotalJobs(lambda url: release.wait(10) and {"risk": "Safe", "stats": {}}, max_workers=1, max_pending=1)
+    monkeypatch.setattr(app, "vt_jobs", jobs)
+    # Every score is uncertain, so every URL is escalated
+    monkeypatch.setattr(app, "cascade", Cascade(safe_below=0.0, malicious_at=1.01))
+    urls = [unique_url(), "", unique_url(), unique_url()]
+    try:
+        response = client.post("/predict/batch", json={"urls": urls})
+        assert response.status_code == 200
+        results = response.get_json()["results"]
+    finally:
+        release.set()
+
+    assert results[0]["virustotal"] == "Pending"
+    assert results[1]["error"] == "No URL provided"
+    for result, url in zip(results[2:], urls[2:]):
+        assert result["url"] == url
+        assert "queue is full" in result["error"]
+
+    # The job queued for the first item still runs to completion
+    job = jobs.get(results[0]["virustotal_job"], wait=10)
+    assert job["status"] == "completed"
+    assert job["result"]["risk"] == "Safe"
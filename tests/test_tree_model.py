@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+import tree_model
+from tree_model import TreeEnsemble, export_tree_model
+
+xgb = pytest.importorskip("xgboost")
+
+
+def make_data(rows=2000, features=9, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(rows, features)).astype(np.float32)
+    y = ((X[:, 0] + X[:, 1] * X[:, 2] - 0.5 * X[:, 3]) > 0).astype(int)
+    # Missing values take each split's default direction
+    X[rng.random(X.shape) < 0.05] = np.nan
+    return X, y
+
+
+def export(model, tmp_path):
+    path = str(tmp_path / "model.npz")
+    export_tree_model(model, path)
+    return path
+
+
+def test_matches_xgboost_predict_proba(tmp_path):
+    X, y = make_data()
+    model = xgb.XGBClassifier(n_estimators=30, max_depth=5, learning_rate=0.3).fit(X, y)
+    ensemble = TreeEnsemble(export(model, tmp_path))
+
+    assert ensemble.dense
+    np.testing.assert_allclose(ensemble.predict_proba(X), model.predict_proba(X), atol=1e-5)
+    np.testing.assert_allclose(ensemble.predict_proba(X[:1]), model.predict_proba(X[:1]), atol=1e-5)
+
+
+def test_deep_trees_use_the_node_arrays(tmp_path, monkeypatch):
+    X, y = make_data(seed=1)
+    model = xgb.XGBClassifier(
+        n_estimators=10, tree_method="hist", grow_policy="lossguide", max_depth=0, max_leaves=64
+    ).fit(X, y)
+    path = export(model, tmp_path)
+
+    monkeypatch.setattr(tree_model, "MAX_DENSE_DEPTH", 3)
+    ensemble = TreeEnsemble(path)
+    assert ensemble.max_depth > 3
+    assert not ensemble.dense
+    assert not hasattr(ensemble, "dense_leaf")
+    np.testing.assert_allclose(ensemble.predict_proba(X), model.predict_proba(X), atol=1e-5)
+
+
+def test_slot_budget_limits_the_dense_layout(tmp_path, monkeypatch):
+    X, y = make_data(seed=2)
+    model = xgb.XGBClassifier(n_estimators=20, max_depth=4).fit(X, y)
+    path = export(model, tmp_path)
+
+    monkeypatch.setattr(tree_model, "MAX_DENSE_SLOTS", 20 * 2 ** 4 - 1)
+    sparse = TreeEnsemble(path)
+    monkeypatch.undo()
+    dense = TreeEnsemble(path)
+    assert dense.dense and not sparse.dense
+    np.testing.assert_allclose(sparse.predict_proba(X), dense.predict_proba(X), atol=1e-6)
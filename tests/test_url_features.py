@@ -0,0 +1,131 @@
+import math
+import random
+import tracemalloc
+from collections import Counter
+import numpy as np
+import pytest
+from url_features import FEATURE_NAMES, FeatureExtractor, extract_features
+from url_tokenizer import FEATURE_NAMES_V2, url_features_v2
+
+# Edge cases for the vectorized extractor: surrounding whitespace (entropy
+# falls back to the scalar path), Unicode digits, dotted quads that are and
+# are not IPs, fragments, parameters, "http" inside the path, and empty URLs
+EDGE_CASE_URLS = [
+    "",
+    "/",
+    " ",
+    "  http://www.example.com/  ",
+    "\thttps://example.com/a?b=1\n",
+    "https://www.google.com/finance?cid=6512",
+    "http://www.stock888.cn/",
+    "example.com",
+    "www.example.com/path/",
+    "http://192.168.0.1/",
+    "http://192.168.0.1:8080/a",
+    "256.1.1.1/index.html",
+    "1.2.3/abc",
+    "1.2.3.4.5/",
+    "http://١٢٧.0.0.1/",
+    "http://example.com/٣٤٥/²",
+    "https://example.com/page#top",
+    "https://example.com/page#a#b",
+    "https://example.com/?a=1&b=2&c=3",
+    "https://example.com/&&&",
+    "example.com/redirect?to=http://evil.example/https",
+    "httpsexample.com/http",
+    "HTTP://EXAMPLE.COM/HTTPS",
+    "https://xn--pple-43d.com/",
+    "https://раypal.com/signin",
+    "http://122.114.193.75/demon.x64.exe.dll",
+    "https://raw.githubusercontent.com/crypto101/crypto101.github.io/master/Crypto101.pdf",
+]
+
+
+def _training_extractor():
+    # training.py's FeatureExtractor (no preprocessing); importing training.py
+    # itself would pull in xgboost, sklearn and imblearn
+    class RawFeatureExtractor(FeatureExtractor):
+        def __init__(self, url=""):
+            self.url = url
+            self.domain = url.split('//')[-1].split('/')[0]
+
+    return RawFeatureExtractor
+
+
+@pytest.mark.parametrize("preprocess", [True, False])
+def test_extract_features_matches_feature_extractor(preprocess):
+    extractor = FeatureExtractor if preprocess else _training_extractor()
+    expected = np.array(
+        [[extractor(url).run()[name] for name in FEATURE_NAMES] for url in EDGE_CASE_URLS],
+        dtype=np.float32
+    )
+    actual = extract_features(EDGE_CASE_URLS, preprocess=preprocess)
+    assert actual.shape == (len(EDGE_CASE_URLS), len(FEATURE_NAMES))
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_extract_features_across_chunks(monkeypatch):
+    import url_features
+    monkeypatch.setattr(url_features, "CHUNK_SIZE", 4)
+    expected = np.array(
+        [[FeatureExtractor(url).run()[name] for name in FEATURE_NAMES] for url in EDGE_CASE_URLS],
+        dtype=np.float32
+    )
+    np.testing.assert_array_equal(extract_features(EDGE_CASE_URLS), expected)
+
+
+def _wide_alphabet_urls(count=2000):
+    # Mostly ASCII URLs, every tenth with a few of 20000 CJK characters, so the
+    # batch's alphabet is far wider than any one URL's
+    rng = random.Random(7)
+    urls = [f"https://www.example{i}.com/path?id={i}&x=1#top" for i in range(count)]
+    for i in range(0, count, 10):
+        urls[i] += "".join(chr(0x4e00 + rng.randrange(20000)) for _ in range(rng.randint(1, 40)))
+    return urls
+
+
+@pytest.mark.parametrize("max_cells", [1 << 23, 0])
+def test_extract_features_wide_alphabet(monkeypatch, max_cells):
+    import url_features
+    monkeypatch.setattr(url_features, "MAX_HISTOGRAM_CELLS", max_cells)
+    urls = _wide_alphabet_urls()
+    expected = np.array(
+        [[FeatureExtractor(url).run()[name] for name in FEATURE_NAMES] for url in urls],
+        dtype=np.float32
+    )
+    np.testing.assert_array_equal(extract_features(urls), expected)
+
+
+def test_extract_features_wide_alphabet_memory():
+    # Dense rows x alphabet arrays for this batch (histogram, p, terms) took about 190 MB
+    import url_features
+    urls = _wide_alphabet_urls()
+    tracemalloc.start()
+    try:
+        extract_features(urls)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 8 * url_features.MAX_HISTOGRAM_CELLS + 8 * 1024 * 1024
+
+
+def test_extract_features_empty_batch():
+    assert extract_features([]).shape == (0, len(FEATURE_NAMES))
+
+
+@pytest.mark.parametrize("url", EDGE_CASE_URLS + ["http://例子.测试/" + "".join(chr(0x4e00 + i) for i in range(5000))])
+def test_url_features_v2_entropy(url):
+    # Counted in the scan; must equal the entropy of the URL after its scheme
+    rest = url.strip()
+    if "://" in rest[:19] and rest.split("://", 1)[0].isalpha():
+        rest = rest.split("://", 1)[1]
+    expected = -sum(
+        count / len(rest) * math.log2(count / len(rest)) for count in Counter(rest).values()
+    ) if rest else 0.0
+    assert url_features_v2(url)[FEATURE_NAMES_V2.index("url_entropy")] == pytest.approx(expected, abs=1e-9)
+
+
+def test_url_features_v2_non_ascii_host_chars():
+    column = FEATURE_NAMES_V2.index("non_ascii_host_chars")
+    assert url_features_v2("https://example.com/ünïcode")[column] == 0
+    assert url_features_v2("https://раypal.com/signin")[column] == 2
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+import verdict_store
+from verdict_store import VerdictStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return VerdictStore(str(tmp_path / "verdicts.sqlite3"), lease=5, poll_interval=0.01)
+
+
+def test_init_leaves_no_connection_open(store):
+    # A store built before a fork must not hand its workers a live handle
+    assert getattr(store.local, "conn", None) is None
+
+
+def test_set_get_and_expiry(store):
+    store.set("vt", "http://a.example/", {"verdict": "Safe"}, ttl=60)
+    value, remaining = store.get("vt", "http://a.example/")
+    assert value == {"verdict": "Safe"}
+    assert 0 < remaining <= 60
+
+    store.set("vt", "http://b.example/", {"verdict": "Safe"}, ttl=-1)
+    assert store.get("vt", "http://b.example/") is None
+
+
+def test_fetch_runs_lookup_once(store):
+    calls = []
+
+    def lookup():
+        calls.append(1)
+        return {"verdict": "Malicious"}
+
+    for _ in range(3):
+        assert store.fetch("fs", "abc", lookup, lambda value: 60) == {"verdict": "Malicious"}
+    assert len(calls) == 1
+
+
+def test_reconnects_after_pid_change(store, monkeypatch):
+    parent = store._connect()
+    assert store._connect() is parent
+
+    pid = os.getpid()
+    monkeypatch.setattr(verdict_store.os, "getpid", lambda: pid + 1)
+    child = store._connect()
+    assert child is not parent
+    # The inherited connection is set aside, not reused or closed
+    assert store.forked == [parent]
+    store.set("vt", "key", "value", ttl=60)
+    assert store.get("vt", "key")[0] == "value"
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_child_uses_its_own_connection(store):
+    store.set("vt", "parent", "before fork", ttl=60)
+    parent_conn = store._connect()
+
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            if (store._connect() is not parent_conn
+                    and store.get("vt", "parent")[0] == "before fork"):
+                store.set("vt", "child", "from child", ttl=60)
+                status = 0
+        finally:
+            os._exit(status)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+    assert store._connect() is parent_conn
+    assert store.get("vt", "child")[0] == "from child"
@@ -0,0 +1,215 @@
+import asyncio
+import threading
+import uuid
+import pytest
+import app
+from cascade import Cascade, TokenBucket
+from conftest import FakeVirusTotal
+from verdict_store import VerdictStore
+from vt_jobs import JobQueueFull, VirusTotalJobs
+
+
+@pytest.fixture
+def fake_vt(monkeypatch):
+    fake = FakeVirusTotal()
+    monkeypatch.setattr(app, "VIRUSTOTAL_API_URL", fake.url)
+    monkeypatch.setattr(app, "VT_INITIAL_WAIT", 0)
+    monkeypatch.setattr(app, "VT_RETRY_WAIT", 0)
+    yield fake
+    fake.close()
+
+
+def unique_url():
+    # The VirusTotal caches are module-wide, so each test looks up its own URL
+    return f"http://{uuid.uuid4().hex}.example/login"
+
+
+def test_job_is_pending_until_virustotal_answers(fake_vt):
+    jobs = VirusTotalJobs(app.check_virustotal, max_workers=1)
+    fake_vt.release.clear()
+    job_id = jobs.submit(unique_url())
+
+    job = jobs.get(job_id, wait=0.1)
+    assert job["status"] == "pending"
+    assert job["result"] is None
+    assert jobs.pending() == 1
+
+    fake_vt.release.set()
+    job = jobs.get(job_id, wait=10)
+    assert job["status"] == "completed"
+    assert job["result"]["risk"] == "Malicious"
+    assert job["result"]["stats"]["malicious"] == 3
+    assert jobs.pending() == 0
+    assert fake_vt.requests == [("POST", "/api/v3/urls"), ("GET", "/api/v3/analyses/analysis-1")]
+
+
+def test_report_conflicts_are_retried(fake_vt):
+    fake_vt.conflicts = 2
+    fake_vt.stats = {"malicious": 0, "harmless": 70, "undetected": 3, "suspicious": 0, "timeout": 0}
+    jobs = VirusTotalJobs(app.check_virustotal, max_workers=1)
+
+    job = jobs.get(jobs.submit(unique_url()), wait=10)
+    assert job["result"]["risk"] == "Safe"
+    assert [method for method, _ in fake_vt.requests] == ["POST", "GET", "GET", "GET"]
+
+
+def test_queued_analysis_is_polled_until_completed(fake_vt):
+    fake_vt.queued = 2
+    result = app.check_virustotal(unique_url())
+    assert result["risk"] == "Malicious"
+    assert [method for method, _ in fake_vt.requests] == ["POST", "GET", "GET", "GET"]
+
+
+def test_unfinished_analysis_is_not_cached_as_safe(fake_vt, monkeypatch, tmp_path):
+    fake_vt.queued = 100
+    fake_vt.stats = {"malicious": 0, "harmless": 70, "undetected": 3, "suspicious": 0, "timeout": 0}
+    store = VerdictStore(str(tmp_path / "verdicts.sqlite3"))
+    monkeypatch.setattr(app, "verdict_store", store)
+
+    url = unique_url()
+    result = app.cached_check_virustotal(url)
+    assert result["risk"] == "Pending"
+    assert "queued" in result["error"]
+    # Kept only as long as an error, in this process and in the shared store
+    assert app.vt_cache_ttl(result) == app.VT_CACHE_ERROR_TTL
+    stored, ttl = store.get("virustotal", app.normalize_url(url))
+    assert stored["risk"] == "Pending"
+    assert ttl <= app.VT_CACHE_ERROR_TTL
+
+
+def test_lookups_share_one_pooled_connection(fake_vt):
+    for _ in range(3):
+        assert app.check_virustotal(unique_url())["risk"] == "Malicious"
+    assert len(fake_vt.requests) == 6
+    assert len(fake_vt.connections) == 1
+
+
+def test_asgi_lookup_goes_through_the_verdict_store(monkeypatch, tmp_path):
+    asgi = pytest.importorskip("asgi")
+    store = VerdictStore(str(tmp_path / "verdicts.sqlite3"), poll_interval=0.01)
+    monkeypatch.setattr(app, "verdict_store", store)
+    calls = []
+
+    async def check(url):
+        calls.append(url)
+        return {"risk": "Safe", "error": None, "stats": {}}
+
+    monkeypatch.setattr(asgi, "check_virustotal", check)
+
+    # A verdict another process already stored is used without a lookup
+    stored_url = unique_url()
+    store.set("virustotal", app.normalize_url(stored_url), {"risk": "Malicious", "stats": {}}, ttl=60)
+    assert asyncio.run(asgi.lookup_virustotal(stored_url, app.normalize_url(stored_url)))["risk"] == "Malicious"
+    assert calls == []
+
+    # A fresh lookup runs once, under the lease, and lands in the store
+    url = unique_url()
+    key = app.normalize_url(url)
+    assert asyncio.run(asgi.lookup_virustotal(url, key))["risk"] == "Safe"
+    assert calls == [url]
+    assert store.get("virustotal", key)[0]["risk"] == "Safe"
+    assert store._claim("virustotal", key, "other-owner")
+
+
+def test_virustotal_rate_limit_is_an_error_result(fake_vt):
+    fake_vt.submit_status = 429
+    jobs = VirusTotalJobs(app.cached_check_virustotal, max_workers=1)
+    url = unique_url()
+
+    result = jobs.get(jobs.submit(url), wait=10)["result"]
+    assert "429" in result["error"]
+    # Negatively cached for the short error TTL only
+    assert app.vt_cache_ttl(result) == app.VT_CACHE_ERROR_TTL
+    assert app.get_cached_virustotal(app.normalize_url(url)) == result
+
+
+def test_cascade_rate_limit_skips_virustotal(monkeypatch):
+    # Every score is uncertain, and the VirusTotal quota bucket is empty
+    monkeypatch.setattr(app, "cascade", Cascade(safe_below=0.0, malicious_at=1.01, quota=[TokenBucket(1e-9, burst=0)]))
+    jobs = VirusTotalJobs(lambda url: pytest.fail("VirusTotal must not be called"), max_workers=1)
+
+    prediction = app.build_prediction(unique_url(), 0.5, 0.5, 0.4, jobs=jobs)
+    assert prediction["virustotal"] == "Rate limited"
+    assert prediction["virustotal_job"] is None
+    assert jobs.pending() == 0
+
+
+def test_verdict_of_a_job_queued_by_another_worker(monkeypatch, tmp_path):
+    release = threading.Event()
+    monkeypatch.setattr(app, "check_virustotal", lambda url: release.wait(10) and {"risk": "Safe", "stats": {}})
+    monkeypatch.setattr(app, "verdict_store", VerdictStore(str(tmp_path / "verdicts.sqlite3"), poll_interval=0.01))
+    monkeypatch.setattr(app, "cascade", Cascade(safe_below=0.0, malicious_at=1.01))
+    queuing = VirusTotalJobs(app.cached_check_virustotal, max_workers=1)
+    monkeypatch.setattr(app, "vt_jobs", queuing)
+    client = app.app.test_client()
+    try:
+        job_id = client.post("/predict", json={"url": unique_url()}).get_json()["virustotal_job"]
+        # Polls from here on land on a worker with its own, empty job table
+        monkeypatch.setattr(app, "vt_jobs", VirusTotalJobs(app.cached_check_virustotal, max_workers=1))
+
+        response = client.get(f"/verdict/{job_id}?wait=0.05")
+        assert response.status_code == 200
+        assert response.get_json()["status"] == "pending"
+    finally:
+        release.set()
+
+    assert queuing.get(job_id, wait=10)["status"] == "completed"
+    app.vt_cache.clear()
+    verdict = client.get(f"/verdict/{job_id}?wait=10").get_json()
+    assert verdict["status"] == "completed"
+    assert verdict["virustotal"] == "Safe"
+    assert client.get(f"/verdict/{uuid.uuid4().hex}").status_code == 404
+
+
+def test_full_queue_answers_503(monkeypatch):
+    release = threading.Event()
+    jobs = VirusTotalJobs(lambda url: release.wait(10) and {"risk": "Safe", "stats": {}}, max_workers=1, max_pending=1)
+    monkeypatch.setattr(app, "vt_jobs", jobs)
+    monkeypatch.setattr(app, "cascade", Cascade(safe_below=0.0, malicious_at=1.01))
+    client = app.app.test_client()
+    try:
+        first = client.post("/predict", json={"url": unique_url()})
+        assert first.status_code == 200
+        assert first.get_json()["virustotal"] == "Pending"
+
+        second = client.post("/predict", json={"url": unique_url()})
+        assert second.status_code == 503
+        assert "queue is full" in second.get_json()["error"]
+        with pytest.raises(JobQueueFull):
+            jobs.submit(unique_url())
+    finally:
+        release.set()
+
+    jobs.get(first.get_json()["virustotal_job"], wait=10)
+    assert jobs.pending() == 0
+    jobs.submit(unique_url())
+
+
+def test_finished_jobs_are_pruned_after_ttl():
+    now = [1000.0]
+    jobs = VirusTotalJobs(lambda url: {"risk": "Safe", "stats": {}}, max_workers=1, ttl=60, clock=lambda: now[0])
+    older = jobs.submit("http://a.example/")
+    assert jobs.get(older, wait=10)["status"] == "completed"
+    now[0] += 30
+    newer = jobs.submit("http://b.example/")
+    assert jobs.get(newer, wait=10)["status"] == "completed"
+
+    now[0] += 31
+    # Pruned on read, without a submit() in between
+    assert jobs.get(older) is None
+    assert jobs.get(newer) is not None
+    now[0] += 30
+    assert jobs.get(newer) is None
+    assert not jobs.jobs and not jobs.finished
+
+
+def test_pending_jobs_are_never_pruned():
+    now = [1000.0]
+    release = threading.Event()
+    jobs = VirusTotalJobs(lambda url: release.wait(10) and {"risk": "Safe", "stats": {}},
+                          max_workers=1, ttl=1, clock=lambda: now[0])
+    job_id = jobs.submit("http://a.example/")
+    now[0] += 3600
+    assert jobs.get(job_id)["status"] == "pending"
+    release.set()
+    assert jobs.get(job_id, wait=10)["status"] == "completed"
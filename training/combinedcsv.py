@@ -1,7 +1,35 @@
+import argparse
 import csv
+import hashlib
+import heapq
+import os
+import shutil
+import sys
+import tempfile
 
-def combine_csv(file1, file2, output_file):
-    with open(file1, mode='r', encoding='utf-8') as f1, open(file2, mode='r', encoding='utf-8') as f2:
+# Target size of one on-disk bucket; only one bucket is held in memory at a time
+BUCKET_BYTES = 64 * 1024 * 1024
+
+# Fields can hold very long URLs
+csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+
+
+def _bucket_of(url, buckets):
+    digest = hashlib.blake2b(url.encode("utf-8", "surrogatepass"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % buckets
+
+
+def combine_csv(file1, file2, output_file, dedupe=True, url_column="url", buckets=None, tmp_dir=None):
+    """
+    Stream file2 after file1 into output_file, keeping a single header.
+
+    Headers must match. With dedupe=True only the first row for each URL is
+    kept, in bounded memory: rows are spread over hash buckets on disk by URL,
+    each bucket is deduplicated on its own, and the buckets are merged back
+    in original row order.
+    """
+    with open(file1, mode='r', encoding='utf-8', newline='') as f1, \
+            open(file2, mode='r', encoding='utf-8', newline='') as f2:
         reader1 = csv.reader(f1)
         reader2 = csv.reader(f2)
 
@@ -13,24 +41,83 @@ def combine_csv(file1, file2, output_file):
         if header1 != header2:
             raise ValueError("CSV files have different headers and cannot be combined.")
 
-        # Combine the data
-        data1 = list(reader1)
-        data2 = list(reader2)
+        if not dedupe:
+            with open(output_file, mode='w', newline='', encoding='utf-8') as output:
+                writer = csv.writer(output)
+                writer.writerow(header1)
+                writer.writerows(reader1)
+                writer.writerows(reader2)
+            return
+
+        if url_column not in header1:
+            raise ValueError(f"Column '{url_column}' not found; cannot deduplicate.")
+        url_index = header1.index(url_column)
+
+        if buckets is None:
+            total = os.path.getsize(file1) + os.path.getsize(file2)
+            buckets = max(1, -(-total // BUCKET_BYTES))
+
+        work_dir = tempfile.mkdtemp(prefix="combine_", dir=tmp_dir)
+        try:
+            # Pass 1: spill (row number, row) into buckets chosen by URL hash
+            paths = [os.path.join(work_dir, f"bucket_{i}.csv") for i in range(buckets)]
+            handles = [open(path, mode='w', newline='', encoding='utf-8') for path in paths]
+            writers = [csv.writer(handle) for handle in handles]
+            row_number = 0
+            for reader in (reader1, reader2):
+                for row in reader:
+                    url = row[url_index] if url_index < len(row) else ""
+                    writers[_bucket_of(url, buckets)].writerow([row_number] + row)
+                    row_number += 1
+            for handle in handles:
+                handle.close()
+
+            # Pass 2: dedupe each bucket (rows are already in row-number order)
+            for path in paths:
+                with open(path, mode='r', newline='', encoding='utf-8') as bucket:
+                    seen = set()
+                    kept = []
+                    for row in csv.reader(bucket):
+                        url = row[1 + url_index] if 1 + url_index < len(row) else ""
+                        if url not in seen:
+                            seen.add(url)
+                            kept.append(row)
+                with open(path, mode='w', newline='', encoding='utf-8') as bucket:
+                    csv.writer(bucket).writerows(kept)
+                del seen, kept
 
-    # Write the combined data to a new file
-    with open(output_file, mode='w', newline='', encoding='utf-8') as output:
-        writer = csv.writer(output)
+            # Pass 3: k-way merge of the buckets back into the original order
+            readers = [open(path, mode='r', newline='', encoding='utf-8') for path in paths]
+            try:
+                streams = [
+                    ((int(row[0]), row[1:]) for row in csv.reader(handle))
+                    for handle in readers
+                ]
+                with open(output_file, mode='w', newline='', encoding='utf-8') as output:
+                    writer = csv.writer(output)
+                    writer.writerow(header1)
+                    for _, row in heapq.merge(*streams, key=lambda item: item[0]):
+                        writer.writerow(row)
+            finally:
+                for handle in readers:
+                    handle.close()
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
 
-        # Write the header and combined rows
-        writer.writerow(header1)
-        writer.writerows(data1)
-        writer.writerows(data2)
 
-# Example usage
-file1 = 'malicious_phish.csv'
-file2 = 'URL dataset.csv'
-output_file = 'combined_file.csv'
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge two CSV datasets with matching headers")
+    parser.add_argument("file1", nargs="?", default='malicious_phish.csv')
+    parser.add_argument("file2", nargs="?", default='URL dataset.csv')
+    parser.add_argument("output_file", nargs="?", default='combined_file.csv')
+    parser.add_argument("--keep-duplicates", action="store_true", help="Do not drop repeated URLs")
+    parser.add_argument("--buckets", type=int, help="Number of on-disk buckets (default: from input size)")
+    parser.add_argument("--tmp-dir", help="Directory for temporary bucket files")
+    args = parser.parse_args()
 
-combine_csv(file1, file2, output_file)
+    combine_csv(
+        args.file1, args.file2, args.output_file,
+        dedupe=not args.keep_duplicates, buckets=args.buckets, tmp_dir=args.tmp_dir
+    )
 
-print(f"Combined CSV saved as {output_file}")
+    print(f"Combined CSV saved as {args.output_file}")
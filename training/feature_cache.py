@@ -0,0 +1,191 @@
+import json
+import os
+import struct
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+from url_features import DEFAULT_FEATURE_SCHEMA, FEATURE_SCHEMAS
+
+# Bump when the cache layout or the feature definitions change
+CACHE_VERSION = 2
+
+# Bytes reserved for the .npy header, enough for any row count; the arrays
+# are streamed in after it and the header is patched once the count is known
+NPY_HEADER_SIZE = 128
+
+
+def schema_cache_dir(cache_dir, feature_schema):
+    """Directory of the `feature_schema` cache; each schema keeps its own."""
+    return os.path.join(cache_dir, f"schema-{feature_schema}")
+
+
+def _source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {
+        "path": os.path.abspath(csv_path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+    }
+
+
+def _npy_header(dtype, shape):
+    # A version 1.0 .npy header padded to exactly NPY_HEADER_SIZE bytes
+    header = repr({"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False, "shape": shape})
+    padding = NPY_HEADER_SIZE - 10 - len(header) - 1
+    if padding < 0:
+        raise ValueError(f"Shape {shape} does not fit the reserved .npy header")
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", NPY_HEADER_SIZE - 10) + (header + " " * padding + "\n").encode("latin1")
+
+
+def _append(handle, array):
+    handle.write(np.ascontiguousarray(array).tobytes())
+
+
+def _finalize(tmp_path, npy_path, dtype, shape):
+    # The data is already in place after the reserved header; only the shape is written
+    with open(tmp_path, "r+b") as out:
+        out.write(_npy_header(dtype, shape))
+    os.replace(tmp_path, npy_path)
+
+
+def _extract_shard(task):
+    # Worker: extract one shard straight into its rows of the memory-mapped output
+    path, row_offset, urls, feature_schema = task
+    schema = FEATURE_SCHEMAS[feature_schema]
+    out = np.memmap(
+        path, dtype=np.float32, mode="r+",
+        offset=NPY_HEADER_SIZE + row_offset * len(schema.names) * np.dtype(np.float32).itemsize,
+        shape=(len(urls), len(schema.names))
+    )
+    out[:] = schema.extract_training(urls)
+    out.flush()
+    del out
+
+
+class ParallelExtractor:
+    """
+    Splits each chunk of URLs into contiguous shards, one per worker process.
+    Workers write their rows directly into a shared memory-mapped file at the
+    shard's row offset, so the output is in input order and identical to a
+    single-process run, and no feature rows are pickled back.
+    """
+
+    def __init__(self, workers, feature_schema=DEFAULT_FEATURE_SCHEMA):
+        self.workers = workers
+        self.feature_schema = feature_schema
+        self.pool = Pool(workers)
+
+    def extract_into(self, path, row_offset, urls):
+        urls = list(urls)
+        width = len(FEATURE_SCHEMAS[self.feature_schema].names)
+        # Grow the output file to hold this chunk before the workers map it
+        with open(path, "r+b") as out:
+            out.truncate(NPY_HEADER_SIZE + (row_offset + len(urls)) * width * np.dtype(np.float32).itemsize)
+        bounds = np.linspace(0, len(urls), self.workers + 1).astype(int)
+        tasks = [
+            (path, row_offset + start, urls[start:stop], self.feature_schema)
+            for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start
+        ]
+        self.pool.map(_extract_shard, tasks)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+def build_feature_cache(csv_path, cache_dir, chunksize=100000, url_column="url", label_column="type", workers=1,
+                        feature_schema=DEFAULT_FEATURE_SCHEMA):
+    """
+    Stream `csv_path` in chunks and write the extracted features to
+    `cache_dir`/schema-<feature_schema>: features.npy (float32, one row per
+    URL, one column per feature of `feature_schema`), labels.npy (int16
+    codes into meta["classes"]) and meta.json.
+
+    Only one chunk of the CSV is held in memory at a time, and rows are
+    written straight into the .npy files, so the cache never takes more
+    disk than its final size. With workers > 1 each chunk is extracted
+    across that many processes (ParallelExtractor).
+    """
+    schema = FEATURE_SCHEMAS[feature_schema]
+    cache_dir = schema_cache_dir(cache_dir, feature_schema)
+    os.makedirs(cache_dir, exist_ok=True)
+    features_tmp = os.path.join(cache_dir, "features.npy.tmp")
+    labels_tmp = os.path.join(cache_dir, "labels.npy.tmp")
+
+    classes = {}
+    rows = 0
+    extractor = ParallelExtractor(workers, feature_schema) if workers > 1 else None
+    try:
+        with open(features_tmp, "wb") as features_out, open(labels_tmp, "wb") as labels_out:
+            features_out.write(_npy_header(np.float32, (0, len(schema.names))))
+            labels_out.write(_npy_header(np.int16, (0,)))
+            for chunk in pd.read_csv(csv_path, usecols=[url_column, label_column], chunksize=chunksize):
+                urls = chunk[url_column].astype(str)
+                if extractor is not None:
+                    features_out.flush()
+                    extractor.extract_into(features_tmp, rows, urls)
+                    features_out.seek(0, os.SEEK_END)
+                else:
+                    _append(features_out, schema.extract_training(urls))
+                codes = np.fromiter(
+                    (classes.setdefault(label, len(classes)) for label in chunk[label_column]),
+                    dtype=np.int16,
+                    count=len(chunk)
+                )
+                _append(labels_out, codes)
+                rows += len(chunk)
+                print(f"  {rows} rows extracted", end="\r")
+    finally:
+        if extractor is not None:
+            extractor.close()
+    print()
+
+    _finalize(features_tmp, os.path.join(cache_dir, "features.npy"), np.float32, (rows, len(schema.names)))
+    _finalize(labels_tmp, os.path.join(cache_dir, "labels.npy"), np.int16, (rows,))
+
+    meta = {
+        "version": CACHE_VERSION,
+        "source": _source_signature(csv_path),
+        "feature_schema": feature_schema,
+        "feature_names": schema.names,
+        "classes": list(classes),
+        "rows": rows,
+    }
+    with open(os.path.join(cache_dir, "meta.json"), "w") as meta_file:
+        json.dump(meta, meta_file, indent=2)
+    return meta
+
+
+def load_feature_cache(csv_path, cache_dir, mmap=True, feature_schema=DEFAULT_FEATURE_SCHEMA):
+    """
+    Return (features, labels) from the `feature_schema` cache in `cache_dir`
+    if it was built from the current `csv_path`, otherwise None. `labels`
+    holds the original label strings. The feature matrix is memory-mapped by
+    default.
+    """
+    cache_dir = schema_cache_dir(cache_dir, feature_schema)
+    meta_path = os.path.join(cache_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as meta_file:
+        meta = json.load(meta_file)
+    if (meta.get("version") != CACHE_VERSION
+            or meta.get("feature_names") != FEATURE_SCHEMAS[feature_schema].names
+            or meta.get("source") != _source_signature(csv_path)):
+        return None
+
+    features = np.load(os.path.join(cache_dir, "features.npy"), mmap_mode="r" if mmap else None)
+    codes = np.load(os.path.join(cache_dir, "labels.npy"))
+    labels = np.array(meta["classes"], dtype=object)[codes]
+    return features, labels
+
+
+def load_or_build_feature_cache(csv_path, cache_dir, chunksize=100000, rebuild=False, workers=1,
+                                feature_schema=DEFAULT_FEATURE_SCHEMA):
+    cached = None if rebuild else load_feature_cache(csv_path, cache_dir, feature_schema=feature_schema)
+    if cached is not None:
+        print(f"Loaded cached features from {schema_cache_dir(cache_dir, feature_schema)}")
+        return cached
+    print(f"Extracting feature schema {feature_schema} from {csv_path} in chunks of {chunksize} with {workers} worker(s)...")
+    build_feature_cache(csv_path, cache_dir, chunksize=chunksize, workers=workers, feature_schema=feature_schema)
+    return load_feature_cache(csv_path, cache_dir, feature_schema=feature_schema)
@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import random
+import string
+import subprocess
+import sys
+import numpy as np
+from tree_model import TreeEnsemble
+from url_features import extract_features
+
+# Compares the in-extension scorer (popup/url_model.js + popup/url_model.json)
+# with the Python serving path (url_features + TreeEnsemble) over a fixed URL
+# corpus. Exits non-zero if any feature differs or a probability drifts.
+# tests/test_js_parity.py runs the same comparison in the test suite.
+#
+#   python js_parity.py                      # built-in corpus
+#   python js_parity.py --corpus combined_file2.csv --limit 100000
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+POPUP_DIR = os.path.join(HERE, "..", "popup")
+
+SAMPLE_URLS = [
+    "https://www.google.com/finance?cid=6512",
+    "http://www.stock888.cn/",
+    "https://xsite.singaporetech.edu.sg",
+    "https://i1.wp.com/",
+    "https://123moviesz.site/",
+    "http://77.247.88.118:44946/bin.sh",
+    "http://122.114.193.75/demon.x64.exe.dll",
+    "https://raw.githubusercontent.com/crypto101/crypto101.github.io/master/Crypto101.pdf",
+    "http://192.168.0.1/admin#login",
+    "https://example.com/a?b=1&c=2&d=3#x#y",
+    "https://https.http.example/path//to///file",
+    "   https://padded.example.com/   ",
+    "https://xn--pple-43d.com/",
+    "https://例子.测试/路径?查询=值",
+    "https://exa²mple.com/①②③",
+    "http://١٢٧.٠.٠.١/admin",
+    "http://𝟏𝟗𝟐.𝟏𝟔𝟖.𝟎.𝟏/",
+    "http://૨૫૬.1.1.1/",
+    "http://1.2.3.²/",
+    "",
+]
+
+NODE_RUNNER = """
+const fs = require("fs");
+const UrlModel = require(process.argv[1]);
+const tree = UrlModel.fromJSON(JSON.parse(fs.readFileSync(process.argv[2], "utf8")));
+const urls = JSON.parse(fs.readFileSync(0, "utf8"));
+const out = urls.map(url => [UrlModel.extractFeatures(url), UrlModel.predictProba(url, tree)]);
+process.stdout.write(JSON.stringify(out));
+"""
+
+
+def build_corpus(corpus_path=None, limit=20000, seed=42):
+    if corpus_path:
+        import pandas as pd
+        urls = pd.read_csv(corpus_path, usecols=["url"], nrows=limit)["url"].astype(str).tolist()
+        return SAMPLE_URLS + urls
+
+    # Deterministic synthetic URLs built from URL-ish fragments
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + "./:&#?=-_%~"
+    fragments = ["http://", "https://", "www.", "//", ".com", ".cn", "/", "192.168.1.", "&", "#"]
+    urls = list(SAMPLE_URLS)
+    for _ in range(limit):
+        parts = [
+            rng.choice(fragments) if rng.random() < 0.4
+            else "".join(rng.choices(alphabet, k=rng.randint(1, 12)))
+            for _ in range(rng.randint(1, 8))
+        ]
+        urls.append("".join(parts))
+    return urls
+
+
+def run_js(urls, model_json):
+    result = subprocess.run(
+        ["node", "-e", NODE_RUNNER, os.path.join(POPUP_DIR, "url_model.js"), model_json],
+        input=json.dumps(urls),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    out = json.loads(result.stdout)
+    features = np.array([row[0] for row in out], dtype=np.float32)
+    probabilities = np.array([row[1] for row in out], dtype=np.float64)
+    return features, probabilities
+
+
+def compare(urls, model_path, model_json):
+    """
+    Score `urls` both ways; returns (indices of URLs whose feature vectors
+    differ, per-URL absolute probability difference, Python features, JS features).
+    """
+    py_features = extract_features(urls)
+    py_probabilities = TreeEnsemble(model_path).predict_proba(py_features)[:, 1]
+    js_features, js_probabilities = run_js(urls, model_json)
+
+    feature_mismatches = np.flatnonzero((py_features != js_features).any(axis=1))
+    drift = np.abs(py_probabilities - js_probabilities)
+    return feature_mismatches, drift, py_features, js_features
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check JS/Python URL scoring parity")
+    parser.add_argument("--corpus", help="CSV with a 'url' column (default: built-in corpus)")
+    parser.add_argument("--limit", type=int, default=20000, help="Number of corpus URLs to compare")
+    parser.add_argument("--model", default=os.path.join(HERE, "xgboost_model.npz"))
+    parser.add_argument("--model-json", default=os.path.join(POPUP_DIR, "url_model.json"))
+    parser.add_argument("--tolerance", type=float, default=1e-5)
+    args = parser.parse_args()
+
+    urls = build_corpus(args.corpus, args.limit)
+    feature_mismatches, drift, py_features, js_features = compare(urls, args.model, args.model_json)
+
+    print(f"URLs compared: {len(urls)}")
+    print(f"Feature mismatches: {len(feature_mismatches)}")
+    for i in feature_mismatches[:10]:
+        print(f"  {urls[i]!r}\n    python: {py_features[i].tolist()}\n    js:     {js_features[i].tolist()}")
+    print(f"Max probability difference: {drift.max():.3g}")
+
+    if len(feature_mismatches) or drift.max() > args.tolerance:
+        sys.exit(1)
+    print("JS and Python scores match.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import json
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from tree_model import TreeEnsemble, export_tree_model, export_tree_model_json
+from url_features import DEFAULT_FEATURE_SCHEMA, FEATURE_SCHEMAS
+
+# Layout of a registry directory:
+#
+#   model_registry/
+#     v0001/  model.npz  model.pkl  url_model.json  metadata.json
+#     v0002/  ...
+#     CURRENT     name of the version being served
+#     CANDIDATE   optional: name of a version scored in shadow
+#
+# Version directories are never modified once published. Switching models
+# only rewrites the small pointer files, each replaced atomically.
+# url_model.json (for the browser extension) is only written for feature
+# schema 1, the one the extension computes.
+
+# Version of the metadata.json layout (2 added "feature_schema"; versions
+# published before it were all trained on schema 1)
+METADATA_VERSION = 2
+
+CURRENT = "CURRENT"
+CANDIDATE = "CANDIDATE"
+
+VERSION_PATTERN = re.compile(r"^v(\d+)$")
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as out:
+        out.write(text)
+    os.replace(tmp_path, path)
+
+
+def publish_model(registry_dir, model, feature_names, threshold, metrics=None, promote=False, candidate=False,
+                  feature_schema=DEFAULT_FEATURE_SCHEMA):
+    """
+    Add an XGBoost model to the registry as a new version and return its name.
+
+    The version directory is filled under a temporary name and renamed into
+    place, so a server watching the registry never sees a partial version.
+    promote=True makes it the served (CURRENT) version; candidate=True makes
+    it the CANDIDATE scored in shadow. `feature_schema` is the version of the
+    feature schema (url_features.FEATURE_SCHEMAS) the model was trained on.
+    """
+    if list(feature_names) != FEATURE_SCHEMAS[feature_schema].names:
+        raise ValueError(f"Feature names do not match feature schema {feature_schema}")
+    os.makedirs(registry_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=registry_dir)
+    export_tree_model(model, os.path.join(staging, "model.npz"))
+    if feature_schema == 1:
+        export_tree_model_json(model, os.path.join(staging, "url_model.json"))
+    with open(os.path.join(staging, "model.pkl"), "wb") as model_file:
+        pickle.dump(model, model_file)
+
+    registry = ModelRegistry(registry_dir)
+    while True:
+        version = f"v{registry.latest_number() + 1:04d}"
+        metadata = {
+            "metadata_version": METADATA_VERSION,
+            "version": version,
+            "created_at": time.time(),
+            "feature_schema": feature_schema,
+            "feature_names": list(feature_names),
+            "threshold": threshold,
+            "metrics": metrics or {},
+        }
+        with open(os.path.join(staging, "metadata.json"), "w") as metadata_file:
+            json.dump(metadata, metadata_file, indent=2)
+        try:
+            os.rename(staging, os.path.join(registry_dir, version))
+            break
+        except OSError:
+            # Another publisher took this version number first
+            if not os.path.isdir(os.path.join(registry_dir, version)):
+                raise
+
+    if promote:
+        registry.set_pointer(CURRENT, version)
+    if candidate:
+        registry.set_pointer(CANDIDATE, version)
+    return version
+
+
+class ModelRegistry:
+    """
+    Read side of a model registry directory (see the layout above).
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def versions(self):
+        if not os.path.isdir(self.path):
+            return []
+        names = [name for name in os.listdir(self.path) if VERSION_PATTERN.match(name)]
+        return sorted(names, key=lambda name: int(VERSION_PATTERN.match(name).group(1)))
+
+    def latest_number(self):
+        versions = self.versions()
+        return int(VERSION_PATTERN.match(versions[-1]).group(1)) if versions else 0
+
+    def get_pointer(self, name):
+        try:
+            with open(os.path.join(self.path, name)) as pointer:
+                return pointer.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def set_pointer(self, name, version):
+        if version is None:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+            return
+        if not os.path.isdir(os.path.join(self.path, version)):
+            raise ValueError(f"Unknown model version: {version}")
+        _write_atomic(os.path.join(self.path, name), version + "\n")
+
+    def metadata(self, version):
+        with open(os.path.join(self.path, version, "metadata.json")) as metadata_file:
+            return json.load(metadata_file)
+
+    def load(self, version):
+        """
+        Return (model, metadata, schema) for `version`, `schema` being the
+        FeatureSchema it was trained on. Raises ValueError if the server does
+        not know that schema or it extracts different features.
+        """
+        metadata = self.metadata(version)
+        schema = FEATURE_SCHEMAS.get(metadata.get("feature_schema", DEFAULT_FEATURE_SCHEMA))
+        if schema is None:
+            raise ValueError(f"Model {version} uses feature schema {metadata.get('feature_schema')}, unknown to this server")
+        if metadata.get("feature_names") != schema.names:
+            raise ValueError(
+                f"Model {version} expects features {metadata.get('feature_names')}, "
+                f"server extracts {schema.names} for feature schema {schema.version}"
+            )
+        npz_path = os.path.join(self.path, version, "model.npz")
+        if os.path.exists(npz_path):
+            return TreeEnsemble(npz_path), metadata, schema
+        with open(os.path.join(self.path, version, "model.pkl"), "rb") as model_file:
+            return pickle.load(model_file), metadata, schema
+
+
+class ShadowScorer:
+    """
+    Scores live traffic with a candidate model off the request path.
+
+    Requests hand over the feature rows they already extracted together with
+    the primary model's probabilities and latency; one background thread
+    scores them with the candidate and records how often the two models
+    agree on the verdict and how long each took. A candidate on another
+    feature schema gets the URLs instead of the rows and extracts its own
+    features on that thread. Once `max_pending` batches are queued, new
+    batches are dropped (and counted) instead of slowing requests down.
+    """
+
+    def __init__(self, model, version, threshold, schema=None, max_pending=100, window=1000):
+        self.model = model
+        self.version = version
+        self.threshold = threshold
+        self.schema = schema or FEATURE_SCHEMAS[DEFAULT_FEATURE_SCHEMA]
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.scored = 0
+        self.agreements = 0
+        self.flagged = 0
+        self.abs_diff_sum = 0.0
+        self.dropped = 0
+        self.errors = 0
+        # Milliseconds per scored batch, over the last `window` batches
+        self.primary_latency = deque(maxlen=window)
+        self.candidate_latency = deque(maxlen=window)
+
+    def submit(self, features, primary_probabilities, primary_threshold, primary_latency, urls=None):
+        """`features` may be None if `urls` are given; the candidate's schema then extracts them."""
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.dropped += len(primary_probabilities)
+                return
+            self.pending += 1
+        self.executor.submit(self._score, features, primary_probabilities, primary_threshold, primary_latency, urls)
+
+    def _score(self, features, primary_probabilities, primary_threshold, primary_latency, urls=None):
+        try:
+            if features is None:
+                features = self.schema.extract(urls)
+            start = time.perf_counter()
+            probabilities = self.model.predict_proba(features)[:, 1]
+            latency = (time.perf_counter() - start) * 1000
+            primary = np.asarray(primary_probabilities)
+            candidate_flags = probabilities >= self.threshold
+            with self.lock:
+                self.scored += len(primary)
+                self.agreements += int((candidate_flags == (primary >= primary_threshold)).sum())
+                self.flagged += int(candidate_flags.sum())
+                self.abs_diff_sum += float(np.abs(probabilities - primary).sum())
+                self.primary_latency.append(primary_latency * 1000)
+                self.candidate_latency.append(latency)
+        except Exception:
+            with self.lock:
+                self.errors += 1
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    @staticmethod
+    def _percentiles(samples):
+        if not samples:
+            return None
+        p50, p99 = np.percentile(np.fromiter(samples, dtype=float), [50, 99])
+        return {"p50": round(float(p50), 3), "p99": round(float(p99), 3)}
+
+    def stats(self):
+        with self.lock:
+            return {
+                "version": self.version,
+                "threshold": self.threshold,
+                "feature_schema": self.schema.version,
+                "urls_scored": self.scored,
+                "agreement": self.agreements / self.scored if self.scored else None,
+                "candidate_flagged": self.flagged,
+                "mean_abs_probability_diff": self.abs_diff_sum / self.scored if self.scored else None,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "pending": self.pending,
+                "batch_latency_ms": {
+                    "primary": self._percentiles(self.primary_latency),
+                    "candidate": self._percentiles(self.candidate_latency),
+                },
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -1,24 +1,70 @@
+import argparse
 import csv
+import os
 import random
+import shutil
+import sys
+import tempfile
 
-def randomize_csv(input_file, output_file):
-    # Read the CSV file
-    with open(input_file, mode='r', newline='', encoding='utf-8') as file:
-        reader = list(csv.reader(file))
-        header, rows = reader[0], reader[1:]
+# Target size of one on-disk bucket; only one bucket is held in memory at a time
+BUCKET_BYTES = 64 * 1024 * 1024
 
-    # Shuffle the rows
-    random.shuffle(rows)
+# Fields can hold very long URLs
+csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
 
-    # Write the shuffled data back to a new CSV file
-    with open(output_file, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow(header)  # Write the header
-        writer.writerows(rows)  # Write the shuffled rows
 
-# Example usage
-input_csv = 'combined_file.csv'
-output_csv = 'combined_file2.csv'
-randomize_csv(input_csv, output_csv)
+def randomize_csv(input_file, output_file, seed=None, buckets=None, tmp_dir=None):
+    """
+    Shuffle the rows of input_file into output_file, keeping the header.
 
-print(f"The randomized data has been saved to {output_csv}")
+    Works out of core: every row is sent to a random bucket file on disk,
+    then each bucket is shuffled in memory and appended to the output.
+    Random bucket assignment followed by an in-bucket shuffle gives a
+    uniform permutation. The same seed gives the same output.
+    """
+    rng = random.Random(seed)
+    if buckets is None:
+        buckets = max(1, -(-os.path.getsize(input_file) // BUCKET_BYTES))
+
+    work_dir = tempfile.mkdtemp(prefix="shuffle_", dir=tmp_dir)
+    try:
+        # Spill the rows into randomly chosen buckets
+        paths = [os.path.join(work_dir, f"bucket_{i}.csv") for i in range(buckets)]
+        with open(input_file, mode='r', newline='', encoding='utf-8') as file:
+            reader = csv.reader(file)
+            header = next(reader)
+            handles = [open(path, mode='w', newline='', encoding='utf-8') for path in paths]
+            try:
+                writers = [csv.writer(handle) for handle in handles]
+                for row in reader:
+                    writers[rng.randrange(buckets)].writerow(row)
+            finally:
+                for handle in handles:
+                    handle.close()
+
+        # Shuffle each bucket and write the shuffled data to the new CSV file
+        with open(output_file, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(header)  # Write the header
+            for path in paths:
+                with open(path, mode='r', newline='', encoding='utf-8') as bucket:
+                    rows = list(csv.reader(bucket))
+                rng.shuffle(rows)
+                writer.writerows(rows)
+                os.remove(path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shuffle the rows of a CSV dataset")
+    parser.add_argument("input_csv", nargs="?", default='combined_file.csv')
+    parser.add_argument("output_csv", nargs="?", default='combined_file2.csv')
+    parser.add_argument("--seed", type=int, help="Random seed for a reproducible shuffle")
+    parser.add_argument("--buckets", type=int, help="Number of on-disk buckets (default: from input size)")
+    parser.add_argument("--tmp-dir", help="Directory for temporary bucket files")
+    args = parser.parse_args()
+
+    randomize_csv(args.input_csv, args.output_csv, seed=args.seed, buckets=args.buckets, tmp_dir=args.tmp_dir)
+
+    print(f"The randomized data has been saved to {args.output_csv}")
@@ -8,8 +8,17 @@ from sklearn.metrics import classification_report, accuracy_score
 from sklearn.ensemble import StackingClassifier, RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
 from imblearn.over_sampling import SMOTE
-from tqdm import tqdm
 import math
+import argparse
+import json
+import os
+import time
+from contextlib import contextmanager
+from url_features import DEFAULT_FEATURE_SCHEMA, FEATURE_SCHEMAS, schema_for_model
+from feature_cache import load_feature_cache, load_or_build_feature_cache
+from tree_model import export_tree_model, export_tree_model_json
+from model_registry import CURRENT, ModelRegistry, publish_model
+from tuning import build_folds, successive_halving
 
 # Define FeatureExtractor class
 class FeatureExtractor:
@@ -45,7 +54,8 @@ class FeatureExtractor:
 
     def is_ip(self):
         parts = self.domain.split('.')
-        if len(parts) == 4 and all(part.isdigit() and 0 <= int(part) <= 255 for part in parts):
+        # isdecimal(): int() rejects digits such as '²' that isdigit() accepts
+        if len(parts) == 4 and all(part.isdecimal() and 0 <= int(part) <= 255 for part in parts):
             return True
         return False
 
@@ -62,122 +72,358 @@ class FeatureExtractor:
             "is_ip": int(self.is_ip()),
         }
 
-# Load the CSV file
-data = pd.read_csv("combined_file2.csv")
-
-# Extract features using the FeatureExtractor
-print("Extracting features...")
-features = []
-for url in tqdm(data['url']):
-    features.append(FeatureExtractor(url).run())
-features_df = pd.DataFrame(features)
-
-# Add the label column to the features DataFrame
-features_df['type'] = data['type']
-
-# Check class distribution
-print("Class distribution:\n", features_df['type'].value_counts())
-
-# Encode the labels (0: Not malicious, 1: Malicious)
-label_encoder = LabelEncoder()
-features_df['type'] = label_encoder.fit_transform(features_df['type'])
-
-# Split data into features (X) and labels (y)
-X = features_df.drop(columns=['type'])  # Drop the label column
-y = features_df['type']
-
-# Split data into train and test sets
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
-
-# Handle class imbalance using SMOTE
-print("Applying SMOTE...")
-smote = SMOTE(random_state=42)
-X_train_balanced, y_train_balanced = smote.fit_resample(X_train, y_train)
-print("Balanced Class Distribution:", pd.Series(y_train_balanced).value_counts())
-
-# Feature scaling
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train_balanced)
-X_test_scaled = scaler.transform(X_test)
-
-# Train the XGBoost model
-print("Training XGBoost model...")
-xgb_model = xgb.XGBClassifier(
-    n_estimators=100, 
-    max_depth=6, 
-    learning_rate=0.1, 
-    scale_pos_weight=(len(y_train) - sum(y_train)) / sum(y_train),  # Handle class imbalance
-    use_label_encoder=False, 
-    eval_metric="logloss", 
-    random_state=42
-)
-xgb_model.fit(X_train, y_train)
-
-# Evaluate the model
-y_pred = xgb_model.predict(X_test)
-print("\nClassification Report:\n", classification_report(y_test, y_pred))
-print("Accuracy:", accuracy_score(y_test, y_pred))
-
-# Hyperparameter tuning with GridSearchCV
-print("Running GridSearchCV...")
-param_grid = {
-    'n_estimators': [100, 200, 300],
-    'max_depth': [4, 6, 8],
-    'learning_rate': [0.01, 0.1, 0.2],
-    'subsample': [0.8, 1],
-    'colsample_bytree': [0.8, 1]
-}
-grid_search = GridSearchCV(
-    estimator=xgb.XGBClassifier(use_label_encoder=False, eval_metric="logloss", random_state=42),
-    param_grid=param_grid,
-    scoring='accuracy',
-    cv=3,
-    verbose=1
-)
-grid_search.fit(X_train_scaled, y_train_balanced)
-
-# Best parameters
-print("Best Parameters:", grid_search.best_params_)
-
-# Evaluate the best model
-y_pred_tuned = grid_search.best_estimator_.predict(X_test_scaled)
-print("\nGridSearchCV Classification Report:\n", classification_report(y_test, y_pred_tuned))
-
-# Cross-validation
-print("Performing Cross-Validation...")
-cv_scores = cross_val_score(xgb_model, X, y, cv=5, scoring='accuracy')
-print("Cross-Validation Accuracy Scores:", cv_scores)
-print("Mean CV Accuracy:", cv_scores.mean())
-
-# Stacking ensemble model
-print("Training Stacking Model...")
-base_models = [
-    ('xgb', xgb.XGBClassifier(use_label_encoder=False, eval_metric="logloss")),
-    ('rf', RandomForestClassifier(n_estimators=100, random_state=42))
-]
-stacked_model = StackingClassifier(
-    estimators=base_models,
-    final_estimator=LogisticRegression(),
-    cv=5
-)
-stacked_model.fit(X_train_scaled, y_train_balanced)
-y_pred_stacked = stacked_model.predict(X_test_scaled)
-print("\nStacking Classification Report:\n", classification_report(y_test, y_pred_stacked))
-
-# Save the best model pipeline
-print("Saving the best model pipeline...")
-from sklearn.pipeline import Pipeline
-pipeline = Pipeline([
-    ('scaler', StandardScaler()),
-    ('model', grid_search.best_estimator_)
-])
-
-# Save the trained model to a pickle file
-with open("xgboost_model.pkl", "wb") as model_file:
-    pickle.dump(xgb_model, model_file)
-
-# Save the FeatureExtractor to a pickle file for future use
-with open("feature_extractor.pkl", "wb") as extractor_file:
-    pickle.dump(FeatureExtractor, extractor_file)
-
-print("\nModel and FeatureExtractor have been saved as pickle files.")
+class StageTimer:
+    """
+    Wall-clock seconds per training stage. Each stage is printed as it ends,
+    and summary() lists them all with the row count, so training time can be
+    compared across data sizes.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = round(time.perf_counter() - start, 3)
+            print(f"[{name}] {self.stages[name]:.1f}s")
+
+    def summary(self, rows):
+        print(f"\nWall-clock time per stage ({rows} rows):")
+        for name, seconds in self.stages.items():
+            print(f"  {name:<20} {seconds:>10.1f}s")
+        print(f"  {'total':<20} {sum(self.stages.values()):>10.1f}s")
+
+
+def save_model(model, args, metrics, schema):
+    """
+    Write the model as xgboost_model.pkl, xgboost_model.npz and (for feature
+    schema 1, the one the browser extension computes) url_model.json.
+    Each file is replaced atomically, so a running server that watches one of
+    them (MODEL_PATH in azure_vm/app.py) only ever loads a complete model.
+    With --registry the model is also published there as a new version.
+    """
+    with open("xgboost_model.pkl.tmp", "wb") as model_file:
+        pickle.dump(model, model_file)
+    os.replace("xgboost_model.pkl.tmp", "xgboost_model.pkl")
+
+    # Export the trees as flat arrays for the xgboost-free server-side evaluator,
+    # and as JSON for the in-extension evaluator (copy to popup/url_model.json)
+    export_tree_model(model, "xgboost_model.npz")
+    if schema.version == 1:
+        export_tree_model_json(model, "url_model.json")
+    else:
+        print(f"Feature schema {schema.version}: url_model.json not written (the extension computes schema 1)")
+
+    if args.registry:
+        version = publish_model(
+            args.registry, model, schema.names, args.threshold, metrics,
+            promote=args.promote, candidate=args.candidate, feature_schema=schema.version
+        )
+        role = "served" if args.promote else "shadow candidate" if args.candidate else "not served"
+        print(f"Published model {version} to {args.registry} ({role})")
+
+
+def load_feedback(path):
+    """
+    Read a feedback log written by the server's /feedback route and return
+    (urls, labels). The latest vote for a URL wins; withdrawn votes are dropped.
+    """
+    votes = {}
+    with open(path, encoding="utf-8") as log_file:
+        for line in log_file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partial line from a write still in progress
+            votes[record["url"]] = record.get("label")
+    labelled = [(url, label) for url, label in votes.items() if label is not None]
+    return [url for url, _ in labelled], [label for _, label in labelled]
+
+
+def load_labelled_batch(path, classes):
+    # CSV with 'url' and 'type' columns, encoded like the full training data
+    batch = pd.read_csv(path, usecols=["url", "type"])
+    unknown = set(batch["type"]) - set(classes)
+    if unknown:
+        raise ValueError(f"{path}: labels not seen in the training data: {sorted(unknown)}")
+    return batch["url"].astype(str).tolist(), np.searchsorted(classes, batch["type"]).tolist()
+
+
+def train_incremental(args):
+    """
+    Continue boosting the saved model on new labelled batches (feedback logs
+    and/or labelled CSVs) instead of retraining from scratch. The existing
+    trees are kept and `args.rounds` trees are added with the model's own
+    training parameters, on the feature schema the model was trained on.
+    """
+    # Continue from the registry's served version unless a base model is given
+    base_model_path = args.base_model
+    if base_model_path is None:
+        current = ModelRegistry(args.registry).get_pointer(CURRENT) if args.registry else None
+        base_model_path = os.path.join(args.registry, current, "model.pkl") if current else "xgboost_model.pkl"
+    with open(base_model_path, "rb") as model_file:
+        base_model = pickle.load(model_file)
+    schema = schema_for_model(base_model)
+
+    urls, labels = [], []
+    classes = None
+    for path in args.incremental:
+        if path.endswith(".jsonl"):
+            batch_urls, batch_labels = load_feedback(path)
+        else:
+            if classes is None:
+                # Label order of the full training run (LabelEncoder sorts the classes)
+                cached = load_feature_cache(args.data, args.cache_dir, feature_schema=schema.version)
+                if cached is None:
+                    raise ValueError(f"Labelled CSV batches need the feature cache of {args.data}; run a full training first")
+                classes = np.unique(cached[1])
+            batch_urls, batch_labels = load_labelled_batch(path, classes)
+        print(f"{path}: {len(batch_urls)} labelled URLs")
+        urls += batch_urls
+        labels += batch_labels
+
+    if not urls:
+        print("No labelled URLs to train on; the model is unchanged.")
+        return
+
+    X = pd.DataFrame(schema.extract_training(urls), columns=schema.names)
+    y = np.array(labels)
+
+    accuracy_before = accuracy_score(y, base_model.predict(X))
+    print(f"Base model: {base_model_path} (feature schema {schema.version})")
+    print("Accuracy on the new batch before update:", accuracy_before)
+
+    # Warm start: the base booster is copied and extended by args.rounds trees
+    params = {} if args.learning_rate is None else {"learning_rate": args.learning_rate}
+    booster = xgb.train(
+        params,
+        xgb.DMatrix(X, label=y),
+        num_boost_round=args.rounds,
+        xgb_model=base_model.get_booster()
+    )
+    xgb_model = xgb.XGBClassifier()
+    xgb_model.load_model(bytearray(booster.save_raw("ubj")))
+    accuracy_after = accuracy_score(y, xgb_model.predict(X))
+    print("Accuracy on the new batch after update:", accuracy_after)
+    print(f"Trees: {len(base_model.get_booster().get_dump())} -> {len(booster.get_dump())}")
+
+    save_model(xgb_model, args, {
+        "mode": "incremental",
+        "base_model": base_model_path,
+        "rounds": args.rounds,
+        "batch_rows": len(y),
+        "batch_accuracy_before": float(accuracy_before),
+        "batch_accuracy_after": float(accuracy_after),
+    }, schema)
+    print("\nUpdated model saved; servers watching the model file will swap it in.")
+
+
+def main():
+    # Command-line options
+    parser = argparse.ArgumentParser(description="Train the URL classification model")
+    parser.add_argument("--data", default="combined_file2.csv", help="Training CSV with 'url' and 'type' columns")
+    parser.add_argument("--cache-dir", default="feature_cache", help="Directory for the extracted feature caches (one subdirectory per feature schema)")
+    parser.add_argument("--chunksize", type=int, default=100000, help="CSV rows read per chunk")
+    parser.add_argument("--feature-schema", type=int, choices=sorted(FEATURE_SCHEMAS), default=DEFAULT_FEATURE_SCHEMA,
+                        help="Feature schema to train on (see url_features.py); incremental mode keeps the base model's")
+    parser.add_argument("--rebuild-cache", action="store_true", help="Re-extract features even if the cache is current")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used for feature extraction")
+    parser.add_argument("--incremental", nargs="+", metavar="BATCH",
+                        help="Update the saved model from feedback logs (.jsonl) or labelled CSVs instead of a full run")
+    parser.add_argument("--base-model",
+                        help="Model to continue boosting in incremental mode (default: the registry's served version, else xgboost_model.pkl)")
+    parser.add_argument("--rounds", type=int, default=20, help="Boosting rounds added in incremental mode")
+    parser.add_argument("--learning-rate", type=float, help="Learning rate for the added rounds (default: the model's own)")
+    parser.add_argument("--registry", help="Model registry directory to publish the trained model to")
+    parser.add_argument("--threshold", type=float, default=0.4, help="Decision threshold recorded in the registry metadata")
+    parser.add_argument("--promote", action="store_true", help="Serve the published version (registry CURRENT)")
+    parser.add_argument("--candidate", action="store_true", help="Shadow-score the published version (registry CANDIDATE)")
+    parser.add_argument("--search", choices=["grid", "halving", "none"], default="grid",
+                        help="Hyperparameter search: exhaustive GridSearchCV, successive halving on cached folds, or none")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Parallel jobs / XGBoost threads (-1: all cores)")
+    parser.add_argument("--skip-cv", action="store_true", help="Skip the 5-fold cross-validation stage")
+    parser.add_argument("--skip-stacking", action="store_true", help="Skip the stacking ensemble stage")
+    parser.add_argument("--timings-log", help="Append the per-stage timings of this run as a JSON line to this file")
+    args = parser.parse_args()
+
+    if args.incremental:
+        train_incremental(args)
+        return
+
+    timer = StageTimer()
+    schema = FEATURE_SCHEMAS[args.feature_schema]
+
+    # Load features from the cache, streaming the CSV through the extractor if needed
+    with timer.stage("features"):
+        features, labels = load_or_build_feature_cache(
+            args.data, args.cache_dir, chunksize=args.chunksize, rebuild=args.rebuild_cache,
+            workers=args.workers, feature_schema=schema.version
+        )
+        features_df = pd.DataFrame(np.asarray(features), columns=schema.names)
+
+    # Add the label column to the features DataFrame
+    features_df['type'] = labels
+
+    # Check class distribution
+    print("Class distribution:\n", features_df['type'].value_counts())
+
+    # Encode the labels (0: Not malicious, 1: Malicious)
+    label_encoder = LabelEncoder()
+    features_df['type'] = label_encoder.fit_transform(features_df['type'])
+
+    # Split data into features (X) and labels (y)
+    X = features_df.drop(columns=['type'])  # Drop the label column
+    y = features_df['type']
+
+    # Split data into train and test sets
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+
+    # Handle class imbalance using SMOTE
+    print("Applying SMOTE...")
+    with timer.stage("smote"):
+        smote = SMOTE(random_state=42)
+        X_train_balanced, y_train_balanced = smote.fit_resample(X_train, y_train)
+    print("Balanced Class Distribution:", pd.Series(y_train_balanced).value_counts())
+
+    # Feature scaling
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train_balanced)
+    X_test_scaled = scaler.transform(X_test)
+
+    # Train the XGBoost model
+    print("Training XGBoost model...")
+    with timer.stage("xgboost_fit"):
+        xgb_model = xgb.XGBClassifier(
+            n_estimators=100, 
+            max_depth=6, 
+            learning_rate=0.1, 
+            scale_pos_weight=(len(y_train) - sum(y_train)) / sum(y_train),  # Handle class imbalance
+            use_label_encoder=False, 
+            eval_metric="logloss", 
+            random_state=42,
+            n_jobs=args.n_jobs
+        )
+        xgb_model.fit(X_train, y_train)
+
+    # Evaluate the model
+    y_pred = xgb_model.predict(X_test)
+    print("\nClassification Report:\n", classification_report(y_test, y_pred))
+    print("Accuracy:", accuracy_score(y_test, y_pred))
+
+    # Hyperparameter tuning
+    param_grid = {
+        'n_estimators': [100, 200, 300],
+        'max_depth': [4, 6, 8],
+        'learning_rate': [0.01, 0.1, 0.2],
+        'subsample': [0.8, 1],
+        'colsample_bytree': [0.8, 1]
+    }
+    best_estimator = None
+    if args.search == "grid":
+        print("Running GridSearchCV...")
+        with timer.stage("grid_search"):
+            grid_search = GridSearchCV(
+                estimator=xgb.XGBClassifier(use_label_encoder=False, eval_metric="logloss", random_state=42, n_jobs=1),
+                param_grid=param_grid,
+                scoring='accuracy',
+                cv=3,
+                verbose=1,
+                n_jobs=args.n_jobs
+            )
+            grid_search.fit(X_train_scaled, y_train_balanced)
+        print("Best Parameters:", grid_search.best_params_)
+        best_estimator = grid_search.best_estimator_
+    elif args.search == "halving":
+        # Folds are binned once and shared by every candidate; boosting rounds
+        # are the halving budget, with early stopping on each fold
+        print("Running successive halving search...")
+        with timer.stage("build_folds"):
+            folds = build_folds(X_train_scaled, y_train_balanced, cv=3)
+        with timer.stage("halving_search"):
+            search = successive_halving(folds, param_grid, n_jobs=args.n_jobs)
+        print("Best Parameters:", search["best_params"])
+        with timer.stage("refit_best"):
+            best_estimator = xgb.XGBClassifier(
+                **search["best_params"], tree_method="hist", eval_metric="logloss",
+                random_state=42, n_jobs=args.n_jobs
+            )
+            best_estimator.fit(X_train_scaled, y_train_balanced)
+
+    # Evaluate the best model
+    if best_estimator is not None:
+        y_pred_tuned = best_estimator.predict(X_test_scaled)
+        print("\nTuned Model Classification Report:\n", classification_report(y_test, y_pred_tuned))
+
+    # Cross-validation
+    cv_scores = None
+    if not args.skip_cv:
+        print("Performing Cross-Validation...")
+        with timer.stage("cross_validation"):
+            cv_scores = cross_val_score(xgb_model, X, y, cv=5, scoring='accuracy', n_jobs=args.n_jobs)
+        print("Cross-Validation Accuracy Scores:", cv_scores)
+        print("Mean CV Accuracy:", cv_scores.mean())
+
+    # Stacking ensemble model
+    if not args.skip_stacking:
+        print("Training Stacking Model...")
+        with timer.stage("stacking"):
+            base_models = [
+                ('xgb', xgb.XGBClassifier(use_label_encoder=False, eval_metric="logloss")),
+                ('rf', RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=args.n_jobs))
+            ]
+            stacked_model = StackingClassifier(
+                estimators=base_models,
+                final_estimator=LogisticRegression(),
+                cv=5
+            )
+            stacked_model.fit(X_train_scaled, y_train_balanced)
+        y_pred_stacked = stacked_model.predict(X_test_scaled)
+        print("\nStacking Classification Report:\n", classification_report(y_test, y_pred_stacked))
+
+    # Save the best model pipeline
+    if best_estimator is not None:
+        print("Saving the best model pipeline...")
+        from sklearn.pipeline import Pipeline
+        pipeline = Pipeline([
+            ('scaler', StandardScaler()),
+            ('model', best_estimator)
+        ])
+
+    # Save the trained model to a pickle file, plus the exported tree formats
+    with timer.stage("save"):
+        save_model(xgb_model, args, {
+            "mode": "full",
+            "search": args.search,
+            "train_rows": len(X_train),
+            "test_rows": len(X_test),
+            "accuracy": float(accuracy_score(y_test, y_pred)),
+            "cv_accuracy_mean": float(cv_scores.mean()) if cv_scores is not None else None,
+            "classification_report": classification_report(y_test, y_pred, output_dict=True),
+            "stage_seconds": timer.stages,
+        }, schema)
+
+    timer.summary(len(X))
+    if args.timings_log:
+        with open(args.timings_log, "a") as timings_file:
+            timings_file.write(json.dumps({
+                "time": time.time(),
+                "data": args.data,
+                "rows": len(X),
+                "search": args.search,
+                "n_jobs": args.n_jobs,
+                "stages": timer.stages,
+            }) + "\n")
+
+    # Save the FeatureExtractor to a pickle file for future use
+    with open("feature_extractor.pkl", "wb") as extractor_file:
+        pickle.dump(FeatureExtractor, extractor_file)
+
+    print("\nModel and FeatureExtractor have been saved as pickle files (trees also exported to xgboost_model.npz).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import itertools
+import math
+import time
+import numpy as np
+import xgboost as xgb
+from sklearn.model_selection import StratifiedKFold
+
+
+def build_folds(X, y, cv=3, max_bin=256, random_state=42):
+    """
+    Split (X, y) into stratified folds and build the XGBoost matrices once.
+    Each training split becomes a QuantileDMatrix (features are binned a
+    single time) and its validation split shares those bin boundaries. Every
+    candidate in the search then trains on the same prebuilt matrices.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    y = np.asarray(y)
+    folds = []
+    splitter = StratifiedKFold(n_splits=cv, shuffle=True, random_state=random_state)
+    for train_index, valid_index in splitter.split(X, y):
+        dtrain = xgb.QuantileDMatrix(X[train_index], label=y[train_index], max_bin=max_bin)
+        dvalid = xgb.QuantileDMatrix(X[valid_index], label=y[valid_index], ref=dtrain)
+        folds.append((dtrain, dvalid))
+    return folds
+
+
+class _Candidate:
+    # Search state of one parameter combination across all folds
+
+    def __init__(self, params, n_folds):
+        self.params = params
+        self.boosters = [None] * n_folds
+        self.best_scores = [math.inf] * n_folds
+        self.best_iterations = [0] * n_folds
+        self.stopped = [False] * n_folds
+
+    @property
+    def score(self):
+        return float(np.mean(self.best_scores))
+
+    @property
+    def best_rounds(self):
+        return int(round(np.mean(self.best_iterations))) + 1
+
+
+def _train_to(candidate, folds, rounds, base_params, early_stopping_rounds):
+    # Extend each fold's booster up to `rounds` trees, unless it already stopped early
+    params = {**base_params, **candidate.params}
+    for i, (dtrain, dvalid) in enumerate(folds):
+        booster = candidate.boosters[i]
+        trained = booster.num_boosted_rounds() if booster is not None else 0
+        if candidate.stopped[i] or trained >= rounds:
+            continue
+        booster = xgb.train(
+            params, dtrain,
+            num_boost_round=rounds - trained,
+            evals=[(dvalid, "valid")],
+            early_stopping_rounds=early_stopping_rounds,
+            xgb_model=booster,
+            verbose_eval=False
+        )
+        # best_score only covers this call; best_iteration counts from the first tree
+        if booster.best_score < candidate.best_scores[i]:
+            candidate.best_scores[i] = booster.best_score
+            candidate.best_iterations[i] = booster.best_iteration
+        candidate.stopped[i] = booster.num_boosted_rounds() - 1 - candidate.best_iterations[i] >= early_stopping_rounds
+        candidate.boosters[i] = booster
+
+
+def successive_halving(folds, param_grid, factor=3, min_rounds=10, early_stopping_rounds=20,
+                       max_bin=256, n_jobs=-1, random_state=42):
+    """
+    Successive-halving search over `param_grid` (XGBClassifier parameter
+    names) using boosting rounds as the budget.
+
+    Every combination starts with a small number of rounds on the prebuilt
+    `folds`. After each rung only the best 1/`factor` (by mean validation
+    log loss) continue, and their boosters are extended rather than retrained,
+    up to max(n_estimators) rounds in the last rung. Early stopping ends
+    unpromising folds before their budget runs out.
+
+    Returns the best parameters (with n_estimators set to the early-stopped
+    round count), its score and per-rung statistics.
+    """
+    grid = dict(param_grid)
+    max_rounds = max(grid.pop("n_estimators", [100]))
+    names = list(grid)
+    candidates = [_Candidate(dict(zip(names, values)), len(folds)) for values in itertools.product(*grid.values())]
+
+    base_params = {
+        "objective": "binary:logistic",
+        "eval_metric": "logloss",
+        "tree_method": "hist",
+        "max_bin": max_bin,
+        "nthread": n_jobs,
+        "seed": random_state,
+    }
+
+    n_rungs = 1 + int(math.log(len(candidates), factor)) if len(candidates) > 1 else 1
+    rungs = []
+    for rung in range(n_rungs):
+        rounds = max(min_rounds, int(max_rounds / factor ** (n_rungs - 1 - rung)))
+        start = time.perf_counter()
+        for candidate in candidates:
+            _train_to(candidate, folds, rounds, base_params, early_stopping_rounds)
+        candidates.sort(key=lambda candidate: candidate.score)
+        elapsed = time.perf_counter() - start
+        rungs.append({
+            "rung": rung,
+            "rounds": rounds,
+            "candidates": len(candidates),
+            "best_logloss": candidates[0].score,
+            "seconds": round(elapsed, 3),
+        })
+        print(f"  rung {rung}: {len(candidates)} candidates x {rounds} rounds, "
+              f"best logloss {candidates[0].score:.5f} ({elapsed:.1f}s)")
+        keep = max(1, math.ceil(len(candidates) / factor))
+        for candidate in candidates[keep:]:
+            candidate.boosters = None  # Free the discarded boosters
+        candidates = candidates[:keep]
+
+    best = candidates[0]
+    return {
+        "best_params": {**best.params, "n_estimators": best.best_rounds},
+        "best_logloss": best.score,
+        "rungs": rungs,
+    }
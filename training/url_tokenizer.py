@@ -0,0 +1,370 @@
+import math
+from collections import deque
+import numpy as np
+
+# Feature schema v2: one left-to-right scan of the raw URL splits it into
+# scheme, authority, path, query and fragment, and counts characters (by
+# class, and each distinct one for the entropy), tokens and suspicious
+# keywords (an Aho-Corasick automaton stepped once per character) as it goes.
+# Only the short host is looked at again, label by label, for the TLD class
+# and the punycode/homoglyph checks. Unlike v1 the
+# scheme and "www." are read from the URL instead of being stripped first,
+# so training and serving see exactly the same input.
+
+# Column order of the v2 feature matrix
+FEATURE_NAMES_V2 = [
+    "length",
+    "host_length",
+    "path_length",
+    "query_length",
+    "fragment_length",
+    "path_depth",
+    "host_dots",
+    "host_hyphens",
+    "host_digits",
+    "tld_class",
+    "is_ip",
+    "has_port",
+    "scheme_http",
+    "scheme_https",
+    "has_userinfo",
+    "double_slash_path",
+    "digit_ratio",
+    "uppercase_ratio",
+    "special_ratio",
+    "percent_num",
+    "params_num",
+    "token_count",
+    "longest_token",
+    "mean_token_length",
+    "keyword_hits",
+    "url_entropy",
+    "punycode",
+    "non_ascii_host_chars",
+    "homoglyph",
+]
+
+# Substrings common in phishing and malware URLs, matched case-insensitively
+SUSPICIOUS_KEYWORDS = [
+    "login", "log-in", "signin", "sign-in", "logon", "verify", "verification", "account", "update",
+    "secure", "security", "banking", "confirm", "password", "passwd", "webscr", "cmd=", "ebayisapi",
+    "paypal", "wallet", "recover", "unlock", "suspend", "billing", "invoice", "support", "free",
+    "bonus", "gift", "lucky", "prize", "admin", "wp-admin", "wp-includes", "bin.sh", ".exe", ".apk",
+    ".scr", ".bat", ".zip",
+]
+
+# TLD classes (tld_class): 0 none or an IP address, then the groups below
+TLD_COMMON = 1
+TLD_COUNTRY = 2
+TLD_ABUSED = 3
+TLD_OTHER = 4
+TLD_RESTRICTED = 5
+
+COMMON_TLDS = {"com", "net", "org"}
+RESTRICTED_TLDS = {"edu", "gov", "mil", "int"}
+# Cheap or free TLDs over-represented in phishing and malware reports
+ABUSED_TLDS = {
+    "xyz", "top", "site", "online", "club", "info", "biz", "tk", "ml", "ga", "cf", "gq", "work",
+    "live", "click", "link", "buzz", "shop", "icu", "rest", "fit", "loan", "win", "bid", "kim",
+    "support", "monster", "cyou", "sbs", "cfd", "quest",
+}
+
+# Cyrillic and Greek letters drawn like Latin ones
+CONFUSABLES = set("аеорсухіјѕԁһӏԛԝɡοαντρκιϲеՕ")
+
+# Character classes for the scan: ASCII letters and digits, ASCII characters
+# that only end a token, the delimiters the scan acts on, and OTHER for
+# everything else (non-ASCII, told apart with str.isalnum())
+OTHER, LOWER, DIGIT, UPPER, PUNCTUATION = range(5)
+SLASH, QUESTION, HASH, AT, COLON, AMPERSAND, PERCENT, BRACKET_OPEN, BRACKET_CLOSE = range(5, 14)
+CHAR_CLASS = {
+    **{chr(code): PUNCTUATION for code in range(128)},
+    **{ch: LOWER for ch in "abcdefghijklmnopqrstuvwxyz"},
+    **{ch: DIGIT for ch in "0123456789"},
+    **{ch: UPPER for ch in "ABCDEFGHIJKLMNOPQRSTUVWXYZ"},
+    "/": SLASH, "?": QUESTION, "#": HASH, "@": AT, ":": COLON, "&": AMPERSAND, "%": PERCENT,
+    "[": BRACKET_OPEN, "]": BRACKET_CLOSE,
+}
+
+# Parts of the URL, in the order the scan moves through them
+AUTHORITY, PATH, QUERY, FRAGMENT = range(4)
+
+# Longest scheme recognised before "://"
+MAX_SCHEME_LENGTH = 16
+
+# c * log2(c) for character counts up to this, for the entropy sum
+COUNT_LOG_TABLE = [0.0] + [count * math.log2(count) for count in range(1, 4096)]
+
+
+def build_keyword_automaton(keywords):
+    """
+    Aho-Corasick automaton for `keywords`, flattened into a DFA: `delta[state]`
+    maps a character (either case) to the next state, with the failure links
+    already followed, so each step is one dict lookup and characters outside
+    the keywords go back to the root (0). `matches[state]` is the number of
+    keywords ending at that state.
+    """
+    goto = [{}]
+    matches = [0]
+    for keyword in keywords:
+        state = 0
+        for ch in keyword.lower():
+            if ch not in goto[state]:
+                goto.append({})
+                matches.append(0)
+                goto[state][ch] = len(goto) - 1
+            state = goto[state][ch]
+        matches[state] += 1
+
+    fail = [0] * len(goto)
+    delta = [dict(goto[0])]
+    delta.extend({} for _ in range(len(goto) - 1))
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        # The failure state is shallower, so its row is already complete
+        delta[state] = {**delta[fail[state]], **goto[state]}
+        matches[state] += matches[fail[state]]
+        for ch, child in goto[state].items():
+            fail[child] = delta[fail[state]].get(ch, 0) if state else 0
+            queue.append(child)
+
+    for row in delta:
+        row.update({ch.upper(): child for ch, child in list(row.items()) if ch.upper() != ch})
+    return delta, matches
+
+
+KEYWORD_DELTA, KEYWORD_MATCHES = build_keyword_automaton(SUSPICIOUS_KEYWORDS)
+
+
+def tld_class(host, is_ip):
+    if is_ip or "." not in host:
+        return 0
+    tld = host.rsplit(".", 1)[1]
+    if tld in COMMON_TLDS:
+        return TLD_COMMON
+    if tld in RESTRICTED_TLDS:
+        return TLD_RESTRICTED
+    if tld in ABUSED_TLDS:
+        return TLD_ABUSED
+    if len(tld) == 2 and tld.isalpha():
+        return TLD_COUNTRY
+    return TLD_OTHER
+
+
+def host_is_ip(host):
+    if host.startswith("["):
+        return True
+    if host.isdigit():
+        return True  # Integer form, e.g. http://3232235777/
+    parts = host.split(".")
+    # isdecimal(): int() rejects digits such as "²" that isdigit() accepts
+    return len(parts) == 4 and all(part.isdecimal() and int(part) <= 255 for part in parts)
+
+
+def _homoglyph_label(label):
+    # A label mixing Latin letters with look-alikes, or spelled entirely in look-alikes
+    confusable = sum(ch in CONFUSABLES for ch in label)
+    if not confusable:
+        return False
+    latin = sum("a" <= ch <= "z" for ch in label)
+    return latin > 0 or confusable == sum(ch.isalpha() for ch in label)
+
+
+def host_flags(host):
+    """(punycode, homoglyph) for a lowercased host; punycode labels are decoded first."""
+    punycode = homoglyph = False
+    for label in host.split("."):
+        if label.startswith("xn--"):
+            punycode = True
+            try:
+                label = label[4:].encode("ascii").decode("punycode")
+            except UnicodeError:
+                continue
+        if not label.isascii() and _homoglyph_label(label):
+            homoglyph = True
+    return punycode, homoglyph
+
+
+def url_features_v2(url):
+    """
+    Return the FEATURE_NAMES_V2 values of one URL as a list of numbers,
+    from a single scan of the URL (plus the host's labels).
+    """
+    url = url.strip()
+    length = len(url)
+
+    # Scheme: a bounded look for "://" near the start
+    start = 0
+    scheme = ""
+    separator = url.find("://", 0, MAX_SCHEME_LENGTH + 3)
+    if separator > 0 and url[:separator].isalpha():
+        scheme = url[:separator].lower()
+        start = separator + 3
+    rest = url[start:] if start else url
+
+    delta = KEYWORD_DELTA
+    matches = KEYWORD_MATCHES
+    class_of = CHAR_CLASS.get
+    counts = {}
+    count_of = counts.get
+    state = hits = percents = digits = uppers = 0
+    tokens = longest = token_chars = run = 0
+    part = AUTHORITY
+    host_start = 0
+    host_end = path_start = query_start = fragment_start = -1
+    in_brackets = False
+    params = depth = 0
+    last_slash = -1
+    double_slash = has_userinfo = False
+
+    for i, ch in enumerate(rest):
+        counts[ch] = count_of(ch, 0) + 1
+        state = delta[state].get(ch, 0)
+        hits += matches[state]
+        kind = class_of(ch, OTHER)
+        # Letters and digits only grow the token in progress
+        if kind == LOWER:
+            run += 1
+            continue
+        if kind == DIGIT:
+            digits += 1
+            run += 1
+            continue
+        if kind == UPPER:
+            uppers += 1
+            run += 1
+            continue
+        if kind == OTHER and ch.isalnum():
+            run += 1
+            continue
+
+        if run:
+            tokens += 1
+            token_chars += run
+            if run > longest:
+                longest = run
+            run = 0
+        if kind <= PUNCTUATION:
+            continue
+
+        if kind == SLASH:
+            if part == AUTHORITY:
+                if host_end < 0:
+                    host_end = i
+                part = PATH
+                path_start = i
+            elif part == PATH:
+                # Path segments are the stretches between slashes
+                if i - last_slash > 1:
+                    depth += 1
+                else:
+                    double_slash = True
+            last_slash = i
+        elif kind == QUESTION or kind == HASH:
+            if part == AUTHORITY and host_end < 0:
+                host_end = i
+            elif part == PATH and i - last_slash > 1:
+                depth += 1
+            if kind == QUESTION and part <= PATH:
+                part = QUERY
+                query_start = i
+                params = 1
+            elif kind == HASH and part < FRAGMENT:
+                part = FRAGMENT
+                fragment_start = i
+        elif kind == AMPERSAND:
+            if part == QUERY:
+                params += 1
+        elif kind == PERCENT:
+            percents += 1
+        elif part == AUTHORITY:
+            if kind == AT:
+                # Credentials before the host (http://user@host/): the host starts again
+                has_userinfo = True
+                host_start = i + 1
+                host_end = -1
+            elif kind == COLON and not in_brackets and host_end < 0:
+                host_end = i
+            elif kind == BRACKET_OPEN:
+                in_brackets = True
+            elif kind == BRACKET_CLOSE:
+                in_brackets = False
+
+    scanned = length - start
+    if run:
+        tokens += 1
+        token_chars += run
+        if run > longest:
+            longest = run
+    if part == AUTHORITY and host_end < 0:
+        host_end = scanned
+    if part == PATH and scanned - last_slash > 1:
+        depth += 1
+
+    # Part lengths from the boundaries the scan recorded
+    end = scanned
+    fragment_length = end - fragment_start if fragment_start >= 0 else 0
+    if fragment_start >= 0:
+        end = fragment_start
+    query_length = end - query_start if query_start >= 0 else 0
+    if query_start >= 0:
+        end = query_start
+    path_length = end - path_start if path_start >= 0 else 0
+
+    host = rest[host_start:host_end].lower().rstrip(".")
+    is_ip = host_is_ip(host)
+    has_port = rest[host_end:host_end + 1] == ":"
+    punycode, homoglyph = host_flags(host) if not is_ip else (False, False)
+
+    # Shannon entropy from the count of each distinct character, taken in the scan
+    entropy = 0.0
+    if scanned:
+        if scanned < len(COUNT_LOG_TABLE):
+            entropy = math.log2(scanned) - sum(map(COUNT_LOG_TABLE.__getitem__, counts.values())) / scanned
+        else:
+            entropy = math.log2(scanned) - sum(count * math.log2(count) for count in counts.values()) / scanned
+
+    return [
+        length,
+        len(host),
+        path_length,
+        query_length,
+        fragment_length,
+        depth,
+        host.count("."),
+        host.count("-"),
+        sum(map(host.count, "0123456789")),
+        tld_class(host, is_ip),
+        int(is_ip),
+        int(has_port),
+        int(scheme == "http"),
+        int(scheme == "https"),
+        int(has_userinfo),
+        int(double_slash),
+        digits / scanned if scanned else 0.0,
+        uppers / scanned if scanned else 0.0,
+        (scanned - token_chars) / scanned if scanned else 0.0,
+        percents,
+        params,
+        tokens,
+        longest,
+        token_chars / tokens if tokens else 0.0,
+        hits,
+        entropy,
+        int(punycode),
+        0 if host.isascii() else sum(not ch.isascii() for ch in host),
+        int(homoglyph),
+    ]
+
+
+def extract_features_v2(urls):
+    """
+    Feature schema v2 for many URLs: a float32 matrix of shape
+    (len(urls), len(FEATURE_NAMES_V2)), one url_features_v2() row per URL.
+    """
+    urls = list(urls)
+    out = np.zeros((len(urls), len(FEATURE_NAMES_V2)), dtype=np.float32)
+    for i, url in enumerate(urls):
+        out[i] = url_features_v2(url)
+    return out